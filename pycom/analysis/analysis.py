@@ -4,6 +4,8 @@ from collections import Counter
 import numpy as np
 import pandas as pd
 
+from pycom.util.format_util import unpack_triu
+
 
 class CoMAnalysis(object):
     """
@@ -64,6 +66,21 @@ class CoMAnalysis(object):
 
         return contact_mat
 
+    @staticmethod
+    def as_matrix(matrix) -> np.ndarray:
+        """
+        Converts a coevolution matrix in any MatrixFormat (e.g. LazyMatrix proxies, DataFrames, or packed upper
+        triangles of MatrixFormat.TRIU) into a full numpy matrix, float16 values are converted to float32
+        :param matrix:
+        :return: matrix
+        """
+        matrix = np.asarray(matrix)
+        if matrix.dtype == np.float16:
+            matrix = matrix.astype(np.float32)
+        if matrix.ndim == 1:
+            matrix = unpack_triu(matrix)
+        return matrix
+
     @staticmethod
     def calculate_scaled_coevolution_matrix(matrix) -> np.ndarray:
         """
@@ -71,6 +88,7 @@ class CoMAnalysis(object):
         :param matrix:
         :return: scaled_matrix
         """
+        matrix = CoMAnalysis.as_matrix(matrix)
         if matrix.shape[0] == 0:
             print("This is an empty matrix. Check your query.")
             exit()
@@ -86,6 +104,9 @@ class CoMAnalysis(object):
         """
         scales coevolution matrix by average, set all values <average to 0 --> S
         scale S by max of all S in the data frame and add additional column of normalised matrices
+        The scaled (and normalised) matrices of all rows are kept in the added columns: with a lazy 'matrix' column
+        (PyCom.load_matrices(df, lazy=True)) the input matrices are read one at a time, but the output still holds
+        every scaled matrix in memory. Process large queries in chunks (e.g. PyCom.find_iter()).
         :param df:
         :param normalise_matrix:
         :return: data frame with normalised and scaled coevolution matrix columns
@@ -120,7 +141,7 @@ class CoMAnalysis(object):
         :param percentile:
         :return: data frame with top residue pairs
         """
-
+        matrix = CoMAnalysis.as_matrix(matrix)
         max_i, max_j = matrix.shape
         _coevolution_percentile_score = 1
         if percentile > 0:
@@ -1,14 +1,16 @@
 import sqlite3
-from typing import Optional, Callable
+from typing import Optional, Iterator, List, Tuple
 
-import h5py
+import numpy as np
 import pandas as pd
 
 from warnings import warn
 
-from pycom.selector import ProteinParams, MatrixFormat
+from pycom.interface.connection_pool import SQLiteConnectionPool
+from pycom.interface.matrix_loader import CoevolutionMatrixLoader  # noqa, re-exported
+from pycom.selector import ProteinParams
 from pycom.sql.query_builder import PyComSQLQueryBuilder
-from pycom.util.format_util import md5_hash
+from pycom.sql.query_constraints import constraints_key
 
 _unconstrained_find_warning = True
 
@@ -20,6 +22,17 @@ def warn_unconstrained_find():
         _unconstrained_find_warning = False
 
 
+_unoptimized_db_warning = True
+
+
+def warn_unoptimized_db(db_path):
+    global _unoptimized_db_warning
+    if _unoptimized_db_warning:
+        warn(f'{db_path} is not optimized (missing indexes), queries may be slow. An optimized copy can be written '
+             f'with pycom.tools.build_indexes(db_path, out_path), or `python -m pycom.tools build-indexes`.')
+        _unoptimized_db_warning = False
+
+
 def get_valid_find_params(
         remote: bool,
         constraint_dict: dict = None,
@@ -29,8 +42,8 @@ def get_valid_find_params(
     Validate that the parameters passed to find() are valid and return a dictionary of the parameters
     """
     if not remote:
-        assert {'page', 'per_page', 'matrix', 'mat_format'}.isdisjoint(kwargs.keys()), \
-            'page, per_page, matrix and mat_format are invalid for local queries (only valid for remote queries)'
+        assert {'matrix', 'mat_format'}.isdisjoint(kwargs.keys()), \
+            'matrix and mat_format are invalid for local queries (only valid for remote queries)'
 
     # if no arguments are passed, return all proteins
     assert not (constraint_dict is not None and kwargs != {}), 'Use either a dictionary or keywords, not both'
@@ -48,57 +61,183 @@ def get_valid_find_params(
     return constraint_dict
 
 
-def build_query_from_constraints(**constraint_dict):
+def find_cache_key(constraint_dict: dict, **options) -> str:
     """
-    Build a query from a dictionary of constraints
+    Returns the cache key of the results of find(), see pycom.sql.constraints_key.
+    Equivalent constraints (e.g. {ProteinParams.DISEASE: 'cancer'} and {'disease': 'Cancer '}) share the same key.
+    """
+    return constraints_key(constraint_dict, **options)
+
+
+_bulk_lookup_columns = {
+    ProteinParams.ID: ('uniprot_id', lambda x: str(x).strip()),
+    ProteinParams.SEQUENCE: ('sequence', lambda x: str(x).strip().upper()),
+}
+
+
+def get_bulk_lookup(constraint_dict: dict) -> Optional[Tuple[str, list]]:
+    """
+    Returns the column and the (normalised) values of a bulk lookup, i.e. a list of uniprot_ids or sequences
+    (list, tuple, pandas Series, numpy array, ...) passed to find(), or None if there is no bulk lookup.
+    """
+    for key, value in constraint_dict.items():
+        if key in _bulk_lookup_columns and pd.api.types.is_list_like(value) and not isinstance(value, str):
+            column, convert = _bulk_lookup_columns[key]
+            return column, [convert(x) for x in value]
+    return None
+
+
+def with_column(columns: Optional[List[str]], column: str) -> Optional[List[str]]:
+    """Returns the selected columns, with column added if it is not already selected (None selects all columns)"""
+    if columns is None or column in [PyComSQLQueryBuilder.column_name(c) for c in columns]:
+        return columns
+    return list(columns) + [column]
+
+
+def sort_by_lookup_order(df: pd.DataFrame, column: str, values: list) -> pd.DataFrame:
     """
-    builder = PyComSQLQueryBuilder()
+    Sorts the results of a bulk lookup into the order of the looked up values (first occurrence of each value)
+    """
+    position = {}
+    for i, value in enumerate(values):
+        position.setdefault(value, i)
+
+    order = np.argsort(df[column].map(position).to_numpy(), kind='stable')
+    return df.iloc[order].reset_index(drop=True)
+
+
+def _builder_from_constraints(
+        constraint_dict: dict,
+        columns: Optional[list] = None,
+        text_index: bool = False,
+        matrix_key: bool = False,
+) -> PyComSQLQueryBuilder:
+    builder = PyComSQLQueryBuilder(text_index=text_index, matrix_key=matrix_key)
+    if columns is not None:
+        builder.add_columns(columns)
     for key, value in constraint_dict.items():
         builder.add_constraint(key, value)
-    return builder.build()
+    return builder
 
 
-def query_db(db_path, query, params):
+def build_query_from_constraints(
+        page: Optional[int] = None,
+        per_page: Optional[int] = None,
+        columns: Optional[list] = None,
+        text_index: bool = False,
+        matrix_key: bool = False,
+        **constraint_dict
+):
+    """
+    Build a query from a dictionary of constraints
+
+    If page is set, the query only selects the entries of that page (LIMIT / OFFSET)
+    If columns is set, only these columns are selected (e.g. ['uniprot_id', 'neff']), otherwise all columns
+    If text_index is set, name based constraints use the full-text index of the sidecar database
+    If matrix_key is set, the matrix_key column of the sidecar database can be selected
+    """
+    builder = _builder_from_constraints(constraint_dict, columns=columns, text_index=text_index,
+                                        matrix_key=matrix_key)
+    return builder.build(page=page, per_page=per_page)
+
+
+def build_count_query_from_constraints(text_index: bool = False, **constraint_dict):
+    """
+    Build a query counting the entries matching a dictionary of constraints
+    """
+    return _builder_from_constraints(constraint_dict, text_index=text_index).build_count()
+
+
+def query_db(db_path, query, params, pool: Optional[SQLiteConnectionPool] = None):
     """
     Takes in a query generated by PyComSQLQueryBuilder and returns a pandas DataFrame
 
+    If a connection pool is passed, the query is run on the pooled connection of the calling thread,
+    otherwise a new connection is opened (and closed) for this query.
+
     It is possible to wrap this function in a memoize decorator to cache the results of queries
 
     e.g. when using flask-caching:
         query_db = cache.memoize(timeout=360, cache_none=True)(query_db)
     """
+    if pool is not None:
+        return _fetch_dataframe(pool.get_connection(), query, params)
+
     with sqlite3.connect(f'file:{db_path}?mode=ro', uri=True) as conn:
-        c = conn.cursor()
-        c.execute(query, params)
+        return _fetch_dataframe(conn, query, params)
 
-        result: list = c.fetchall()
-        result: pd.DataFrame = pd.DataFrame(result, columns=PyComSQLQueryBuilder.columns)
 
-    return result
+def count_db(db_path, query, params, pool: Optional[SQLiteConnectionPool] = None) -> int:
+    """
+    Takes in a count query generated by PyComSQLQueryBuilder.build_count() and returns the number of matching entries
+
+    Like query_db, this function can be wrapped in a memoize decorator to cache the results of queries
+    """
+    if pool is not None:
+        return pool.get_connection().execute(query, params).fetchone()[0]
+
+    with sqlite3.connect(f'file:{db_path}?mode=ro', uri=True) as conn:
+        return conn.execute(query, params).fetchone()[0]
 
 
-class CoevolutionMatrixLoader:
+def explain_db(db_path, query, params, pool: Optional[SQLiteConnectionPool] = None) -> pd.DataFrame:
     """
-    A class that loads coevolution matrices from an HDF5 file
+    Returns the SQLite query plan (EXPLAIN QUERY PLAN) of a query generated by PyComSQLQueryBuilder
     """
-    def __init__(
-            self,
-            matrix_path,
-            mat_format: MatrixFormat = MatrixFormat.NUMPY
-    ):
-        self.matrix_path = matrix_path
-        self.mat_db: h5py.File = h5py.File(matrix_path, 'r')
-        # noinspection PyTypeChecker
-        self.mat_formatter: Callable = mat_format
+    query = f'EXPLAIN QUERY PLAN {query}'
+    if pool is not None:
+        rows = pool.get_connection().execute(query, params).fetchall()
+    else:
+        with sqlite3.connect(f'file:{db_path}?mode=ro', uri=True) as conn:
+            rows = conn.execute(query, params).fetchall()
+
+    return pd.DataFrame([(row[0], row[1], row[-1]) for row in rows], columns=['id', 'parent', 'detail'])
+
+
+def query_db_iter(
+        db_path,
+        query,
+        params,
+        chunk_size: int,
+        pool: Optional[SQLiteConnectionPool] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Takes in a query generated by PyComSQLQueryBuilder and yields the results as pandas DataFrames of (at most)
+    chunk_size rows, fetching rows from SQLite as the chunks are consumed.
+
+    If a connection pool is passed, the pooled connection of the calling thread is used, otherwise a dedicated
+    connection is opened, and closed once the iterator is exhausted (or garbage collected).
+    """
+    assert chunk_size >= 1, f'chunk_size must be at least 1, not {chunk_size}'
+
+    conn = pool.get_connection() if pool is not None else sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    c = conn.cursor()
+    try:
+        c.execute(query, params)
+        while True:
+            rows: list = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pd.DataFrame(rows, columns=_column_names(c))
+    finally:
+        c.close()
+        if pool is None:
+            conn.close()
+
 
-    def load_coevolution_matrix(self, sequence: str) -> Optional[pd.DataFrame]:
-        """
-        Load a coevolution matrix from an HDF5 file
-        """
-        md5 = md5_hash(sequence)
+def _column_names(c: sqlite3.Cursor) -> list:
+    """Returns the names of the columns selected by the query (aliased to the DataFrame column names)"""
+    return [column[0] for column in c.description]
 
-        try:
-            # noinspection PyCallingNonCallable
-            return self.mat_formatter(self.mat_db[md5][:])
-        except KeyError:
-            return None
+
+def _fetch_dataframe(conn: sqlite3.Connection, query, params) -> pd.DataFrame:
+    c = conn.cursor()
+    try:
+        c.execute(query, params)
+
+        result: list = c.fetchall()
+        result: pd.DataFrame = pd.DataFrame(result, columns=_column_names(c))
+    finally:
+        c.close()
+
+    return result
@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+
+class SQLiteConnectionPool:
+    """
+    A pool of read-only SQLite connections to the PyCom database (pycom.db).
+
+    Every thread gets its own connection, which is opened on first use and then reused for all following queries.
+    This avoids the connect / parse-schema / close cycle on every call to `find()` or `get_*_list()`.
+    The connection of a thread is closed when the thread exits (e.g. the request threads of a web server).
+
+    The pool is fork-safe: connections inherited from a parent process are discarded, and the child opens its own.
+
+    Additional databases (e.g. the sidecar of pycom.db) can be attached read-only to every connection,
+    with attach={alias: path}.
+
+    Usage:
+        >>> pool = SQLiteConnectionPool('/path/on/disk/pycom.db')
+        >>> with pool.connection() as conn:
+        ...     conn.execute('SELECT COUNT(*) FROM entry').fetchone()
+        >>> pool.close()
+
+    Parameters:
+        :param db_path: Path to the PyCom database (pycom.db)
+        :param mmap_size: Number of bytes of the database file to memory-map (default: 1 GiB)
+        :param cache_size: Size of the page cache of each connection, in KiB (default: 64 MiB)
+        :param attach: Databases to attach to each connection {alias: path}, attached databases are read-only
+    """
+
+    def __init__(
+            self,
+            db_path: str,
+            mmap_size: int = 1 << 30,
+            cache_size: int = 64 * 1024,
+            attach: Optional[Dict[str, str]] = None,
+    ):
+        self.db_path = db_path
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.attach = dict(attach) if attach is not None else {}
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._finalizers: List[weakref.finalize] = []  # close the connections, alive while their thread runs
+        self._pid = os.getpid()
+        self._closed = False
+        self._generation = 0  # incremented by reset(), connections of an older generation are replaced
+
+    def __repr__(self):
+        # stable representation, used by memoize decorators (e.g. flask-caching) to build cache keys
+        return f'{self.__class__.__name__}({self.db_path!r})'
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens a new read-only connection and applies the tuned pragmas."""
+        # check_same_thread=False allows close() to be called from any thread,
+        # each connection is still only used by the thread that opened it
+        conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, check_same_thread=False)
+        for alias, path in self.attach.items():
+            conn.execute(f'ATTACH DATABASE ? AS {alias}', (f'file:{path}?mode=ro',))
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size = {-int(self.cache_size)}')  # negative value: size in KiB
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def _reset_after_fork(self):
+        """Drops connections inherited from the parent process, without closing them (they belong to the parent)."""
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._finalizers = []
+        self._pid = os.getpid()
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Returns the connection of the calling thread, opening it if necessary."""
+        assert not self._closed, 'Connection pool has been closed'
+
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.generation != self._generation:
+            # the pool has been reset, the thread replaces its own connection (other threads on their next query)
+            self._local.finalizer()
+            conn = None
+
+        if conn is None:
+            generation = self._generation
+            conn = self._connect()
+            # the thread-local data is released when the thread exits, which closes the connection
+            owner = _ConnectionOwner()
+            finalizer = weakref.finalize(owner, _close_connection, conn, self._pid)
+            self._local.conn = conn
+            self._local.owner = owner
+            self._local.finalizer = finalizer
+            self._local.generation = generation
+            with self._lock:
+                self._finalizers = [f for f in self._finalizers if f.alive]
+                self._finalizers.append(finalizer)
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Context manager that yields the connection of the calling thread. The connection is not closed on exit."""
+        yield self.get_connection()
+
+    def reset(self):
+        """
+        Invalidates all connections in the pool (e.g. after the database file has been replaced), each thread closes
+        its connection and opens a new one on its next query. Queries running on other threads are not interrupted.
+        """
+        with self._lock:
+            self._generation += 1
+
+    def close(self):
+        """Closes all connections in the pool. The pool cannot be used afterwards."""
+        with self._lock:
+            self._close_connections()
+            self._closed = True
+
+    def _close_connections(self):
+        if self._pid == os.getpid():
+            for finalizer in self._finalizers:
+                finalizer()
+        else:
+            for finalizer in self._finalizers:
+                finalizer.detach()
+        self._finalizers = []
+        self._local = threading.local()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def open_connections(self) -> int:
+        """The number of open connections, one per thread that used the pool and is still running"""
+        with self._lock:
+            return sum(finalizer.alive for finalizer in self._finalizers)
+
+
+class _ConnectionOwner:
+    """Kept in the thread-local data of the pool, it is released (and its connection closed) when the thread exits"""
+    pass
+
+
+def _close_connection(conn: sqlite3.Connection, pid: int):
+    """Closes a connection, unless it was inherited from a parent process (it belongs to the parent)"""
+    if os.getpid() == pid:
+        conn.close()
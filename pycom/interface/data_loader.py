@@ -1,6 +1,13 @@
+import json
+import re
 import sqlite3
+from typing import List, Optional
+
+import numpy as np
 import pandas as pd
 
+from pycom.interface.connection_pool import SQLiteConnectionPool
+
 
 class PyComDataLoader:
     """
@@ -10,180 +17,332 @@ class PyComDataLoader:
     If `False`, the data will be added as a list (all matches in PyCom DB).
     If `True`, only the first match will be added (first match in PyCom DB).
 
+    The lists are aggregated by SQLite (as JSON arrays). Instead of lists, these methods can also return the
+    data in long format, with the `output` parameter:
+    'list' (default): one row per entry, with a list of all matches
+    'long': one row per match (entries without matches keep one row, with NaN)
+    'categorical': same as 'long', with categorical columns (codes of the distinct values, instead of repeated strings)
+
     PyComDataLoader can be created using `PyCom.get_data_loader()` or PyComDataLoader(db_path).
+    When created through `PyCom.get_data_loader()`, the loader shares the connection pool of the PyCom instance.
+
+    The queries only read the annotations of the entries in the DataFrame (its `uniprot_id` column), so adding data
+    to a page of entries does not scan the whole annotation tables.
 
     Attributes
     ----------
     db_path : str
         a string path to the SQLite database
+    pool : SQLiteConnectionPool, optional
+        a pool of read-only connections to the database, if None a new connection is opened for each query
 
     Methods
     -------
-    add_diseases(df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    add_diseases(df: pd.DataFrame, force_single_entry: bool = False, output: str = 'list') -> pd.DataFrame:
         Adds diseases data to the DataFrame.
-    add_cath_class(df: pd.DataFrame, force_single_entry: bool = True) -> pd.DataFrame:
+    add_cath_class(df: pd.DataFrame, force_single_entry: bool = True, output: str = 'list') -> pd.DataFrame:
         Adds CATH classification data to the DataFrame.
-    add_enzyme_commission(df: pd.DataFrame, force_single_entry: bool = True) -> pd.DataFrame:
+    add_enzyme_commission(df: pd.DataFrame, force_single_entry: bool = True, output: str = 'list') -> pd.DataFrame:
         Adds enzyme commission data to the DataFrame.
-    add_pdbs(df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    add_pdbs(df: pd.DataFrame, force_single_entry: bool = False, output: str = 'list') -> pd.DataFrame:
         Adds PDBs data to the DataFrame.
     add_organism_name(df: pd.DataFrame) -> pd.DataFrame:
         Adds organism name data to the DataFrame.
     add_organism_taxonomy(df: pd.DataFrame) -> pd.DataFrame:
         Adds organism taxonomy data to the DataFrame.
-    add_substrates(df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    add_substrates(df: pd.DataFrame, force_single_entry: bool = False, output: str = 'list') -> pd.DataFrame:
         Adds substrate data to the DataFrame.
-    add_cofactors(df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    add_cofactors(df: pd.DataFrame, force_single_entry: bool = False, output: str = 'list') -> pd.DataFrame:
         Adds cofactor data to the DataFrame.
-    add_biological_processes(df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    add_biological_processes(df: pd.DataFrame, force_single_entry: bool = False, output: str = 'list') -> pd.DataFrame:
         Adds biological processes data to the DataFrame.
-    add_protein_cellular_component(df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    add_protein_cellular_component(df: pd.DataFrame, force_single_entry: bool = False,
+                                   output: str = 'list') -> pd.DataFrame:
         Adds protein cellular component data to the DataFrame.
-    add_protein_domain(df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    add_protein_domain(df: pd.DataFrame, force_single_entry: bool = False, output: str = 'list') -> pd.DataFrame:
         Adds protein domain data to the DataFrame.
-    add_coding_sequence_diversity(df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    add_coding_sequence_diversity(df: pd.DataFrame, force_single_entry: bool = False,
+                                  output: str = 'list') -> pd.DataFrame:
         Adds coding sequence diversity data to the DataFrame.
-    add_developmental_stage(df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    add_developmental_stage(df: pd.DataFrame, force_single_entry: bool = False, output: str = 'list') -> pd.DataFrame:
         Adds developmental stage data to the DataFrame.
-    add_ligand(df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    add_ligand(df: pd.DataFrame, force_single_entry: bool = False, output: str = 'list') -> pd.DataFrame:
         Adds ligand data to the DataFrame.
-    add_molecular_function(df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    add_molecular_function(df: pd.DataFrame, force_single_entry: bool = False, output: str = 'list') -> pd.DataFrame:
         Adds molecular function data to the DataFrame.
-    add_ptm(df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    add_ptm(df: pd.DataFrame, force_single_entry: bool = False, output: str = 'list') -> pd.DataFrame:
         Adds post-translational modification data to the DataFrame.
+    enrich(df: pd.DataFrame, fields: list, force_single_entry: bool = False) -> pd.DataFrame:
+        Adds the data of several fields to the DataFrame, with a single query.
     """
 
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, pool: Optional[SQLiteConnectionPool] = None):
         """
         Parameters
         ----------
         db_path : str
             a string path to the SQLite database
+        pool : SQLiteConnectionPool, optional
+            a pool of read-only connections to the database
         """
         self.db_path = db_path
+        self.pool = pool
+
+    def _execute_query(self, query: str, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Helper method to execute a query (from _build_query) for the entries of the DataFrame, and return a DataFrame.
+        The uniprot_ids are bound as a single JSON array, expanded by SQLite with json_each().
+        """
+        params = (json.dumps(df['uniprot_id'].dropna().unique().tolist()),)
+        if self.pool is not None:
+            return pd.read_sql_query(query, self.pool.get_connection(), params=params)
 
-    def _execute_query(self, query: str) -> pd.DataFrame:
-        """Helper method to execute a query and return a DataFrame."""
         with sqlite3.connect(self.db_path) as conn:
-            return pd.read_sql_query(query, conn)
+            return pd.read_sql_query(query, conn, params=params)
 
-    def _add_data(self, df: pd.DataFrame, query: str, force_single_entry: bool) -> pd.DataFrame:
+    def _add_data(self, df: pd.DataFrame, query: '_Query', force_single_entry: bool,
+                  output: str = 'list') -> pd.DataFrame:
         """Helper method to add data to the DataFrame."""
-        data_df = self._execute_query(query)
-        if not force_single_entry:
-            data_df = data_df.groupby('entryId').agg(lambda x: x.tolist()).reset_index()
+        assert output in _OUTPUTS, f'output must be one of {_OUTPUTS}, not {output}'
+        if force_single_entry or output != 'list':
+            data_df = self._execute_query(query, df)
+            if output == 'categorical':
+                data_df = data_df.astype({column: 'category' for column in data_df.columns if column != 'entryId'})
+        else:
+            # one row per entry, with the matches aggregated into JSON arrays by SQLite
+            columns = [column for column in query.columns if column != 'entryId']
+            aggregates = ', '.join(f'json_group_array("{column}") AS "{column}"' for column in columns)
+            data_df = self._execute_query(f'SELECT entryId, {aggregates} FROM ({query}) GROUP BY entryId', df)
+            for column in columns:
+                data_df[column] = [json.loads(x) for x in data_df[column]]
         merged_df = df.merge(data_df, left_on='uniprot_id', right_on='entryId', how='left')
         return merged_df.drop(columns=['entryId'])
 
-    def add_diseases(self, df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    def add_diseases(self, df: pd.DataFrame, force_single_entry: bool = False,
+                     output: str = 'list') -> pd.DataFrame:
         """Adds diseases data to the DataFrame."""
-        query = """
-            SELECT disease_entry.entryId, disease.diseaseName as disease_name, disease.diseaseId as disease_id
-            FROM disease
-            JOIN disease_entry ON disease.diseaseId = disease_entry.diseaseId
-        """
-        return self._add_data(df, query, force_single_entry)
+        query = _build_query(["disease_entry", "disease"],
+                             ["disease_entry.entryId", "disease.diseaseName as disease_name",
+                              "disease.diseaseId as disease_id"],
+                             ["disease.diseaseId = disease_entry.diseaseId"], entry_column="disease_entry.entryId")
+        return self._add_data(df, query, force_single_entry, output)
 
-    def add_cath_class(self, df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    def add_cath_class(self, df: pd.DataFrame, force_single_entry: bool = False,
+                       output: str = 'list') -> pd.DataFrame:
         """Adds CATH classification data to the DataFrame."""
-        query = """
-            SELECT
-                entryId,
-                cath_1 || '.' || cath_2 || '.' || cath_3 || '.' || cath_4 AS cath_class
-            FROM cath_class
-        """  # cath_1 as cath_super_class
-        return self._add_data(df, query, force_single_entry)
-
-    def add_enzyme_commission(self, df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+        query = _build_query(["cath_class"],
+                             ["entryId", "cath_1 || '.' || cath_2 || '.' || cath_3 || '.' || cath_4 AS cath_class"]
+                             )  # cath_1 as cath_super_class
+        return self._add_data(df, query, force_single_entry, output)
+
+    def add_enzyme_commission(self, df: pd.DataFrame, force_single_entry: bool = False,
+                              output: str = 'list') -> pd.DataFrame:
         """Adds enzyme commission data to the DataFrame."""
-        query = """
-            SELECT
-                entryId,
-                enzyme_1 || '.' || enzyme_2 || '.' || enzyme_3 || '.' || enzyme_4 AS enzyme_commission
-            FROM enzyme_class
-        """  # enzyme_1 as enzyme_super_class
-        return self._add_data(df, query, force_single_entry)
-
-    def add_pdbs(self, df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+        query = _build_query(["enzyme_class"],
+                             ["entryId",
+                              "enzyme_1 || '.' || enzyme_2 || '.' || enzyme_3 || '.' || enzyme_4 AS enzyme_commission"]
+                             )  # enzyme_1 as enzyme_super_class
+        return self._add_data(df, query, force_single_entry, output)
+
+    def add_pdbs(self, df: pd.DataFrame, force_single_entry: bool = False,
+                 output: str = 'list') -> pd.DataFrame:
         """Adds PDBs data to the DataFrame."""
         query = _build_query(["experimentPDB"], ["entryId", "pdbId as pdb_id"])
-        return self._add_data(df, query, force_single_entry)
+        return self._add_data(df, query, force_single_entry, output)
 
     def add_organism_name(self, df: pd.DataFrame) -> pd.DataFrame:
         """Adds organism name data to the DataFrame."""
         query = _build_query(["entry", "organism"], ["entry.entryId", "organism.nameScientific as organism_name"],
-                             ["entry.organismId = organism.organismId"])
+                             ["entry.organismId = organism.organismId"], entry_column="entry.entryId")
         return self._add_data(df, query, force_single_entry=True)
 
     def add_organism_taxonomy(self, df: pd.DataFrame) -> pd.DataFrame:
         """Adds organism taxonomy data to the DataFrame."""
         query = _build_query(["entry", "organism"], ["entry.entryId", "organism.taxonomy as taxonomy"],
-                             ["entry.organismId = organism.organismId"])
-        taxonomy_df = self._execute_query(query)
+                             ["entry.organismId = organism.organismId"], entry_column="entry.entryId")
+        taxonomy_df = self._execute_query(query, df)
         taxonomy_df['taxonomy'] = taxonomy_df['taxonomy'].apply(_extract_taxonomy)
         return df.merge(taxonomy_df, left_on='uniprot_id', right_on='entryId', how='left').drop(columns=['entryId'])
 
-    def add_substrates(self, df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    def add_substrates(self, df: pd.DataFrame, force_single_entry: bool = False,
+                       output: str = 'list') -> pd.DataFrame:
         """Adds substrate data to the DataFrame."""
         query = _build_query(["substrate"], ["entryId", "substrateName as substrate"])
-        return self._add_data(df, query, force_single_entry)
+        return self._add_data(df, query, force_single_entry, output)
 
-    def add_cofactors(self, df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    def add_cofactors(self, df: pd.DataFrame, force_single_entry: bool = False,
+                      output: str = 'list') -> pd.DataFrame:
         """Adds cofactor data to the DataFrame."""
-        query = """
-            SELECT cofactor_entry.entryId, cofactor.cofactorName as cofactor
-            FROM cofactor
-            JOIN cofactor_entry ON cofactor.cofactorId = cofactor_entry.cofactorId
-        """
-        return self._add_data(df, query, force_single_entry)
+        query = _build_query(["cofactor_entry", "cofactor"],
+                             ["cofactor_entry.entryId", "cofactor.cofactorName as cofactor"],
+                             ["cofactor.cofactorId = cofactor_entry.cofactorId"], entry_column="cofactor_entry.entryId")
+        return self._add_data(df, query, force_single_entry, output)
 
-    def add_biological_processes(self, df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    def add_biological_processes(self, df: pd.DataFrame, force_single_entry: bool = False,
+                                 output: str = 'list') -> pd.DataFrame:
         """Adds biological processes data to the DataFrame."""
         query = _build_query(["keyword_entry"], ["entryId", "keywordName as biological_process"],
                              filter_condition="keywordCategory = 'Biological process'")
-        return self._add_data(df, query, force_single_entry)
+        return self._add_data(df, query, force_single_entry, output)
 
-    def add_protein_cellular_component(self, df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    def add_protein_cellular_component(self, df: pd.DataFrame, force_single_entry: bool = False,
+                                       output: str = 'list') -> pd.DataFrame:
         """Adds protein cellular component data to the DataFrame."""
         query = _build_query(["keyword_entry"], ["entryId", "keywordName as cellular_component"],
                              filter_condition="keywordCategory = 'Cellular component'")
-        return self._add_data(df, query, force_single_entry)
+        return self._add_data(df, query, force_single_entry, output)
 
-    def add_protein_domain(self, df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    def add_protein_domain(self, df: pd.DataFrame, force_single_entry: bool = False,
+                           output: str = 'list') -> pd.DataFrame:
         """Adds protein domain data to the DataFrame."""
         query = _build_query(["keyword_entry"], ["entryId", "keywordName as domain"],
                              filter_condition="keywordCategory = 'Domain'")
-        return self._add_data(df, query, force_single_entry)
+        return self._add_data(df, query, force_single_entry, output)
 
-    def add_coding_sequence_diversity(self, df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    def add_coding_sequence_diversity(self, df: pd.DataFrame, force_single_entry: bool = False,
+                                      output: str = 'list') -> pd.DataFrame:
         """Adds coding sequence diversity data to the DataFrame."""
         query = _build_query(["keyword_entry"], ["entryId", "keywordName as coding_sequence_diversity"],
                              filter_condition="keywordCategory = 'Coding sequence diversity'")
-        return self._add_data(df, query, force_single_entry)
+        return self._add_data(df, query, force_single_entry, output)
 
-    def add_developmental_stage(self, df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    def add_developmental_stage(self, df: pd.DataFrame, force_single_entry: bool = False,
+                                output: str = 'list') -> pd.DataFrame:
         """Adds developmental stage data to the DataFrame."""
         query = _build_query(["keyword_entry"], ["entryId", "keywordName as developmental_stage"],
                              filter_condition="keywordCategory = 'Developmental stage'")
-        return self._add_data(df, query, force_single_entry)
+        return self._add_data(df, query, force_single_entry, output)
 
-    def add_ligand(self, df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    def add_ligand(self, df: pd.DataFrame, force_single_entry: bool = False,
+                   output: str = 'list') -> pd.DataFrame:
         """Adds ligand data to the DataFrame."""
         query = _build_query(["keyword_entry"], ["entryId", "keywordName as ligand"],
                              filter_condition="keywordCategory = 'Ligand'")
-        return self._add_data(df, query, force_single_entry)
+        return self._add_data(df, query, force_single_entry, output)
 
-    def add_molecular_function(self, df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    def add_molecular_function(self, df: pd.DataFrame, force_single_entry: bool = False,
+                               output: str = 'list') -> pd.DataFrame:
         """Adds molecular function data to the DataFrame."""
         query = _build_query(["keyword_entry"], ["entryId", "keywordName as molecular_function"],
                              filter_condition="keywordCategory = 'Molecular function'")
-        return self._add_data(df, query, force_single_entry)
+        return self._add_data(df, query, force_single_entry, output)
 
-    def add_ptm(self, df: pd.DataFrame, force_single_entry: bool = False) -> pd.DataFrame:
+    def add_ptm(self, df: pd.DataFrame, force_single_entry: bool = False,
+                output: str = 'list') -> pd.DataFrame:
         """Adds post-translational modification data to the DataFrame."""
         query = _build_query(["keyword_entry"], ["entryId", "keywordName as ptm"],
                              filter_condition="keywordCategory = 'Post-translational modification'")
-        return self._add_data(df, query, force_single_entry)
+        return self._add_data(df, query, force_single_entry, output)
+
+    def enrich(self, df: pd.DataFrame, fields: List[str], force_single_entry: bool = False) -> pd.DataFrame:
+        """
+        Adds the data of several fields to the DataFrame, with a single query and a single merge.
+
+        The fields are named after the add_* methods (e.g. 'diseases' for add_diseases), and add the same columns.
+        The data is aggregated by SQLite (one JSON array per entry and field), all keyword categories are read in
+        one pass over keyword_entry.
+
+        Usage:
+            >>> loader.enrich(df, ['diseases', 'cofactors', 'pdbs', 'cath_class', 'ligand', 'molecular_function'])
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            a DataFrame from PyCom.find(), with the uniprot_id column
+        fields : list
+            the fields to add, see ENRICH_FIELDS
+        force_single_entry : bool
+            whether to add only the first match of each field (organism_name and organism_taxonomy are always single)
+        """
+        unknown = [field for field in fields if field not in ENRICH_FIELDS]
+        assert not unknown, f'Unknown fields: {unknown}, must be some of {ENRICH_FIELDS}'
+        fields = list(dict.fromkeys(fields))
+        keyword_fields = [field for field in fields if field in _KEYWORD_FIELDS]
+
+        subqueries = []
+        for field in fields:
+            if field in _KEYWORD_FIELDS:
+                continue
+            table, columns, join_condition, entry_column = _ENRICH_QUERIES[field]
+            single = force_single_entry or field in _SINGLE_FIELDS
+            values = f"json_array({', '.join(columns.values())})"
+            query = f"SELECT {values if single else f'json_group_array({values})'} FROM {table}"
+            if join_condition:
+                query += f" JOIN {join_condition}"
+            query += f" WHERE {entry_column} = ids.value{' LIMIT 1' if single else ''}"
+            subqueries.append(f"({query}) AS {field}")
+        if keyword_fields:
+            categories = ', '.join(f"'{_KEYWORD_FIELDS[field][0]}'" for field in keyword_fields)
+            subqueries.append("(SELECT json_group_array(json_array(keywordCategory, keywordName)) FROM keyword_entry "
+                              f"WHERE entryId = ids.value AND keywordCategory IN ({categories})) AS keywords")
+
+        query = f"SELECT ids.value AS entryId{''.join(', ' + subquery for subquery in subqueries)} " \
+                "FROM json_each(?) AS ids"
+        data_df = self._execute_query(query, df)
+
+        columns = {}
+        for field in fields:
+            if field in _KEYWORD_FIELDS:
+                continue
+            names = list(_ENRICH_QUERIES[field][1])
+            rows = [json.loads(x) if isinstance(x, str) else None for x in data_df[field]]
+            for i, name in enumerate(names):
+                if force_single_entry or field in _SINGLE_FIELDS:
+                    columns[name] = [row[i] if row is not None else np.nan for row in rows]
+                else:
+                    columns[name] = [[x[i] for x in row] if row else np.nan for row in rows]
+            if field == 'organism_taxonomy':
+                columns['taxonomy'] = [_extract_taxonomy(x) if isinstance(x, str) else x for x in columns['taxonomy']]
+        if keyword_fields:
+            keywords = [json.loads(x) for x in data_df['keywords']]
+            for field in keyword_fields:
+                category, name = _KEYWORD_FIELDS[field]
+                values = [[keyword for keyword_category, keyword in row if keyword_category == category]
+                          for row in keywords]
+                if force_single_entry:
+                    columns[name] = [x[0] if x else np.nan for x in values]
+                else:
+                    columns[name] = [x if x else np.nan for x in values]
+
+        data_df = pd.DataFrame(columns, index=data_df.index).assign(entryId=data_df['entryId'])
+        merged_df = df.merge(data_df, left_on='uniprot_id', right_on='entryId', how='left')
+        return merged_df.drop(columns=['entryId'])
+
+
+_OUTPUTS = ('list', 'long', 'categorical')
+
+# the queries of enrich(): field -> (table, {column: expression}, join, entry column)
+_ENRICH_QUERIES = {
+    'diseases': ('disease_entry', {'disease_name': 'disease.diseaseName', 'disease_id': 'disease.diseaseId'},
+                 'disease ON disease.diseaseId = disease_entry.diseaseId', 'disease_entry.entryId'),
+    'cath_class': ('cath_class', {'cath_class': "cath_1 || '.' || cath_2 || '.' || cath_3 || '.' || cath_4"},
+                   None, 'entryId'),
+    'enzyme_commission': ('enzyme_class', {
+        'enzyme_commission': "enzyme_1 || '.' || enzyme_2 || '.' || enzyme_3 || '.' || enzyme_4"}, None, 'entryId'),
+    'pdbs': ('experimentPDB', {'pdb_id': 'pdbId'}, None, 'entryId'),
+    'organism_name': ('entry', {'organism_name': 'organism.nameScientific'},
+                      'organism ON entry.organismId = organism.organismId', 'entry.entryId'),
+    'organism_taxonomy': ('entry', {'taxonomy': 'organism.taxonomy'},
+                          'organism ON entry.organismId = organism.organismId', 'entry.entryId'),
+    'substrates': ('substrate', {'substrate': 'substrateName'}, None, 'entryId'),
+    'cofactors': ('cofactor_entry', {'cofactor': 'cofactor.cofactorName'},
+                  'cofactor ON cofactor.cofactorId = cofactor_entry.cofactorId', 'cofactor_entry.entryId'),
+}
+_SINGLE_FIELDS = {'organism_name', 'organism_taxonomy'}
+
+# field -> (keyword category, column)
+_KEYWORD_FIELDS = {
+    'biological_processes': ('Biological process', 'biological_process'),
+    'protein_cellular_component': ('Cellular component', 'cellular_component'),
+    'protein_domain': ('Domain', 'domain'),
+    'coding_sequence_diversity': ('Coding sequence diversity', 'coding_sequence_diversity'),
+    'developmental_stage': ('Developmental stage', 'developmental_stage'),
+    'ligand': ('Ligand', 'ligand'),
+    'molecular_function': ('Molecular function', 'molecular_function'),
+    'ptm': ('Post-translational modification', 'ptm'),
+}
+
+ENRICH_FIELDS = list(_ENRICH_QUERIES) + list(_KEYWORD_FIELDS)
 
 
 def _extract_taxonomy(string):
@@ -192,12 +351,30 @@ def _extract_taxonomy(string):
     return taxonomy_list
 
 
-def _build_query(tables: list, columns: list, join_conditions: list = None, filter_condition: str = "") -> str:
-    """Builds a SQL query for given tables, columns, join conditions and filter condition."""
+class _Query(str):
+    """A SQL query from _build_query, with the names of its result columns"""
+    columns: List[str]
+
+
+def _column_name(column: str) -> str:
+    """The name of a result column: its alias, or the column without its table"""
+    return re.split(r'\s+as\s+', column, flags=re.IGNORECASE)[-1].split('.')[-1].strip()
+
+
+def _build_query(tables: list, columns: list, join_conditions: list = None, filter_condition: str = "",
+                 entry_column: str = "entryId") -> _Query:
+    """
+    Builds a SQL query for given tables, columns, join conditions and filter condition.
+    The query is restricted to the entries of a JSON array parameter, matched on entry_column (of the first table).
+    """
     query = f"SELECT {', '.join(columns)} FROM {tables[0]}"
     if join_conditions:
         for table, join_condition in zip(tables[1:], join_conditions):
             query += f" JOIN {table} ON {join_condition}"
+    query += f" WHERE {entry_column} IN (SELECT value FROM json_each(?))"
     if filter_condition:
-        query += f" WHERE {filter_condition}"
+        query += f" AND {filter_condition}"
+
+    query = _Query(query)
+    query.columns = [_column_name(column) for column in columns]
     return query
@@ -1,10 +1,10 @@
 from abc import abstractmethod
-from typing import Optional
+from typing import Iterator, List, Optional, Union
 
 import pandas as pd
 
 from pycom.interface.data_loader import PyComDataLoader
-from pycom.selector import MatrixFormat
+from pycom.selector import MatrixFormat, ProteinParams
 
 # supress SettingWithCopyWarning from pandas
 pd.options.mode.chained_assignment = None  # default='warn'
@@ -17,6 +17,7 @@ class PyCom(object):
             db_path: Optional[str] = None,
             mat_path: Optional[str] = None,
             remote: bool = False,
+            **kwargs
     ) -> 'PyCom':
         """
         PyCom is a class that functions as the main interface for querying the PyCom database.
@@ -31,9 +32,10 @@ class PyCom(object):
             Remote:
                 - The results of `find` are paginated, and find takes the `page` and `per_page` parameters.
                 - Matrices are loaded by setting the `matrix` parameter to True
-                - `paginate` and `load_matrices` are not implemented
+                - `paginate`, `find_iter` and `load_matrices` are not implemented
             Local:
-                - `find` returns all results in a single DataFrame.
+                - `find` returns all results in a single DataFrame, or a single page if `page` is set.
+                - `find_iter` streams the results in chunks of DataFrames, for queries too large to hold in memory
                 - Results can be paginated using `paginate(df, page, per_page)`
                 - Matrices are loaded using `load_matrices(df)`
                 - Local PyCom requires the `db_path` and `mat_path` parameters to be set to the location of the \
@@ -62,12 +64,14 @@ class PyCom(object):
             db_path: Path to the PyCom database (pycom.db)
             mat_path: Path to the coevolution matrix file (pycom.mat)
             remote: Whether to use the remote API. Defaults to False.
+            kwargs: Additional parameters of the local API, see PyComLocal (e.g. sidecar_path)
         """
         if cls is PyCom:
             if remote:
                 assert db_path is None, 'Cannot specify db_path when using remote API, remove param or set remote=False'
                 assert mat_path is None, 'Cannot specify mat_path when using remote API, remove param or set ' \
                                          'remote=False'
+                assert not kwargs, f'Cannot specify {", ".join(kwargs)} when using remote API'
 
                 from pycom.interface.interface_remote import PyComRemote
                 return PyComRemote()
@@ -77,18 +81,34 @@ class PyCom(object):
                                             'https://pycom.brunel.ac.uk/downloads/'
 
                 from pycom.interface.interface_local import PyComLocal
-                return PyComLocal(db_path=db_path, mat_path=mat_path)
+                return PyComLocal(db_path=db_path, mat_path=mat_path, **kwargs)
         else:
             return super(PyCom, cls).__new__(cls)
 
+    def close(self):
+        """
+        Releases resources held by the instance (e.g. pooled database connections for PyComLocal).
+
+        PyCom can also be used as a context manager, which calls close() on exit:
+            >>> with PyCom(db_path='~/docs/pycom.db') as pycom:
+            ...     df = pycom.find(disease='cancer')
+        """
+        pass
+
+    def __enter__(self) -> 'PyCom':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     @abstractmethod
     def find(
             self,
             constraint_dict: Optional[dict] = None,
             /,  # force positional arguments
             *,  # force keyword arguments
-            uniprot_id: Optional[str] = None,
-            sequence: Optional[str] = None,
+            uniprot_id: Optional[Union[str, List[str]]] = None,
+            sequence: Optional[Union[str, List[str]]] = None,
             min_length: Optional[int] = None,
             max_length: Optional[int] = None,
             min_helix: Optional[float] = None,
@@ -119,6 +139,7 @@ class PyCom(object):
 
             page: Optional[int] = None,
             per_page: Optional[int] = None,
+            columns: Optional[List[str]] = None,
             matrix: Optional[bool] = None,
             mat_format: Optional[MatrixFormat] = None,
     ) -> pd.DataFrame:
@@ -130,6 +151,9 @@ class PyCom(object):
 
         Use either constraint_dict or the individual parameters, not both.
 
+        Many proteins can be looked up at once, by passing a list to uniprot_id or sequence. The whole list is
+        looked up in a single query, and (unless paginated) the results are returned in the order of the list.
+
         Usage:
             >>> from pycom import PyCom, ProteinParams
             >>> pyc = PyCom(db_path='/path/on/disk/pycom.db')
@@ -139,8 +163,8 @@ class PyCom(object):
             >>> pyc = pyc.find({ProteinParams.DISEASE: 'cancer'})
 
         :param constraint_dict: A dictionary of constraints to apply to the search {ProteinParams: value}.
-        :param uniprot_id: The UniProt ID of the protein.
-        :param sequence: The amino acid sequence of protein to search for. (full match)
+        :param uniprot_id: The UniProt ID of the protein, or a list of UniProt IDs.
+        :param sequence: The amino acid sequence of protein to search for (full match), or a list of sequences.
         :param min_length: Minimum number of residues.
         :param max_length: Maximum number of residues.
         :param min_helix: Min percentage of helical structure in the protein.
@@ -176,9 +200,12 @@ class PyCom(object):
         :param ptm: The post-translational modification associated with the protein.
                (name of ptm, case-insensitive, get_ptm_list())
 
+        :param page: The page number of results to return. (1-i, required for PyComRemote)
+        :param per_page: The number of results per page. (1-100 for PyComRemote)
+        :param columns: The columns to return (e.g. ['uniprot_id', 'sequence_length', 'neff']), default all columns.
+               'matrix_key' (the key of the coevolution matrix) requires the sidecar database.
+
         (specific to PyComRemote)
-        :param page: The page number of results to return. (1-i)
-        :param per_page: The number of results per page. (1-100)
         :param matrix: Whether to return the coevolution matrix with the results.
         :param mat_format: The format of the coevolution matrix. (MatrixFormat.NUMPY or MatrixFormat.PANDAS)
 
@@ -187,6 +214,44 @@ class PyCom(object):
         """
         pass
 
+    @abstractmethod
+    def find_iter(
+            self,
+            constraint_dict: Optional[dict] = None,
+            /,
+            *,
+            chunk_size: int = 1000,
+            **kwargs
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Only for PyComLocal:
+        Find proteins in the database that match the given criteria, yielding the results in chunks.
+
+        Takes the same constraints as PyCom.find(), but streams the results from the database as DataFrames of
+        (at most) chunk_size rows, so that broad queries can be processed in bounded memory.
+
+        Usage:
+            >>> for chunk in pycom.find_iter(disease='cancer', chunk_size=500):
+            ...     chunk = pycom.load_matrices(chunk)
+
+        :param constraint_dict: A dictionary of constraints to apply to the search {ProteinParams: value}.
+        :param chunk_size: The (maximum) number of rows in each yielded DataFrame.
+        :return: An iterator of pandas DataFrames containing the proteins that match the given criteria.
+        """
+        pass
+
+    @abstractmethod
+    def explain(self, constraint_dict: Optional[dict] = None, /, **kwargs) -> pd.DataFrame:
+        """
+        Only for PyComLocal:
+        Returns the SQLite query plan of find() for the given criteria, without running the query.
+
+        Takes the same parameters as PyCom.find().
+
+        :return: A pandas DataFrame with the steps of the query plan (id, parent, detail)
+        """
+        pass
+
     @abstractmethod
     def load_matrices(
             self,
@@ -235,6 +300,24 @@ class PyCom(object):
         """
         pass
 
+    @abstractmethod
+    def suggest(self, param: Union[ProteinParams, str], prefix: str, limit: int = 10) -> List[str]:
+        """
+        Returns the names of a vocabulary (e.g. diseases) starting with prefix (case-insensitive), for type-ahead.
+        Names starting with the prefix come first, followed by names with a later word starting with the prefix.
+
+        Usage:
+            >>> pyc.suggest(ProteinParams.DISEASE, 'breast')
+            ['Breast cancer']
+
+        :param param: The param of the vocabulary, one of disease, cofactor, organism, biological_process,
+                      cellular_component, developmental_stage, domain, ligand, molecular_function or ptm
+        :param prefix: The start of the names
+        :param limit: The maximum number of names (default: 10)
+        :return: The matching names
+        """
+        pass
+
     @abstractmethod
     def get_disease_list(self) -> pd.DataFrame:
         """Retrieves the list of all diseases in the database."""
@@ -1,15 +1,23 @@
 import math
-from typing import Optional
+import os
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
 from pycom.interface import PyCom
 
 import pycom.interface._find_helper as fh
+from pycom.interface.connection_pool import SQLiteConnectionPool
 from pycom.interface.data_loader import PyComDataLoader
-from pycom.selector import MatrixFormat
-from pycom.interface.query_helper import query_database
-from pycom.util.format_util import user_path
+from pycom.interface.matrix_loader import CoevolutionMatrixLoader
+from pycom.selector import MatrixFormat, ProteinParams
+from pycom.interface.vocabulary import Vocabulary
+from pycom.tools.indexes import is_optimized
+from pycom.tools.matrices import mmap_path as default_mmap_path
+from pycom.tools.sidecar import SIDECAR_ALIAS, read_sidecar_info, sidecar_path as default_sidecar_path
+from pycom.util.format_util import md5_hash, user_path
+from pycom.util.lru_cache import ByteLRUCache
 
 # supress SettingWithCopyWarning from pandas
 pd.options.mode.chained_assignment = None  # default='warn'
@@ -26,6 +34,20 @@ class PyComLocal(PyCom):
 
     The files can be downloaded from https://pycom.brunel.ac.uk/downloads/ (db_path = pycom.db, mat_path = pycom.mat )
 
+    Queries are run on a pool of read-only connections (one per thread), which is kept open for the lifetime of the
+    instance. Call `close()` when done, or use PyComLocal as a context manager.
+
+    Queries are much faster on an optimized copy of pycom.db, written with `pycom.tools.build_indexes`
+    (a warning is shown when a non-optimized database is used).
+
+    If a sidecar database (pycom.sidecar.db, built with `pycom.tools.build_sidecar`) is stored next to pycom.db,
+    it is used to speed up queries, e.g. disease / cofactor / keyword / organism names are matched through its
+    full-text index instead of scanning the tables.
+
+    Results of find() are cached in memory (least recently used results are evicted when the cache exceeds
+    result_cache_size bytes). The cache is cleared automatically when pycom.db is modified or replaced.
+    Statistics of the cache are returned by `cache_info()`.
+
     Usage:
                 >>> from pycom import PyCom
             For local use:
@@ -43,28 +65,137 @@ class PyComLocal(PyCom):
                 >>> cofactors = pycom.get_cofactor_list()
                 >>> diseases = pycom.get_disease_list()
                 >>> organisms = pycom.get_organism_list()
+            Release the database connections:
+                >>> pycom.close()
+            Or, equivalently:
+                >>> with PyCom(db_path='/path/on/disk/pycom.db') as pycom:
+                ...     df = pycom.find(disease='cancer')
 
     Parameters:
         :param db_path: Path to the PyCom database (pycom.db)
         :param mat_path: Path to the coevolution matrix file (pycom.mat)
+        :param sidecar_path: Path to the sidecar database (default: pycom.sidecar.db next to pycom.db, if it exists)
+        :param mmap_path: Path to the memory-mapped copy of the matrix file, used by MatrixFormat.MMAP
+                          (default: pycom.mmap next to pycom.mat, if it exists)
+        :param result_cache_size: Maximum size of the cached results of find(), in bytes (default: 128 MiB, 0 disables
+                                  the cache)
+        :param matrix_cache_size: Maximum size of the cached matrices of load_matrices(), in bytes (default: 256 MiB,
+                                  0 disables the cache)
     """
 
     def __init__(
             self,
             db_path: str,
-            mat_path: Optional[str] = None
+            mat_path: Optional[str] = None,
+            sidecar_path: Optional[str] = None,
+            mmap_path: Optional[str] = None,
+            result_cache_size: int = 128 * 1024 ** 2,
+            matrix_cache_size: int = 256 * 1024 ** 2,
     ):
+        if '_pool' in self.__dict__:
+            # PyCom(db_path=...) returns an initialized instance from __new__, which Python initializes again
+            return
+
         self.db_path = user_path(db_path)
         assert self.db_path is not None, 'db_path has to be set. `pycom.db` can be downloaded from ' \
                                          'https://pycom.brunel.ac.uk/downloads/'
 
         self.mat_path = user_path(mat_path)
 
+        self.mmap_path = user_path(mmap_path)
+        if self.mmap_path is None and self.mat_path is not None and os.path.isfile(default_mmap_path(self.mat_path)):
+            self.mmap_path = default_mmap_path(self.mat_path)
+
+        self.sidecar_path = user_path(sidecar_path)
+        if self.sidecar_path is None and os.path.isfile(default_sidecar_path(self.db_path)):
+            self.sidecar_path = default_sidecar_path(self.db_path)
+
+        attach = {SIDECAR_ALIAS: self.sidecar_path} if self.sidecar_path is not None else None
+        self._pool = SQLiteConnectionPool(self.db_path, attach=attach)
+
+        self._result_cache = ByteLRUCache(result_cache_size)
+        self._matrix_cache_size = matrix_cache_size
+        self._matrix_loader: Optional[CoevolutionMatrixLoader] = None  # opened by load_matrices()
+        self._vocabulary: Optional[Vocabulary] = None  # read by get_vocabulary()
+        self._db_version = self._read_db_version()
+
+        self._read_sidecar_info()
+
+        if not is_optimized(self._pool.get_connection()):
+            fh.warn_unoptimized_db(self.db_path)
+
+    def close(self):
+        """Closes all pooled database connections, and the matrix file. The instance cannot be used afterwards."""
+        self._pool.close()
+        self._result_cache.clear()
+        if self._matrix_loader is not None:
+            self._matrix_loader.close()
+
+    def _read_sidecar_info(self):
+        """Enables the features of the sidecar, if it was built from the current version of the database"""
+        sidecar_info = read_sidecar_info(self._pool.get_connection(), self.db_path) \
+            if self.sidecar_path is not None else {}
+        self._text_index = 'text_index' in sidecar_info
+        self.has_matrix_key = 'matrix_key' in sidecar_info  # find() can select the matrix_key column
+
+    def _read_db_version(self) -> tuple:
+        """Returns the version of the database file (inode, modification time, size), which changes on updates"""
+        stat = os.stat(self.db_path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _check_db_version(self):
+        """
+        Clears the result cache if the database has been modified, and reconnects if the file has been replaced.
+        The sidecar is checked again, it is no longer used if it was built from the previous version.
+        """
+        version = self._read_db_version()
+        if version == self._db_version:
+            return
+
+        if version[0] != self._db_version[0] and not self._pool.closed:
+            # the connections still read the replaced file, they are reopened (the pool is shared with the
+            # data loaders, so it is reset instead of replaced)
+            self._pool.reset()
+        self._result_cache.clear()
+        self._vocabulary = None
+        self._db_version = version
+        if self.sidecar_path is not None and not self._pool.closed:
+            self._read_sidecar_info()
+
+    def cache_info(self) -> dict:
+        """
+        Returns the statistics of the result cache of find().
+
+        Usage:
+            >>> pyc.cache_info()
+            {'hits': 1, 'misses': 2, 'evictions': 0, 'entries': 2, 'size_bytes': 5632, 'max_bytes': 134217728}
+        """
+        return self._result_cache.info()
+
+    def clear_cache(self):
+        """Removes all cached results of find(), and all cached matrices"""
+        self._result_cache.clear()
+        if self._matrix_loader is not None:
+            self._matrix_loader.cache.clear()
+
+    def matrix_cache_info(self) -> dict:
+        """
+        Returns the statistics of the matrix cache of load_matrices().
+
+        Usage:
+            >>> pyc.matrix_cache_info()
+            {'hits': 10, 'misses': 20, 'evictions': 0, 'entries': 20, 'size_bytes': 4915200, 'max_bytes': 268435456}
+        """
+        return self._get_matrix_loader().cache.info()
+
     def find(
             self,
             constraint_dict: dict = None,
             /,
             *_,
+            page: Optional[int] = None,
+            per_page: Optional[int] = None,
+            columns: Optional[List[str]] = None,
             **kwargs
     ) -> pd.DataFrame:
         """
@@ -75,6 +206,10 @@ class PyComLocal(PyCom):
 
         Use either constraint_dict or the individual parameters, not both.
 
+        If page is set, only the results of that page are fetched from the database (ordered by UniProt ID),
+        which is much faster than using paginate() on all results. The total number of results is counted by
+        the database, and stored in df.attrs['total_results'].
+
         Usage:
             >>> from pycom import PyCom, ProteinParams
             >>> pyc = PyCom(db_path='/path/on/disk/pycom.db')
@@ -82,8 +217,18 @@ class PyComLocal(PyCom):
             >>> pyc = pyc.find(disease='cancer')
             >>> # or
             >>> pyc = pyc.find({ProteinParams.DISEASE: 'cancer'})
+            >>> # only the second page, of 100 results per page
+            >>> pyc = pyc.find(disease='cancer', page=2, per_page=100)
+            >>> # only fetch the uniprot_id and neff columns
+            >>> pyc = pyc.find(disease='cancer', columns=['uniprot_id', 'neff'])
+            >>> # look up many proteins at once, results are returned in the order of the list
+            >>> pyc = pyc.find(uniprot_id=['P01308', 'P01111', 'P60484'])
 
         :param constraint_dict: A dictionary of constraints to apply to the search {ProteinParams: value}.
+        :param page: The page number of results to return, first page is 1. (optional)
+        :param per_page: The number of results per page. (default: 100, if page is set)
+        :param columns: The columns to fetch from the database (default: all columns). load_matrices() requires the
+                        'sequence' column.
 
         See pycom.PyCom.find() for a list of valid parameters.
 
@@ -92,26 +237,149 @@ class PyComLocal(PyCom):
         # validate the parameters
         constraints = fh.get_valid_find_params(remote=False, constraint_dict=constraint_dict, **kwargs)
 
+        if page is None and per_page is not None:
+            page = 1
+        if page is not None and per_page is None:
+            per_page = 100
+
+        self._check_db_version()
+        cache_key = fh.find_cache_key(constraints, page=page, per_page=per_page, columns=columns)
+        cached_result = self._result_cache.get(cache_key)
+        if cached_result is not None:
+            return cached_result.copy()  # copy, load_matrices() modifies the DataFrame in place
+
+        query_result = self._find(constraints, page, per_page, columns)
+        # the (shallow) size is a lower bound, results that cannot fit into the cache are neither measured nor copied
+        max_bytes = self._result_cache.max_bytes
+        if max_bytes > 0 and query_result.memory_usage(index=True, deep=False).sum() <= max_bytes:
+            size = int(query_result.memory_usage(index=True, deep=True).sum())
+            if size <= max_bytes:
+                self._result_cache.put(cache_key, query_result.copy(), size=size)
+        return query_result
+
+    def _find(self, constraints: dict, page: Optional[int], per_page: Optional[int],
+              columns: Optional[List[str]]) -> pd.DataFrame:
+        """Runs the query of find(), without the result cache"""
+        # a bulk lookup (list of uniprot_ids / sequences) is returned in the order of the list, unless paginated
+        lookup = fh.get_bulk_lookup(constraints) if page is None else None
+        query_columns = columns if lookup is None else fh.with_column(columns, lookup[0])
+
         # build the query
-        query, params = fh.build_query_from_constraints(**constraints)
+        query, params = fh.build_query_from_constraints(page=page, per_page=per_page, columns=query_columns,
+                                                        text_index=self._text_index, matrix_key=self.has_matrix_key,
+                                                        **constraints)
+
+        query_result: pd.DataFrame = fh.query_db(db_path=self.db_path, query=query, params=params, pool=self._pool)
 
-        query_result: pd.DataFrame = fh.query_db(db_path=self.db_path, query=query, params=params)
+        if lookup is not None:
+            query_result = fh.sort_by_lookup_order(query_result, *lookup)
+            if query_columns is not columns:  # column was only selected for sorting
+                query_result = query_result.drop(columns=[lookup[0]])
         query_result['matrix'] = pd.Series([None] * len(query_result), dtype='object')
 
+        if page is None:
+            total_results = len(query_result)
+        else:
+            count_query, count_params = fh.build_count_query_from_constraints(text_index=self._text_index,
+                                                                              **constraints)
+            total_results = fh.count_db(db_path=self.db_path, query=count_query, params=count_params,
+                                        pool=self._pool)
+
         try:
-            query_result.attrs['page'] = 1
-            query_result.attrs['total_pages'] = 1
-            query_result.attrs['total_results'] = len(query_result)
+            query_result.attrs['page'] = 1 if page is None else page
+            query_result.attrs['total_pages'] = 1 if page is None else math.ceil(total_results / per_page)
+            query_result.attrs['total_results'] = total_results
         except AttributeError:
             pass  # pandas version without attrs support
 
         return query_result
 
+    def find_iter(
+            self,
+            constraint_dict: dict = None,
+            /,
+            *_,
+            chunk_size: int = 1000,
+            columns: Optional[List[str]] = None,
+            **kwargs
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Find proteins in the database that match the given criteria, yielding the results in chunks.
+
+        Takes the same constraints as PyCom.find(), but instead of building a single DataFrame of all results,
+        rows are streamed from the database and yielded as DataFrames of (at most) chunk_size rows.
+        Only one chunk is held in memory at a time, which allows processing very broad queries (or the whole
+        database) in bounded memory.
+
+        Usage:
+            >>> from pycom import PyCom
+            >>> pyc = PyCom(db_path='/path/on/disk/pycom.db', mat_path='/path/on/disk/pycom.mat')
+            >>> for chunk in pyc.find_iter(disease='cancer', chunk_size=500):
+            ...     chunk = pyc.load_matrices(chunk)
+            ...     # process chunk
+
+        :param constraint_dict: A dictionary of constraints to apply to the search {ProteinParams: value}.
+        :param chunk_size: The (maximum) number of rows in each yielded DataFrame.
+        :param columns: The columns to fetch from the database (default: all columns).
+
+        See pycom.PyCom.find() for a list of valid parameters.
+
+        :return: An iterator of pandas DataFrames containing the proteins that match the given criteria.
+        """
+        constraints = fh.get_valid_find_params(remote=False, constraint_dict=constraint_dict, **kwargs)
+        self._check_db_version()
+        query, params = fh.build_query_from_constraints(columns=columns, text_index=self._text_index,
+                                                        matrix_key=self.has_matrix_key, **constraints)
+
+        for chunk in fh.query_db_iter(self.db_path, query, params, chunk_size=chunk_size, pool=self._pool):
+            chunk['matrix'] = pd.Series([None] * len(chunk), dtype='object')
+            yield chunk
+
+    def explain(
+            self,
+            constraint_dict: dict = None,
+            /,
+            *_,
+            page: Optional[int] = None,
+            per_page: Optional[int] = None,
+            columns: Optional[List[str]] = None,
+            **kwargs
+    ) -> pd.DataFrame:
+        """
+        Returns the SQLite query plan of find() for the given criteria, without running the query.
+
+        Useful to check which indexes are used (see pycom.tools.build_indexes) for a combination of constraints.
+
+        Usage:
+            >>> pyc = PyCom(db_path='/path/on/disk/pycom.db')
+            >>> print(pyc.explain(disease='cancer', cath='3.40.*.*').to_string())
+
+        Takes the same parameters as PyCom.find().
+
+        :return: A pandas DataFrame with the steps of the query plan (id, parent, detail)
+        """
+        constraints = fh.get_valid_find_params(remote=False, constraint_dict=constraint_dict, **kwargs)
+
+        if page is None and per_page is not None:
+            page = 1
+        if page is not None and per_page is None:
+            per_page = 100
+
+        self._check_db_version()
+        query, params = fh.build_query_from_constraints(page=page, per_page=per_page, columns=columns,
+                                                        text_index=self._text_index, matrix_key=self.has_matrix_key,
+                                                        **constraints)
+
+        return fh.explain_db(db_path=self.db_path, query=query, params=params, pool=self._pool)
+
     def load_matrices(
             self,
             df: pd.DataFrame,
             max_load: int = 1000,
-            mat_format: MatrixFormat = MatrixFormat.NUMPY
+            mat_format: MatrixFormat = MatrixFormat.NUMPY,
+            workers: int = 1,
+            lazy: bool = False,
+            residue_range: Optional[Union[Tuple[int, int], Sequence[Optional[Tuple[int, int]]]]] = None,
     ) -> pd.DataFrame:
         """
         Load the coevolution matrices into memory
@@ -122,19 +390,77 @@ class PyComLocal(PyCom):
         Requires the coevolution matrix file (pycom.mat) to be downloaded from https://pycom.brunel.ac.uk/downloads/
 
         By default, this function will only load the first 1000 matrices. This can be changed by setting max_load.
+
+        pycom.mat is opened on the first call, and kept open (with its chunk cache) until close() is called.
+        Loaded matrices are cached (see matrix_cache_size, and matrix_cache_info()), the returned matrices are copies.
+
+        Decompressing the matrices is CPU-bound, with workers > 1 they are loaded by a pool of worker processes.
+        The pool is kept running until close() is called.
+
+        :param df: DataFrame from PyCom.find(), requires the 'matrix_key' column (if the sidecar database is used,
+                   see pycom.tools.build_sidecar) or the 'sequence' column
+        :param max_load: The maximum number of matrices to load
+        :param mat_format: The format of the matrices, MatrixFormat.MMAP returns read-only views of the memory-mapped
+                           copy of pycom.mat (see pycom.tools.export_mmap), which are read from disk when accessed
+        :param workers: The number of worker processes (default: 1, load in this process). The workers are started
+                        with the 'spawn' method, which imports the main module again: a script must only call
+                        load_matrices() from an `if __name__ == '__main__':` block. If the workers cannot be started,
+                        a warning is shown and the matrices are loaded in this process.
+        :param lazy: Whether to fill the 'matrix' column with LazyMatrix proxies instead, which are only read when
+                     accessed (e.g. np.asarray(proxy), or proxy.load() / proxy.release()). max_load does not apply.
+        :param residue_range: Only load the sub-matrices of residues (start, end), 1-based and inclusive (clipped to
+                              the length of each sequence), e.g. (120, 260) for a domain. Either a single range for
+                              all rows, or one range (or None, the whole matrix) per row of df. Only the chunks
+                              covering the sub-matrices are read and decompressed.
         """
         assert self.mat_path is not None, 'mat_path has to be set. `pycom.mat` can be downloaded from ' \
                                           'https://pycom.brunel.ac.uk/downloads/'
 
-        assert len(df) <= max_load, f'Attempting to load {len(df)} matrices, max_load is {max_load}. ' \
-                                    f'Consider using PyCom.paginate(), or increasing max_load parameter'
-
-        cml = fh.CoevolutionMatrixLoader(self.mat_path, mat_format=mat_format)
-
-        df['matrix'] = df['sequence'].apply(lambda x: cml.load_coevolution_matrix(x))
+        assert lazy or len(df) <= max_load, f'Attempting to load {len(df)} matrices, max_load is {max_load}. ' \
+                                            f'Consider using PyCom.paginate(), or increasing max_load parameter'
+
+        assert 'matrix_key' in df.columns or 'sequence' in df.columns, \
+            'The matrix_key or sequence column is required to load the matrices, ' \
+            'include it in the columns parameter of PyCom.find()'
+
+        cml = self._get_matrix_loader()
+
+        # matrix keys are read from the sidecar, otherwise they are computed from the sequences
+        if 'matrix_key' in df.columns:
+            keys = df['matrix_key'].tolist()
+        else:
+            keys = [md5_hash(sequence) for sequence in df['sequence']]
+
+        if residue_range is None:
+            residue_ranges = None
+        elif len(residue_range) == 2 and all(isinstance(x, (int, np.integer)) for x in residue_range):
+            residue_ranges = [tuple(residue_range)] * len(df)
+        else:
+            assert len(residue_range) == len(df), 'residue_range must be (start, end), or have one range per row ' \
+                                                  f'of df ({len(df)}), not {len(residue_range)}'
+            residue_ranges = list(residue_range)
+
+        if lazy:
+            loaded = cml.load_lazy_by_hash(keys, mat_format=mat_format, residue_ranges=residue_ranges)
+        else:
+            loaded = cml.load_many_by_hash(keys, mat_format=mat_format, workers=workers,
+                                           residue_ranges=residue_ranges)
+
+        matrices = np.empty(len(df), dtype='object')
+        for i, matrix in enumerate(loaded):  # item by item, numpy would convert arrays (and proxies) otherwise
+            matrices[i] = matrix
+        df['matrix'] = pd.Series(matrices, index=df.index, dtype='object')
 
         return df
 
+    def _get_matrix_loader(self) -> CoevolutionMatrixLoader:
+        """Returns the matrix loader, which keeps pycom.mat open between calls of load_matrices()"""
+        assert not self._pool.closed, 'PyCom instance has been closed'
+        if self._matrix_loader is None:
+            self._matrix_loader = CoevolutionMatrixLoader(self.mat_path, mmap_path=self.mmap_path,
+                                                          cache_size=self._matrix_cache_size)
+        return self._matrix_loader
+
     @staticmethod
     def paginate(df: pd.DataFrame, page: int, per_page: int = 100) -> pd.DataFrame:
         """
@@ -166,47 +492,62 @@ class PyComLocal(PyCom):
 
         :return: PyComDataLoader
         """
-        return PyComDataLoader(self.db_path)
+        return PyComDataLoader(self.db_path, pool=self._pool)
+
+    def get_vocabulary(self) -> Vocabulary:
+        """
+        Returns the vocabularies of the database (diseases, cofactors, organisms and keywords), which are read once
+        and cached until the database is modified. The get_*_list() methods return copies of its tables.
+        """
+        assert not self._pool.closed, 'PyCom instance has been closed'
+        self._check_db_version()
+        vocabulary = self._vocabulary
+        if vocabulary is None:
+            vocabulary = self._vocabulary = Vocabulary(self.db_path, pool=self._pool)
+        return vocabulary
+
+    def suggest(self, param: Union[ProteinParams, str], prefix: str, limit: int = 10) -> List[str]:
+        """
+        Returns the names of a vocabulary (e.g. diseases) starting with prefix (case-insensitive), for type-ahead.
+        Served from a sorted index of the vocabulary, built on first use (see Vocabulary.suggest()).
+
+        :param param: The param of the vocabulary, one of disease, cofactor, organism, biological_process,
+                      cellular_component, developmental_stage, domain, ligand, molecular_function or ptm
+        :param prefix: The start of the names
+        :param limit: The maximum number of names (default: 10)
+        :return: The matching names
+        """
+        return self.get_vocabulary().suggest(param, prefix, limit=limit)
 
     def get_disease_list(self) -> pd.DataFrame:
         """Retrieves the list of all diseases in the database."""
-        query = "SELECT diseaseId, diseaseName FROM disease"
-        return query_database(query, self.db_path)
+        return self.get_vocabulary().table('disease').copy()
 
     def get_cofactor_list(self) -> pd.DataFrame:
         """Retrieves the list of all cofactors in the database."""
-        query = "SELECT cofactorId, cofactorName FROM cofactor"
-        return query_database(query, self.db_path)
+        return self.get_vocabulary().table('cofactor').copy()
 
     def get_organism_list(self) -> pd.DataFrame:
         """Retrieves the list of all organisms in the database."""
-        query = "SELECT organismId, nameScientific, nameCommon, taxonomy FROM organism"
-        return query_database(query, self.db_path)
+        return self.get_vocabulary().table('organism').copy()
 
     def get_biological_process_list(self) -> pd.DataFrame:
-        query = "SELECT keywordName as name FROM keyword WHERE keywordCategory = 'Biological process'"
-        return query_database(query, self.db_path)
+        return self.get_vocabulary().table('biological_process').copy()
 
     def get_cellular_component_list(self) -> pd.DataFrame:
-        query = "SELECT keywordName as name FROM keyword WHERE keywordCategory = 'Cellular component'"
-        return query_database(query, self.db_path)
+        return self.get_vocabulary().table('cellular_component').copy()
 
     def get_developmental_stage_list(self) -> pd.DataFrame:
-        query = "SELECT keywordName as name FROM keyword WHERE keywordCategory = 'Developmental stage'"
-        return query_database(query, self.db_path)
+        return self.get_vocabulary().table('developmental_stage').copy()
 
     def get_domain_list(self) -> pd.DataFrame:
-        query = "SELECT keywordName as name FROM keyword WHERE keywordCategory = 'Domain'"
-        return query_database(query, self.db_path)
+        return self.get_vocabulary().table('domain').copy()
 
     def get_ligand_list(self) -> pd.DataFrame:
-        query = "SELECT keywordName as name FROM keyword WHERE keywordCategory = 'Ligand'"
-        return query_database(query, self.db_path)
+        return self.get_vocabulary().table('ligand').copy()
 
     def get_molecular_function_list(self) -> pd.DataFrame:
-        query = "SELECT keywordName as name FROM keyword WHERE keywordCategory = 'Molecular function'"
-        return query_database(query, self.db_path)
+        return self.get_vocabulary().table('molecular_function').copy()
 
     def get_ptm_list(self) -> pd.DataFrame:
-        query = "SELECT keywordName as name FROM keyword WHERE keywordCategory = 'PTM'"
-        return query_database(query, self.db_path)
+        return self.get_vocabulary().table('ptm').copy()
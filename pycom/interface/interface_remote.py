@@ -4,12 +4,16 @@ import pandas as pd
 
 from pycom.interface import PyCom
 from pycom.interface.data_loader import PyComDataLoader
-from pycom.selector import MatrixFormat
-from typing import Dict
+from pycom.selector import MatrixFormat, ProteinParams
+from typing import Dict, List, Optional, Union
 
 import pycom.interface._find_helper as fh
 
 
+# formats of packed upper triangles, the server sends these packed
+_PACKED_FORMATS = (MatrixFormat.TRIU, MatrixFormat.TRIU_FLOAT32, MatrixFormat.TRIU_FLOAT16)
+
+
 class PyComRemote(PyCom):
     """
     A Python wrapper for the PyCom API.
@@ -63,6 +67,7 @@ class PyComRemote(PyCom):
             per_page: int = 10,
             matrix: bool = False,
             mat_format: MatrixFormat = MatrixFormat.NUMPY,
+            columns: Optional[List[str]] = None,
             **kwargs
     ) -> pd.DataFrame:
         """
@@ -74,6 +79,10 @@ class PyComRemote(PyCom):
             per_page (int): The number of results per page. Defaults to 10.
             matrix (bool): Whether to include the matrices in the results. Defaults to False.
             mat_format (MatrixFormat): The format of the matrices. Defaults to MatrixFormat.NUMPY.
+                With MatrixFormat.TRIU (or TRIU_FLOAT32 / TRIU_FLOAT16), the server sends the packed upper triangles
+                of the matrices, which halves the size of the response. The server always sends float32 values,
+                TRIU_FLOAT16 downcasts them after they are received.
+            columns (list): The columns to return (e.g. ['uniprot_id', 'neff']). Defaults to all columns.
 
         Returns:
             pandas.DataFrame: DataFrame containing the protein data.
@@ -87,6 +96,10 @@ class PyComRemote(PyCom):
 
         params = fh.get_valid_find_params(remote=True, constraint_dict=constraint_dict, **kwargs)
         params.update({'page': page, 'per_page': per_page, 'matrix': matrix})
+        if matrix and mat_format in _PACKED_FORMATS:
+            params['packed'] = True
+        if columns is not None:
+            params['columns'] = ','.join(columns)
 
         response = self._make_request('find', params)
 
@@ -106,11 +119,16 @@ class PyComRemote(PyCom):
             return res
 
         if matrix:
-            res['matrix'] = res['matrix'].apply(np.array)  # MatrixFormat assumes numpy array
+            res['matrix'] = res['matrix'].apply(np.array)  # MatrixFormat assumes numpy array (packed if TRIU)
             res['matrix'] = res['matrix'].apply(mat_format)  # Convert to desired format
 
         return res
 
+    def suggest(self, param: Union[ProteinParams, str], prefix: str, limit: int = 10) -> List[str]:
+        """Fetches the names of a vocabulary starting with prefix from the 'suggest' endpoint."""
+        param = param.value if isinstance(param, ProteinParams) else param
+        return self._make_request('suggest', {'param': param, 'prefix': prefix, 'limit': limit})
+
     def get_disease_list(self) -> pd.DataFrame:
         """Fetches disease data from the 'get-disease-list' endpoint as a pandas DataFrame."""
         response = self._make_request('get-disease-list')
@@ -166,6 +184,13 @@ class PyComRemote(PyCom):
         raise NotImplementedError('Pagination is not supported for the remote API, use the `page` and `per_page` '
                                   'parameters in the `find` method instead.')
 
+    def find_iter(*_, **__):
+        raise NotImplementedError('Streaming results is not supported for the remote API, use the `page` and '
+                                  '`per_page` parameters in the `find` method instead.')
+
+    def explain(*_, **__) -> pd.DataFrame:
+        raise NotImplementedError('Query plans are not available for the remote API, use local instead.')
+
     def load_matrices(*_, **__) -> pd.DataFrame:
         raise NotImplementedError('Loading matrices is not supported for the remote API, use the `matrix` parameter '
                                   'in the `find` method instead.')
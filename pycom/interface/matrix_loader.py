@@ -0,0 +1,522 @@
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+from warnings import warn
+
+import h5py
+import numpy as np
+
+try:  # registers the lz4 / blosc filters of repacked matrix files (pycom.tools.repack_matrices), if installed
+    import hdf5plugin  # noqa
+except ImportError:
+    hdf5plugin = None
+
+from pycom.selector import MatrixFormat
+from pycom.tools.matrices import dataset_offset, dataset_path, read_mmap_index, read_offset_index, read_shard_prefix
+from pycom.util.format_util import md5_hash
+from pycom.util.lru_cache import ByteLRUCache
+
+
+class CoevolutionMatrixLoader:
+    """
+    A class that loads coevolution matrices from an HDF5 file (pycom.mat)
+
+    Both the layout of pycom.mat, and the layout of files written by pycom.tools.repack_matrices are supported.
+
+    The file is opened on first use, and kept open until close() is called, so that the HDF5 metadata and
+    chunk cache are reused between calls. The loader is fork-safe: a handle inherited from a parent process
+    is discarded, and the child opens its own.
+
+    With MatrixFormat.MMAP, matrices are returned as read-only views of the memory-mapped copy of the file
+    (written once with pycom.tools.export_mmap), nothing is read until a matrix is accessed.
+
+    Many matrices can be loaded at once with load_many(), optionally decompressed by a pool of worker processes
+    (workers > 1). The pool is started on first use, and kept running until close() is called.
+
+    Loaded matrices are kept in a cache (keyed on the md5 hash of the sequence, least recently used matrices are
+    evicted when the cache exceeds cache_size bytes), so popular matrices are not read again. The cache keeps
+    read-only matrices, NUMPY and PANDAS matrices are returned as writable copies of them.
+
+    A residue_range (start, end) loads the sub-matrix of residues start to end (1-based, inclusive, clipped to the
+    length of the sequence). The slice is read from the file directly, only the chunks covering it are decompressed.
+
+    Usage:
+        >>> cml = CoevolutionMatrixLoader('/path/on/disk/pycom.mat')
+        >>> matrix = cml.load_coevolution_matrix(sequence)
+        >>> cml.close()
+
+    Parameters:
+        :param matrix_path: Path to the coevolution matrix file (pycom.mat)
+        :param mat_format: The default format of the loaded matrices
+        :param rdcc_nbytes: Size of the HDF5 chunk cache, in bytes (default: 32 MiB)
+        :param rdcc_nslots: Number of slots of the HDF5 chunk cache, a prime number ~100 times the number of
+                            chunks that fit into the cache (default: 10007)
+        :param mmap_path: Path to the memory-mapped copy of the file (pycom.mmap), required for MatrixFormat.MMAP
+        :param cache_size: Maximum size of the cached matrices, in bytes (default: 256 MiB, 0 disables the cache)
+    """
+    def __init__(
+            self,
+            matrix_path,
+            mat_format: MatrixFormat = MatrixFormat.NUMPY,
+            rdcc_nbytes: int = 32 * 1024 ** 2,
+            rdcc_nslots: int = 10007,
+            mmap_path: Optional[str] = None,
+            cache_size: int = 256 * 1024 ** 2,
+    ):
+        self.matrix_path = matrix_path
+        # noinspection PyTypeChecker
+        self.mat_formatter: Callable = mat_format
+        self.rdcc_nbytes = rdcc_nbytes
+        self.rdcc_nslots = rdcc_nslots
+        self.mmap_path = mmap_path
+        self.cache = ByteLRUCache(cache_size)
+
+        self._mmap: Optional[np.memmap] = None
+        self._mmap_index: Optional[Dict[str, Tuple[int, Tuple[int, int]]]] = None
+        self._mat_db: Optional[h5py.File] = None
+        self._shard_prefix = 0
+        self._offsets: Optional[Dict[str, int]] = None  # embedded offset index of repacked files
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_workers = 0
+        self._executor_failed = False  # the worker pool could not be started, matrices are loaded in this process
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    @property
+    def mat_db(self) -> h5py.File:
+        """The HDF5 file, opened read-only on first use"""
+        if self._pid != os.getpid():
+            # the handle and worker pool belong to the parent process, they are not closed here
+            self._mat_db = None
+            self._executor = None
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+        if self._mat_db is None:
+            with self._lock:
+                if self._mat_db is None:
+                    mat_db = h5py.File(self.matrix_path, 'r', rdcc_nbytes=self.rdcc_nbytes,
+                                       rdcc_nslots=self.rdcc_nslots)
+                    self._shard_prefix = read_shard_prefix(mat_db)
+                    self._offsets = read_offset_index(mat_db)
+                    self._mat_db = mat_db
+        return self._mat_db
+
+    def get_dataset(self, md5: str) -> Optional[h5py.Dataset]:
+        """Returns the dataset of the matrix with the md5 hash, or None if the file has no such matrix"""
+        return self.mat_db.get(dataset_path(md5, self._shard_prefix))
+
+    def _offset(self, md5: str, dataset: h5py.Dataset) -> int:
+        """Returns the position of the dataset in the file, from the embedded index of repacked files if available"""
+        offset = self._offsets.get(md5) if self._offsets is not None else dataset_offset(dataset)
+        return -1 if offset is None else offset
+
+    def load_coevolution_matrix(
+            self,
+            sequence: str,
+            mat_format: Optional[MatrixFormat] = None,
+            residue_range: Optional[Tuple[int, int]] = None,
+    ):
+        """
+        Load a coevolution matrix from an HDF5 file
+
+        :param sequence: The sequence of the protein
+        :param mat_format: The format of the matrix (default: the format of the loader)
+        :param residue_range: Only load the sub-matrix of residues (start, end), 1-based and inclusive
+        :return: The matrix, or None if the file has no matrix for the sequence
+        """
+        return self.load_by_hash(md5_hash(sequence), mat_format=mat_format, residue_range=residue_range)
+
+    def load_by_hash(
+            self,
+            md5: str,
+            mat_format: Optional[MatrixFormat] = None,
+            residue_range: Optional[Tuple[int, int]] = None,
+    ):
+        """
+        Load a coevolution matrix by the md5 hash of its sequence (the name of its dataset)
+
+        :param md5: The md5 hash of the sequence
+        :param mat_format: The format of the matrix (default: the format of the loader)
+        :param residue_range: Only load the sub-matrix of residues (start, end), 1-based and inclusive
+        :return: The matrix, or None if the file has no matrix for the hash
+        """
+        mat_formatter = self.mat_formatter if mat_format is None else mat_format
+        if mat_formatter is MatrixFormat.MMAP:
+            view = self._mmap_view(md5)
+            return view if view is None or residue_range is None else _window(view, residue_range)
+
+        matrix = self.cache.get(md5)
+        if matrix is not None and residue_range is not None:
+            matrix = _window(matrix, residue_range)
+        elif matrix is None:
+            dataset = self.get_dataset(md5)
+            if dataset is None:
+                return None
+            key = _window_key(md5, residue_range, dataset.shape)
+            matrix = self.cache.get(key) if key != md5 else None
+            if matrix is None:
+                matrix = self._cached(key, dataset[_selection(residue_range, dataset.shape)])
+        return _format(mat_formatter, matrix)
+
+    def _cached(self, key: Hashable, matrix: np.ndarray) -> np.ndarray:
+        """Adds a loaded matrix to the cache, a cached matrix is made read-only as it is shared"""
+        if self.cache.put(key, matrix, size=matrix.nbytes):
+            matrix.flags.writeable = False
+        return matrix
+
+    def load_lazy(
+            self,
+            sequences: Sequence[str],
+            mat_format: Optional[MatrixFormat] = None,
+            residue_ranges: Optional[Sequence[Optional[Tuple[int, int]]]] = None,
+    ) -> list:
+        """
+        Returns LazyMatrix proxies of the matrices of the sequences, which are only read when accessed
+
+        :param sequences: The sequences of the proteins
+        :param mat_format: The format of the matrices (default: the format of the loader)
+        :param residue_ranges: The residue range (start, end) of each sequence, or None (the whole matrix)
+        :return: The proxies in the order of sequences (None for sequences without a matrix)
+        """
+        return self.load_lazy_by_hash([md5_hash(sequence) for sequence in sequences], mat_format=mat_format,
+                                      residue_ranges=residue_ranges)
+
+    def load_lazy_by_hash(
+            self,
+            hashes: Sequence[Optional[str]],
+            mat_format: Optional[MatrixFormat] = None,
+            residue_ranges: Optional[Sequence[Optional[Tuple[int, int]]]] = None,
+    ) -> list:
+        """Same as load_lazy(), for the md5 hashes of the sequences (e.g. the matrix_key column of PyCom.find())"""
+        residue_ranges = _residue_ranges(residue_ranges, len(hashes))
+        available = {md5 for md5 in set(hashes) if md5 is not None and self.get_dataset(md5) is not None}
+        return [LazyMatrix(md5, self, mat_format, residue_range) if md5 in available else None
+                for md5, residue_range in zip(hashes, residue_ranges)]
+
+    def load_many(
+            self,
+            sequences: Sequence[str],
+            mat_format: Optional[MatrixFormat] = None,
+            workers: int = 1,
+            residue_ranges: Optional[Sequence[Optional[Tuple[int, int]]]] = None,
+    ) -> list:
+        """
+        Load the coevolution matrices of many sequences
+
+        Duplicate sequences are only read once, and the matrices are read in the order in which they are stored
+        in the file (instead of the order of sequences), which turns random reads into (mostly) sequential reads.
+
+        With workers > 1, the matrices are read and decompressed by a pool of worker processes, each with its own
+        handle of the file. The workers write the matrices into shared memory, instead of sending them back pickled.
+
+        :param sequences: The sequences of the proteins
+        :param mat_format: The format of the matrices (default: the format of the loader)
+        :param workers: The number of worker processes (default: 1, load in this process). The workers are started
+                        with the 'spawn' method, which imports the main module again: a script must only call
+                        load_many() from an `if __name__ == '__main__':` block. If the workers cannot be started,
+                        a warning is shown and the matrices are loaded in this process.
+        :param residue_ranges: The residue range (start, end) of each sequence, or None (the whole matrix), only
+                               the sub-matrices are read from the file
+        :return: The matrices in the order of sequences (None for sequences without a matrix), duplicate sequences
+                 (with the same residue range) share the same matrix object
+        """
+        return self.load_many_by_hash([md5_hash(sequence) for sequence in sequences], mat_format=mat_format,
+                                      workers=workers, residue_ranges=residue_ranges)
+
+    def load_many_by_hash(
+            self,
+            hashes: Sequence[Optional[str]],
+            mat_format: Optional[MatrixFormat] = None,
+            workers: int = 1,
+            residue_ranges: Optional[Sequence[Optional[Tuple[int, int]]]] = None,
+    ) -> list:
+        """Same as load_many(), for the md5 hashes of the sequences (e.g. the matrix_key column of PyCom.find())"""
+        assert workers >= 1, f'workers must be at least 1, not {workers}'
+        mat_formatter = self.mat_formatter if mat_format is None else mat_format
+        requests = list(zip(hashes, _residue_ranges(residue_ranges, len(hashes))))
+
+        if mat_formatter is MatrixFormat.MMAP:  # views are created without reading, order and workers do not matter
+            views = {md5: self._mmap_view(md5) for md5 in set(hashes) if md5 is not None}
+            return [None if views.get(md5) is None else views[md5] if residue_range is None
+                    else _window(views[md5], residue_range) for md5, residue_range in requests]
+
+        arrays, datasets, keys = {}, {}, {}
+        for md5, residue_range in dict.fromkeys(requests):  # unique, in order of first occurrence
+            if md5 is None:
+                continue
+            matrix = self.cache.get(md5)
+            if matrix is not None:
+                arrays[md5, residue_range] = matrix if residue_range is None else _window(matrix, residue_range)
+                continue
+            dataset = self.get_dataset(md5)
+            if dataset is None:
+                continue
+            key = keys[md5, residue_range] = _window_key(md5, residue_range, dataset.shape)
+            matrix = self.cache.get(key) if key != md5 else None
+            if matrix is not None:
+                arrays[md5, residue_range] = matrix
+            else:
+                datasets[key] = (md5, dataset, _selection(residue_range, dataset.shape))
+        ordered = sorted(datasets, key=lambda x: self._offset(datasets[x][0], datasets[x][1]))
+
+        loaded = None
+        if workers > 1 and len(ordered) > 1 and not self._executor_failed:
+            try:
+                loaded = self._load_parallel([(key, datasets[key][0], datasets[key][2], datasets[key][1].shape,
+                                               datasets[key][1].dtype) for key in ordered], workers)
+            except (BrokenProcessPool, OSError) as e:  # e.g. a script without a __main__ guard, see load_many()
+                with self._lock:
+                    if self._executor is not None:
+                        self._executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = None
+                    self._executor_failed = True
+                warn(f'The worker processes could not be started ({e!r}), matrices are loaded in this process. '
+                     f'Scripts that use workers > 1 must call PyCom from an `if __name__ == \'__main__\':` block.')
+        if loaded is None:
+            loaded = {key: datasets[key][1][datasets[key][2]] for key in ordered}
+        loaded = {key: self._cached(key, matrix) for key, matrix in loaded.items()}
+        for request, key in keys.items():
+            if key in loaded:
+                arrays[request] = loaded[key]
+
+        matrices = {request: _format(mat_formatter, array) for request, array in arrays.items()}
+        return [matrices.get(request) for request in requests]
+
+    def _mmap_view(self, md5: str) -> Optional[np.ndarray]:
+        """Returns the read-only view of the matrix in the memory-mapped file, or None if it has no matrix"""
+        if self._mmap_index is None:
+            with self._lock:
+                if self._mmap_index is None:
+                    assert self.mmap_path is not None and os.path.isfile(self.mmap_path), \
+                        'MatrixFormat.MMAP requires the memory-mapped copy of pycom.mat, ' \
+                        'which can be written with pycom.tools.export_mmap(mat_path)'
+                    dtype, index = read_mmap_index(self.mmap_path)
+                    if os.path.getsize(self.mmap_path) > 0:  # an empty file cannot be mapped
+                        self._mmap = np.memmap(self.mmap_path, dtype=dtype, mode='r')
+                    self._mmap_index = index
+
+        entry = self._mmap_index.get(md5)
+        if entry is None:
+            return None
+        offset, (rows, cols) = entry
+        return self._mmap[offset:offset + rows * cols].reshape(rows, cols)
+
+    def _get_executor(self, workers: int) -> ProcessPoolExecutor:
+        """Returns the worker pool, (re)starting it if the number of workers changed"""
+        with self._lock:
+            if self._executor is None or self._executor_workers != workers:
+                if self._executor is not None:
+                    self._executor.shutdown()
+                # spawn: forking a process with an open HDF5 file (and threads) is not safe
+                self._executor = ProcessPoolExecutor(max_workers=workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_init_worker,
+                                                     initargs=(self.matrix_path, self.rdcc_nbytes, self.rdcc_nslots))
+                self._executor_workers = workers
+            return self._executor
+
+    def _load_parallel(
+            self,
+            items: List[Tuple[Hashable, str, tuple, tuple, np.dtype]],
+            workers: int,
+    ) -> Dict[Hashable, np.ndarray]:
+        """
+        Loads the datasets (key, md5, selection, shape, dtype) with the worker pool, into a single block of shared
+        memory. Each worker loads a contiguous range of datasets (in on-disk order), the arrays are copied out of
+        the shared memory when all workers are done.
+        """
+        tasks, offset = [], 0
+        for key, md5, selection, shape, dtype in items:
+            shape = tuple(len(range(*s.indices(n))) for s, n in zip(selection, shape))
+            tasks.append((key, md5, selection, offset, shape, np.dtype(dtype).str))
+            offset += _aligned(math.prod(shape) * np.dtype(dtype).itemsize)
+
+        shm = SharedMemory(create=True, size=max(offset, 1))
+        try:
+            executor = self._get_executor(workers)
+            shard_size = math.ceil(len(tasks) / (workers * 4))  # several shards per worker, to balance the load
+            shards = [tasks[i:i + shard_size] for i in range(0, len(tasks), shard_size)]
+            for future in [executor.submit(_load_into_shared_memory, shm.name, shard) for shard in shards]:
+                future.result()
+
+            return {key: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset).copy()
+                    for key, _, _, offset, shape, dtype in tasks}
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def close(self):
+        """Closes the HDF5 file, shuts down the worker pool and clears the cache, reopened on the next load"""
+        self.cache.clear()
+        with self._lock:
+            if self._pid == os.getpid():
+                if self._mat_db is not None:
+                    self._mat_db.close()
+                if self._executor is not None:
+                    self._executor.shutdown()
+            self._mat_db = None
+            self._executor = None
+            self._mmap = None
+            self._mmap_index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class LazyMatrix:
+    """
+    A proxy of a coevolution matrix, which is read from the matrix file when it is accessed
+
+    The proxy only holds the md5 hash of the sequence, and a reference to the loader, so a 'matrix' column of
+    proxies can be attached to DataFrames of any size (PyCom.load_matrices(df, lazy=True)).
+
+    Converting the proxy into an array (np.asarray(proxy)) reads the matrix without keeping it in the proxy
+    (only in the bounded cache of the loader), load() reads the matrix and keeps it in the proxy until release()
+    is called. Both apply mat_format (np.asarray() converts the formatted matrix into an array).
+
+    Usage:
+        >>> df = pyc.load_matrices(pyc.find(disease='cancer'), lazy=True)
+        >>> for proxy in df['matrix']:
+        ...     matrix = np.asarray(proxy)  # read from disk, released when matrix is no longer referenced
+
+    Parameters:
+        :param md5: The md5 hash of the sequence
+        :param loader: The loader of the matrix file
+        :param mat_format: The format of the matrix (default: the format of the loader)
+        :param residue_range: Only load the sub-matrix of residues (start, end), 1-based and inclusive
+    """
+    __slots__ = ('md5', 'loader', 'mat_format', 'residue_range', '_matrix')
+
+    def __init__(
+            self,
+            md5: str,
+            loader: CoevolutionMatrixLoader,
+            mat_format: Optional[MatrixFormat] = None,
+            residue_range: Optional[Tuple[int, int]] = None,
+    ):
+        self.md5 = md5
+        self.loader = loader
+        self.mat_format = mat_format
+        self.residue_range = residue_range
+        self._matrix = None
+
+    def load(self):
+        """Returns the matrix, reading it on first access, and keeping it until release() is called"""
+        if self._matrix is None:
+            self._matrix = self.loader.load_by_hash(self.md5, mat_format=self.mat_format,
+                                                    residue_range=self.residue_range)
+        return self._matrix
+
+    def release(self):
+        """Releases the matrix kept by load()"""
+        self._matrix = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._matrix is not None
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """The shape of the matrix (of its residue range), read from the metadata of the file"""
+        shape = self.loader.get_dataset(self.md5).shape
+        selection = _selection(self.residue_range, shape)
+        return tuple(len(range(*s.indices(n))) for s, n in zip(selection, shape))
+
+    def __array__(self, dtype=None, copy=None):
+        # formatted like load() (and load_matrices(lazy=False)), e.g. the packed upper triangle with MatrixFormat.TRIU
+        matrix = self._matrix if self._matrix is not None else \
+            self.loader.load_by_hash(self.md5, mat_format=self.mat_format, residue_range=self.residue_range)
+        return np.asarray(matrix, dtype=dtype)
+
+    def __repr__(self):
+        residue_range = f', residue_range={self.residue_range}' if self.residue_range is not None else ''
+        return f'{self.__class__.__name__}({self.md5!r}{residue_range}, loaded={self.loaded})'
+
+
+def _format(mat_formatter: Callable, matrix: np.ndarray):
+    """Formats a matrix, cached (read-only) matrices are copied for the formats that would share their data"""
+    if not matrix.flags.writeable and (mat_formatter is MatrixFormat.NUMPY or mat_formatter is MatrixFormat.PANDAS):
+        matrix = matrix.copy()
+    # noinspection PyCallingNonCallable
+    return mat_formatter(matrix)
+
+
+def _residue_ranges(
+        residue_ranges: Optional[Sequence[Optional[Tuple[int, int]]]],
+        n: int,
+) -> List[Optional[Tuple[int, int]]]:
+    """Validates the residue ranges of n matrices, as hashable (start, end) tuples (or None)"""
+    if residue_ranges is None:
+        return [None] * n
+
+    assert len(residue_ranges) == n, f'Expected {n} residue ranges, not {len(residue_ranges)}'
+    validated = []
+    for residue_range in residue_ranges:
+        if residue_range is not None:
+            start, end = (int(x) for x in residue_range)
+            assert 1 <= start <= end, f'residue_range must be (start, end) with 1 <= start <= end, not {residue_range}'
+            residue_range = (start, end)
+        validated.append(residue_range)
+    return validated
+
+
+def _selection(residue_range: Optional[Tuple[int, int]], shape: tuple) -> Tuple[slice, ...]:
+    """The slices of the sub-matrix of the residue range (1-based, inclusive), clipped to the shape"""
+    if residue_range is None:
+        return tuple(slice(None) for _ in shape)
+    start, end = residue_range
+    return tuple(slice(min(start - 1, n), min(end, n)) for n in shape)
+
+
+def _window_key(md5: str, residue_range: Optional[Tuple[int, int]], shape: tuple) -> Hashable:
+    """The cache key of a (sub-)matrix, residue ranges covering the whole matrix share the key of the matrix"""
+    selection = _selection(residue_range, shape)
+    if all(s.indices(n) == (0, n, 1) for s, n in zip(selection, shape)):
+        return md5
+    return md5, tuple(s.indices(n)[:2] for s, n in zip(selection, shape))
+
+
+def _window(matrix: np.ndarray, residue_range: Tuple[int, int]) -> np.ndarray:
+    """The sub-matrix of the residue range, a view of matrix"""
+    return matrix[_selection(residue_range, matrix.shape)]
+
+
+def _aligned(size: int, alignment: int = 64) -> int:
+    """Rounds size up to a multiple of alignment"""
+    return -(-size // alignment) * alignment
+
+
+_worker_loader: Optional[CoevolutionMatrixLoader] = None
+
+
+def _init_worker(matrix_path: str, rdcc_nbytes: int, rdcc_nslots: int):
+    """Initializer of the worker processes of CoevolutionMatrixLoader, each opens its own handle of the file"""
+    global _worker_loader
+    _worker_loader = CoevolutionMatrixLoader(matrix_path, rdcc_nbytes=rdcc_nbytes, rdcc_nslots=rdcc_nslots)
+
+
+def _load_into_shared_memory(shm_name: str, tasks: List[Tuple[Hashable, str, tuple, int, tuple, str]]) -> int:
+    """
+    Reads the (selections of the) datasets (key, md5, selection, offset, shape, dtype) directly into the shared
+    memory block, in a worker process
+    """
+    shm = SharedMemory(name=shm_name)
+    array = None
+    try:
+        for _, md5, selection, offset, shape, dtype in tasks:
+            array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            if array.size > 0:
+                _worker_loader.get_dataset(md5).read_direct(array, source_sel=selection)
+    finally:
+        array = None  # release the buffer, before closing the shared memory
+        shm.close()
+    return len(tasks)
@@ -2,7 +2,16 @@ import pandas as pd
 import sqlite3
 
 
-def query_database(query, db_path):
+def query_database(query, db_path, pool=None):
+    """
+    Runs a query against the PyCom database and returns the result as a pandas DataFrame.
+
+    If a connection pool (SQLiteConnectionPool) is passed, the pooled connection of the calling thread is used,
+    otherwise a new connection is opened (and closed) for this query.
+    """
+    if pool is not None:
+        return pd.read_sql_query(query, pool.get_connection())
+
     conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
     df = pd.read_sql_query(query, conn)
     conn.close()
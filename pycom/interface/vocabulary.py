@@ -0,0 +1,160 @@
+import json
+import re
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from pycom.interface.connection_pool import SQLiteConnectionPool
+from pycom.interface.query_helper import query_database
+from pycom.selector import ProteinParams
+
+
+def _keyword_query(category: str) -> str:
+    return f"SELECT keywordName as name FROM keyword WHERE keywordCategory = '{category}'"
+
+
+# name -> (query, id column, name column)
+_VOCABULARY_QUERIES = {
+    'disease': ("SELECT diseaseId, diseaseName FROM disease", 'diseaseId', 'diseaseName'),
+    'cofactor': ("SELECT cofactorId, cofactorName FROM cofactor", 'cofactorId', 'cofactorName'),
+    'organism': ("SELECT organismId, nameScientific, nameCommon, taxonomy FROM organism", 'organismId',
+                 'nameScientific'),
+    'biological_process': (_keyword_query('Biological process'), None, 'name'),
+    'cellular_component': (_keyword_query('Cellular component'), None, 'name'),
+    'developmental_stage': (_keyword_query('Developmental stage'), None, 'name'),
+    'domain': (_keyword_query('Domain'), None, 'name'),
+    'ligand': (_keyword_query('Ligand'), None, 'name'),
+    'molecular_function': (_keyword_query('Molecular function'), None, 'name'),
+    'ptm': (_keyword_query('PTM'), None, 'name'),
+}
+
+VOCABULARIES = list(_VOCABULARY_QUERIES)
+
+# param of suggest() -> (vocabulary, name columns)
+_SUGGEST_PARAMS = {
+    ProteinParams.DISEASE: ('disease', ('diseaseName',)),
+    ProteinParams.COFACTOR: ('cofactor', ('cofactorName',)),
+    ProteinParams.ORGANISM: ('organism', ('nameScientific', 'nameCommon')),
+    ProteinParams.BIOLOGICAL_PROCESS: ('biological_process', ('name',)),
+    ProteinParams.CELLULAR_COMPONENT: ('cellular_component', ('name',)),
+    ProteinParams.DEVELOPMENTAL_STAGE: ('developmental_stage', ('name',)),
+    ProteinParams.DOMAIN: ('domain', ('name',)),
+    ProteinParams.LIGAND: ('ligand', ('name',)),
+    ProteinParams.MOLECULAR_FUNCTION: ('molecular_function', ('name',)),
+    ProteinParams.PTM: ('ptm', ('name',)),
+}
+
+_WORD_START = re.compile(r'(?<=[\s\-(/,])\w')
+
+
+class Vocabulary:
+    """
+    The vocabularies of pycom.db (diseases, cofactors, organisms and the keyword categories), which only change
+    with a new release of the database. Each vocabulary is read once, on first use, and kept in memory.
+
+    PyComLocal keeps one Vocabulary per database (reset when the file is modified), get_*_list() and the
+    /api/get-*-list endpoints of the server are served from it.
+
+    Usage:
+        >>> vocabulary = pyc.get_vocabulary()
+        >>> vocabulary.table('disease')
+        >>> vocabulary.id_to_name('disease')['DI-00001']
+        >>> df['disease_id'].astype(vocabulary.dtype('disease', 'diseaseId'))
+        >>> vocabulary.suggest('disease', 'brea')
+
+    Parameters:
+        :param db_path: Path to the PyCom database (pycom.db)
+        :param pool: A pool of read-only connections to the database, if None a new connection is opened per query
+    """
+
+    def __init__(self, db_path: str, pool: Optional[SQLiteConnectionPool] = None):
+        self.db_path = db_path
+        self.pool = pool
+
+        self._tables: Dict[str, pd.DataFrame] = {}
+        self._derived: Dict[tuple, object] = {}  # dictionaries, dtypes and JSON, computed from the tables
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> pd.DataFrame:
+        """Returns the vocabulary as a DataFrame, shared between calls, so it must not be modified"""
+        assert name in _VOCABULARY_QUERIES, f'Unknown vocabulary: {name}, must be one of {VOCABULARIES}'
+        table = self._tables.get(name)
+        if table is None:
+            with self._lock:
+                table = self._tables.get(name)
+                if table is None:
+                    table = self._tables[name] = query_database(_VOCABULARY_QUERIES[name][0], self.db_path,
+                                                                pool=self.pool)
+        return table
+
+    def _get_derived(self, key: tuple, compute):
+        value = self._derived.get(key)
+        if value is None:
+            value = self._derived[key] = compute()
+        return value
+
+    def dtype(self, name: str, column: Optional[str] = None) -> pd.CategoricalDtype:
+        """Returns a categorical dtype with the values of a column of the vocabulary (default: the name column)"""
+        column = column or _VOCABULARY_QUERIES[name][2]
+        return self._get_derived(('dtype', name, column),
+                                 lambda: pd.CategoricalDtype(self.table(name)[column].dropna().unique()))
+
+    def id_to_name(self, name: str) -> dict:
+        """Returns a dictionary of the ids and names of the vocabulary (disease, cofactor or organism)"""
+        _, id_column, name_column = _VOCABULARY_QUERIES[name]
+        assert id_column is not None, f'The {name} vocabulary has no ids'
+        return self._get_derived(('id_to_name', name),
+                                 lambda: dict(zip(self.table(name)[id_column], self.table(name)[name_column])))
+
+    def name_to_id(self, name: str) -> dict:
+        """Returns a dictionary of the names and ids of the vocabulary (disease, cofactor or organism)"""
+        return self._get_derived(('name_to_id', name),
+                                 lambda: {value: key for key, value in self.id_to_name(name).items()})
+
+    def json(self, name: str) -> str:
+        """Returns the vocabulary serialized as a JSON list of records (missing values as null)"""
+        def serialize():
+            table = self.table(name).astype(object)
+            return json.dumps(table.where(table.notna(), None).to_dict(orient='records'))
+        return self._get_derived(('json', name), serialize)
+
+    def suggest(self, param: str, prefix: str, limit: int = 10) -> List[str]:
+        """
+        Returns the names of the vocabulary of a param (e.g. 'disease') that start with prefix (case-insensitive),
+        for type-ahead. Names starting with the prefix come first, followed by names with a later word starting with
+        the prefix (e.g. 'cancer' matches 'Breast cancer'), both in alphabetical order.
+
+        The sorted index of each vocabulary is built on first use, lookups are binary searches.
+
+        :param param: The param of the vocabulary, one of the name params of find() (disease, cofactor, organism,
+                      and the keyword params)
+        :param prefix: The start of the names
+        :param limit: The maximum number of names
+        :return: The matching names
+        """
+        assert param in _SUGGEST_PARAMS, f'Cannot suggest values of {param}, must be one of ' \
+                                         f'{", ".join(x.value for x in _SUGGEST_PARAMS)}'
+        assert limit >= 1, f'limit must be at least 1, not {limit}'
+        names, words = self._get_derived(('suggest', param), lambda: self._suggest_index(*_SUGGEST_PARAMS[param]))
+        prefix = prefix.strip().casefold()
+
+        suggestions = {}
+        for index in (names, words):
+            i = bisect_left(index, (prefix,))
+            while i < len(index) and len(suggestions) < limit and index[i][0].startswith(prefix):
+                suggestions.setdefault(index[i][1])
+                i += 1
+        return list(suggestions)
+
+    def _suggest_index(self, name: str, columns: Tuple[str, ...]) -> Tuple[list, list]:
+        """
+        Returns the sorted (key, name) lists of the names, and of the later words of the names (the key is the
+        casefolded name, or the casefolded rest of the name from the start of the word)
+        """
+        values = {value for column in columns for value in self.table(name)[column].dropna() if value}
+        names = sorted((value.casefold(), value) for value in values)
+        words = sorted((value[match.start():].casefold(), value) for value in values
+                       for match in _WORD_START.finditer(value))
+        return names, words
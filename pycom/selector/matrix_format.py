@@ -1,13 +1,27 @@
 from enum import Enum
 
+import numpy as np
 import pandas as pd
 
+from pycom.util.format_util import pack_triu
+
 
 class MatrixFormat(Enum):
     """
     MatrixFormat is an enum that specifies how the coevolution matrices are returned by the PyCom class.
+
+    MMAP returns read-only numpy views of the memory-mapped copy of pycom.mat (see pycom.tools.export_mmap),
+    which are only read from disk when they are accessed.
+
+    TRIU returns the packed upper triangle of the (symmetric) matrices, including the diagonal, as a 1-dimensional
+    array of L * (L + 1) / 2 values, TRIU_FLOAT32 and TRIU_FLOAT16 also downcast the values.
+    Use pycom.util.format_util.unpack_triu to restore the full matrix.
     """
     NUMPY = lambda x: x
     PANDAS = lambda x: pd.DataFrame(x)
     LIST = lambda x: x.tolist()
     JSON = lambda x: x.tolist()
+    TRIU = lambda x: pack_triu(x)
+    TRIU_FLOAT32 = lambda x: pack_triu(x, dtype=np.float32)
+    TRIU_FLOAT16 = lambda x: pack_triu(x, dtype=np.float16)
+    MMAP = lambda x: x  # marker, matrices are not formatted but mapped by CoevolutionMatrixLoader
@@ -48,8 +48,8 @@ class ProteinParams(str, Enum):
 
 
 descriptions = {
-    ProteinParams.ID: 'The UniProt ID of the protein.',
-    ProteinParams.SEQUENCE: 'The amino acid sequence of protein to search for. (full match)',
+    ProteinParams.ID: 'The UniProt ID of the protein, or a list of UniProt IDs.',
+    ProteinParams.SEQUENCE: 'The amino acid sequence of protein to search for (full match), or a list of sequences.',
     ProteinParams.MIN_LENGTH: 'Minimum number of residues.',
     ProteinParams.MAX_LENGTH: 'Maximum number of residues.',
     ProteinParams.MIN_HELIX: 'Min percentage of helical structure in the protein.',
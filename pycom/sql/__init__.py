@@ -1,3 +1,4 @@
 from .query_builder import PyComSQLQueryBuilder
+from .query_constraints import canonical_constraints, constraints_key
 
-__all__ = ['PyComSQLQueryBuilder']
+__all__ = ['PyComSQLQueryBuilder', 'canonical_constraints', 'constraints_key']
@@ -1,3 +1,6 @@
+import json
+
+from pandas.api.types import is_list_like
 
 organism_constraint = lambda _: '''
     entry.organismId IN (
@@ -7,6 +10,14 @@ organism_constraint = lambda _: '''
     )'''
 
 
+organism_fts_constraint = lambda _: '''
+    entry.organismId IN (
+        SELECT  organism_fts.organismId
+        FROM    sidecar.organism_fts
+        WHERE   organism_fts.taxonomyFull LIKE ?
+    )'''
+
+
 disease_id_constraint = lambda _: '''
     entry.entryId IN (
         SELECT  disease_entry.entryId
@@ -24,11 +35,23 @@ disease_constraint = lambda _: '''
     )'''
 
 
-has_disease_constraint = lambda has_disease: f'''
-    entry.entryId {'NOT' if not has_disease else ''} IN (
+disease_fts_constraint = lambda _: '''
+    entry.entryId IN (
         SELECT  disease_entry.entryId
         FROM    disease_entry
-        WHERE ? OR TRUE
+        WHERE   disease_entry.diseaseId IN (
+            SELECT  disease_fts.diseaseId
+            FROM    sidecar.disease_fts
+            WHERE   disease_fts.diseaseName LIKE ?
+        )
+    )'''
+
+
+has_disease_constraint = lambda has_disease: f'''
+    {'NOT' if not has_disease else ''} EXISTS (
+        SELECT  1
+        FROM    disease_entry
+        WHERE   disease_entry.entryId = entry.entryId
     )'''
 
 cofactor_id_constraint = lambda _: '''
@@ -48,24 +71,86 @@ cofactor_constraint = lambda _: '''
     )'''
 
 
-has_keyword_constraint = lambda _, keyword_category: f'''
+cofactor_fts_constraint = lambda _: '''
     entry.entryId IN (
-        SELECT keyword_entry.entryId
-        FROM keyword_entry
-        WHERE keyword_entry.keywordCategory = '{keyword_category}'
+        SELECT  cofactor_entry.entryId
+        FROM    cofactor_entry
+        WHERE   cofactor_entry.cofactorId IN (
+            SELECT  cofactor_fts.cofactorId
+            FROM    sidecar.cofactor_fts
+            WHERE   cofactor_fts.cofactorName LIKE ?
+        )
     )'''
 
-keyword_constraint = lambda _, keyword_category: f'''
-    entry.entryId IN (
+
+keyword_subquery = lambda _: '''
         SELECT keyword_entry.entryId
         FROM keyword_entry
         WHERE lower(keyword_entry.keywordName) LIKE lower(?)
-        AND keyword_entry.keywordCategory = '{keyword_category}'
+        AND keyword_entry.keywordCategory = ?'''
+
+keyword_fts_subquery = lambda _: '''
+        SELECT keyword_entry.entryId
+        FROM sidecar.keyword_fts
+        JOIN keyword_entry ON keyword_entry.keywordName = keyword_fts.keywordName
+            AND keyword_entry.keywordCategory = keyword_fts.keywordCategory
+        WHERE keyword_fts.keywordName LIKE ?
+        AND keyword_fts.keywordCategory = ?'''
+
+
+def entry_in_subqueries(subqueries: list) -> str:
+    """Generates a constraint selecting the entries returned by all subqueries (INTERSECT)"""
+    intersection = '\n        INTERSECT'.join(subqueries)
+    return f'''
+    entry.entryId IN ({intersection}
     )'''
 
+
+class JsonArray(str):
+    """A list of parameter values, serialized as a JSON array
+
+    The array is bound as a single parameter, and expanded by SQLite with json_each(),
+    so that any number of values can be looked up in one query (no limit on the number of bound parameters)."""
+    pass
+
+
+def to_json_array(arg, convert):
+    """Converts a list of params into a JsonArray, applying the convert function to each value"""
+    return JsonArray(json.dumps([convert(x) for x in arg]))
+
+
+def list_param(arg, convert):
+    """
+    Applies the convert function to a single param, or converts a list of params (list, tuple, set, pandas Series,
+    numpy array, ...) into a JsonArray
+    """
+    if is_list_like(arg) and not isinstance(arg, str):
+        arg = list(arg)
+        assert len(arg) > 0, 'List of values must not be empty'
+        return to_json_array(arg, convert)
+    return convert(arg)
+
+
+def equal_or_in_constraint(arg, column):
+    """Generates an equality constraint for a single param, or an IN constraint for a JsonArray of params"""
+    if isinstance(arg, JsonArray):
+        return f'{column} IN (SELECT value FROM json_each(?))'
+    return f'{column} = ?'
+
+
 _CATH_ENZYME_ERROR = 'CATH/Enzyme class must be in format: 1.2.3.4 or 1.2.*.*'
 
 
+def name_param(arg):
+    """Converts a name param into a case-insensitive substring pattern (LIKE '%name%')"""
+    return f'%{str(arg).strip()}%'.lower()
+
+
+def keyword_param(arg, keyword_category: str) -> list:
+    """Converts a keyword name param into the bound parameters of a keyword subquery (name pattern, category)"""
+    return [name_param(arg), keyword_category]
+
+
 def class_param(arg):
     """Converts a CATH/Enzyme class param into a list of integers
 
@@ -73,7 +158,7 @@ def class_param(arg):
 
     Args:
         arg (str): CATH/Enzyme class param in format (1.2.3.4 or 1.2.*.*))"""
-    split = arg.split('.')
+    split = str(arg).strip().split('.')
 
     assert 1 <= len(split) <= 4, _CATH_ENZYME_ERROR  # must be 1-4
     assert len(split) == 4 or split[-1] == '*', _CATH_ENZYME_ERROR  # last must be * if not 4
@@ -121,10 +206,11 @@ def class_constraint(arg, entry_type):
 
 def to_str(arg, entry, starts_with=None):
     """Returns a string, throws an error if starts_with is specified and the string does not start with it"""
+    arg = str(arg).strip()
     if starts_with is not None:
         assert arg.startswith(starts_with), f'{entry} must follow format: {starts_with}00000'
 
-    return str(arg)
+    return arg
 
 
 def to_int(arg, entry):
@@ -153,7 +239,7 @@ def to_bool(arg, entry):
     if type(arg) == bool:
         return arg
 
-    arg = arg.lower()
+    arg = str(arg).strip().lower()
 
     assert arg in _BOOL_VALUES, f'{entry} must be a boolean [true/false, yes/no, 0/1]'
     return arg in _BOOL_TRUE_VALUES
@@ -1,3 +1,5 @@
+from pycom.selector.selector_params import ProteinParams
+from pycom.sql.constraints_utils import entry_in_subqueries
 from pycom.sql.query_constraints import constraints_template as template
 
 _BASE_QUERY = '''
@@ -10,6 +12,22 @@ WHERE (
 )
 '''
 
+_COUNT_QUERY = '''
+SELECT
+    COUNT(*)
+FROM
+    entry
+WHERE (
+    {constraints}
+)
+'''
+
+# pages are ordered by entryId, so that the same page always contains the same entries
+_PAGINATION = '''ORDER BY
+    entry.entryId
+LIMIT ? OFFSET ?
+'''
+
 _queried_columns_map = {
     'entryId': 'uniprot_id',
     'neff': 'neff',
@@ -24,19 +42,40 @@ _queried_columns_map = {
     'hasSubstrate': 'has_substrate',
 }
 
+# columns of the sidecar database, only available if it is attached (and has the table), not selected by default
+_sidecar_columns_map = {
+    'matrixKey': 'matrix_key',
+}
+
+_column_expressions = {
+    'matrixKey': '(SELECT matrix_key.matrixKey FROM sidecar.matrix_key WHERE matrix_key.entryId = entry.entryId)',
+}
+
+_all_columns_map = {**_queried_columns_map, **_sidecar_columns_map}
+_column_names = {v: k for k, v in _all_columns_map.items()}
+
 
 class PyComSQLQueryBuilder:
     """PyCom SQL Query Builder
     
     This class is used to build a SQL query based on the constraints
-    for the protein database."""
+    for the protein database.
+
+    If text_index is set, name based constraints (disease, cofactor, keywords, organism) are matched
+    through the full-text index of the sidecar database (attached as `sidecar`), instead of LIKE scans.
+
+    If matrix_key is set, the matrix_key column (the key of the coevolution matrix, from the sidecar)
+    can be selected."""
 
     _db_columns = list(_queried_columns_map.keys())
     columns = [x for x in _queried_columns_map.values()]
 
-    def __init__(self):
+    def __init__(self, text_index: bool = False, matrix_key: bool = False):
         # self.columns = ['entry.entryId', 'entry.sequence', 'entry.sequenceLength', 'entry.organismId']
         self.columns = PyComSQLQueryBuilder._db_columns
+        self._all_columns = True  # select all columns, until columns are added with add_column()
+        self.text_index = text_index
+        self.matrix_key = matrix_key
 
         self.constraint_store = []
         self.param_store = []
@@ -46,15 +85,49 @@ class PyComSQLQueryBuilder:
 
         # self.strip_query = False  # Strip whitespace from the query, for debugging purposes
 
+    @staticmethod
+    def column_name(column: str) -> str:
+        """Returns the DataFrame name of a column, given by its DataFrame or database name"""
+        if column in _all_columns_map:
+            return _all_columns_map[column]
+        assert column in _column_names, f'Column {column} is not defined, valid columns are: ' \
+                                        f'{", ".join(_all_columns_map.values())}'
+        return column
+
     def add_column(self, column):
-        raise NotImplementedError
+        """Add a column to the selected columns of the query
+
+        By default, all columns are selected. Once a column is added, only the added columns are selected.
+        The column can be given by its name in the DataFrame (e.g. 'uniprot_id') or in the database (e.g. 'entryId')
+
+        Example:
+            add_column('uniprot_id')
+            add_column('sequence_length')
+        """
+        column = _column_names[PyComSQLQueryBuilder.column_name(column)]
+        assert column not in _sidecar_columns_map or self.matrix_key, \
+            f'Column {_sidecar_columns_map[column]} requires the sidecar database of pycom.db, ' \
+            f'which can be built with pycom.tools.build_sidecar(db_path)'
+
+        if self._all_columns:
+            self.columns = []
+            self._all_columns = False
+
+        if column not in self.columns:
+            self.columns.append(column)
+
+    def add_columns(self, columns: list):
+        """Add multiple columns to the selected columns of the query"""
+        for column in columns:
+            self.add_column(column)
 
     def add_constraint(self, constraint, param):
         """Add a constraint to the query
         
-        The constraint name is a predefined string """
+        The constraint name is a predefined string.
+        The param is a single value, or a list of values for constraints that support it (uniprot_id, sequence)"""
         self.constraint_store.append(constraint)
-        self.param_store.extend(param) if isinstance(param, list) else self.param_store.append(param)
+        self.param_store.append(param)
 
     def add_constraints(self, constraints: dict):
         """Add multiple constraints to the query
@@ -68,32 +141,86 @@ class PyComSQLQueryBuilder:
         for constraint, param in constraints.items():
             self.add_constraint(constraint, param)
 
-    def build(self):
-        """Build the query"""
+    def _build_constraints(self):
+        """Build the WHERE clause of the query, and the parameters it binds
+
+        Planner stage: the constraints are ordered by their cost (cheap entry.* predicates first, then
+        subqueries), and subqueries on the same table (e.g. keywords) are combined into one INTERSECT.
+        The order is deterministic, the same constraints always generate the same query."""
         assert len(self.constraint_store) == len(self.param_store), 'Number of constraints and parameters must be equal'
         query_input = zip(self.constraint_store, self.param_store)
 
-        selector_parts = []
-        params = []
+        planned = []  # (cost, name, constraint_query, params)
+        groups = {}  # group -> [(name, subquery, params)]
 
         for constraint, param in query_input:
             assert constraint in template, f'Selector {constraint} is not defined'
-            param = template[constraint]['param'](param)  # Apply the param function to the param
-            constraint_query = template[constraint]['constraint'](param)
+            constraint_template = template[constraint]
+            name = ProteinParams(constraint).value
+
+            param = constraint_template['param'](param)  # Apply the param function to the param
+            bound = [] if not constraint_template.get('bind', True) else param if isinstance(param, list) else [param]
+
+            if 'group' in constraint_template:
+                subquery = self._select_variant(constraint_template, 'subquery')(param)
+                groups.setdefault(constraint_template['group'], []).append((name, subquery, bound))
+                continue
+
+            constraint_query = self._select_variant(constraint_template, 'constraint')(param)
+            planned.append((constraint_template.get('cost', 0), name, constraint_query, bound))
+
+        for group in groups.values():
+            group.sort(key=lambda x: x[0])
+            cost = min(template[name]['cost'] for name, _, _ in group)
+            constraint_query = entry_in_subqueries([subquery for _, subquery, _ in group])
+            planned.append((cost, group[0][0], constraint_query, [p for _, _, bound in group for p in bound]))
+
+        planned.sort(key=lambda x: (x[0], x[1]))
 
-            selector_parts.append(constraint_query)
-            params.extend(param) if isinstance(param, list) else params.append(param)
+        selector_parts = [constraint_query for _, _, constraint_query, _ in planned]
+        params = [p for _, _, _, bound in planned for p in bound]
 
-        columns = ', '.join(self.columns)
         selector = ' AND '.join(selector_parts if selector_parts else ['1=1'])
 
+        return selector, params
+
+    def _select_variant(self, constraint_template: dict, key: str):
+        """Returns the full-text index variant of a constraint / subquery, if available and enabled"""
+        if self.text_index and f'{key}_fts' in constraint_template:
+            return constraint_template[f'{key}_fts']
+        return constraint_template[key]
+
+    def build(self, page: int = None, per_page: int = None):
+        """Build the query
+
+        If page is set, only the entries of that page are selected (first page is 1), ordered by entryId.
+        The LIMIT / OFFSET is applied by SQLite, so only the rows of the requested page are fetched.
+        """
+        selector, params = self._build_constraints()
+
+        columns = ', '.join(f'{_column_expressions.get(column, f"entry.{column}")} AS {_all_columns_map[column]}'
+                            for column in self.columns)
+
         self.query = _BASE_QUERY.format(columns=columns, constraints=selector)
         # if self.strip_query:
         #     self.query = strip_whitespace(self.query)
 
+        if page is not None:
+            assert per_page is not None and per_page >= 1, f'per_page must be at least 1, not {per_page}'
+            assert page >= 1, f'Pagination starts at 1, not {page}'
+
+            self.query += _PAGINATION
+            params.extend([per_page, (page - 1) * per_page])
+
         self.params = params
 
         return self.query, self.params
 
+    def build_count(self):
+        """Build a query that counts the number of entries matching the constraints"""
+        selector, params = self._build_constraints()
+
+        return _COUNT_QUERY.format(constraints=selector), params
+
 
 __all__ = ['PyComSQLQueryBuilder']
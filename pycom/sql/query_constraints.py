@@ -1,3 +1,5 @@
+import hashlib
+import json
 from functools import partial
 
 from pycom.selector.selector_params import ProteinParams
@@ -7,26 +9,53 @@ from pycom.sql.constraints_utils import *
 
 It both defines the constraint to query mapping and validation
 of the parameters.
+
+Name based constraints also define a 'constraint_fts' query, which is used
+instead of 'constraint' when the full-text index of the sidecar is available.
+
+'indexes' lists the (table, columns) indexes that support the constraint,
+these are created by pycom.tools.build_indexes.
+
+The query builder orders constraints by their 'cost' (cheap entry.* predicates first, default 0).
+Constraints of the same 'group' define a 'subquery' (and 'subquery_fts') selecting entryIds instead of a
+'constraint', the subqueries of a group are combined into a single constraint (INTERSECT).
+'bind': False marks constraints whose param only shapes the query, and is not bound as a parameter.
 """
 
+_SEQUENCE_INDEX = ('entry', ('sequence',))
+_LENGTH_INDEX = ('entry', ('sequenceLength',))
+_HELIX_INDEX = ('entry', ('structHelix',))
+_TURN_INDEX = ('entry', ('structTurn',))
+_STRAND_INDEX = ('entry', ('structStrand',))
+_ORGANISM_INDEX = ('entry', ('organismId',))
+_CATH_INDEX = ('cath_class', ('cath_1', 'cath_2', 'cath_3', 'cath_4', 'entryId'))
+_ENZYME_INDEX = ('enzyme_class', ('enzyme_1', 'enzyme_2', 'enzyme_3', 'enzyme_4', 'entryId'))
+_DISEASE_INDEX = ('disease_entry', ('diseaseId', 'entryId'))
+_HAS_DISEASE_INDEX = ('disease_entry', ('entryId', 'diseaseId'))
+_COFACTOR_INDEX = ('cofactor_entry', ('cofactorId', 'entryId'))
+_KEYWORD_INDEX = ('keyword_entry', ('keywordCategory', 'keywordName', 'entryId'))
+
 _constraints_simple = {
-    ProteinParams.ID: {  # uniprot id
-        'constraint': lambda _: 'entry.entryId = ?',
-        'param': lambda x: str(x),
+    ProteinParams.ID: {  # uniprot id, or list of uniprot ids
+        'constraint': partial(equal_or_in_constraint, column='entry.entryId'),
+        'param': partial(list_param, convert=lambda x: str(x).strip()),
         # 'validate': lambda x: bool(re.match(r'^[\d\w]{6,10}$', x))
     },
-    ProteinParams.SEQUENCE: {  # sequence
-        'constraint': lambda _: 'entry.sequence = ?',
-        'param': lambda x: str(x).upper(),
+    ProteinParams.SEQUENCE: {  # sequence, or list of sequences
+        'constraint': partial(equal_or_in_constraint, column='entry.sequence'),
+        'param': partial(list_param, convert=lambda x: str(x).strip().upper()),
+        'indexes': [_SEQUENCE_INDEX],
         # 'validate': lambda x: bool(re.match(r'^[A-Z]+$', x))
     },
     ProteinParams.MIN_LENGTH: {  # minimum sequence length
         'constraint': lambda _: 'entry.sequenceLength >= ?',
         'param': partial(to_int, entry=ProteinParams.MIN_LENGTH),
+        'indexes': [_LENGTH_INDEX],
     },
     ProteinParams.MAX_LENGTH: {  # maximum sequence length
         'constraint': lambda _: 'entry.sequenceLength <= ?',
         'param': partial(to_int, entry=ProteinParams.MAX_LENGTH),
+        'indexes': [_LENGTH_INDEX],
     },
 }
 
@@ -34,26 +63,32 @@ _constraints_struct = {
     ProteinParams.MIN_HELIX: {  # minimum fraction of protein in helix
         'constraint': lambda _: 'entry.structhelix >= ?',
         'param': partial(to_float, entry=ProteinParams.MIN_HELIX),
+        'indexes': [_HELIX_INDEX],
     },
     ProteinParams.MAX_HELIX: {  # maximum fraction of protein in helix
         'constraint': lambda _: 'entry.structhelix <= ?',
         'param': partial(to_float, entry=ProteinParams.MAX_HELIX),
+        'indexes': [_HELIX_INDEX],
     },
     ProteinParams.MIN_TURN: {  # minimum fraction of protein in turn
         'constraint': lambda _: 'entry.structturn >= ?',
         'param': partial(to_float, entry=ProteinParams.MIN_TURN),
+        'indexes': [_TURN_INDEX],
     },
     ProteinParams.MAX_TURN: {  # maximum fraction of protein in turn
         'constraint': lambda _: 'entry.structturn <= ?',
         'param': partial(to_float, entry=ProteinParams.MAX_TURN),
+        'indexes': [_TURN_INDEX],
     },
     ProteinParams.MIN_STRAND: {  # minimum fraction of protein in strand
         'constraint': lambda _: 'entry.structstrand >= ?',
         'param': partial(to_float, entry=ProteinParams.MIN_STRAND),
+        'indexes': [_STRAND_INDEX],
     },
     ProteinParams.MAX_STRAND: {  # maximum fraction of protein in strand
         'constraint': lambda _: 'entry.structstrand <= ?',
         'param': partial(to_float, entry=ProteinParams.MAX_STRAND),
+        'indexes': [_STRAND_INDEX],
     },
     ProteinParams.HAS_PTM: {  # has post-translational modification
         'constraint': lambda _: 'entry.hasPTM = ?',
@@ -70,6 +105,7 @@ _constraints_struct = {
     ProteinParams.ORGANISM_ID: {  # organism id (NCBI taxonomy id)
         'constraint': lambda _: 'entry.organismId = ?',
         'param': partial(to_int, entry=ProteinParams.ORGANISM_ID),
+        'indexes': [_ORGANISM_INDEX],
     },
 }
 
@@ -77,66 +113,114 @@ _constraints_struct = {
 _constraints_special = {
     ProteinParams.ORGANISM: {  # protein name
         'constraint': organism_constraint,
-        'param': lambda x: f'%{x}%'.lower(),  # add wildcards
+        'constraint_fts': organism_fts_constraint,
+        'param': name_param,  # add wildcards
+        'indexes': [_ORGANISM_INDEX],
+        'cost': 2,
     },
     ProteinParams.CATH: {  # CATH class
         'constraint': partial(class_constraint, entry_type='cath'),
         'param': lambda x: class_param(x),
+        'indexes': [_CATH_INDEX],
+        'cost': 1,
     },
     ProteinParams.ENZYME: {  # Enzyme class
         'constraint': partial(class_constraint, entry_type='enzyme'),
         'param': lambda x: class_param(x),
+        'indexes': [_ENZYME_INDEX],
+        'cost': 1,
     },
     ProteinParams.DISEASE: {  # disease name
         'constraint': disease_constraint,
-        'param': lambda x: f'%{x}%'.lower(),  # add wildcards
+        'constraint_fts': disease_fts_constraint,
+        'param': name_param,  # add wildcards
+        'indexes': [_DISEASE_INDEX],
+        'cost': 2,
     },
     ProteinParams.DISEASE_ID: {  # disease id
         'constraint': disease_id_constraint,
         'param': lambda x: partial(to_str, entry=ProteinParams.DISEASE_ID, starts_with='DI-')(x),
+        'indexes': [_DISEASE_INDEX],
+        'cost': 1,
     },
     ProteinParams.HAS_DISEASE: {  # has disease
         'constraint': has_disease_constraint,
-        'param': partial(to_bool, entry=ProteinParams.HAS_DISEASE)
+        'param': partial(to_bool, entry=ProteinParams.HAS_DISEASE),
+        'indexes': [_HAS_DISEASE_INDEX],
+        'cost': 3,
+        'bind': False,
     },
     ProteinParams.COFACTOR: {  # cofactor name
         'constraint': cofactor_constraint,
-        'param': lambda x: f'%{x}%'.lower(),  # add wildcards
+        'constraint_fts': cofactor_fts_constraint,
+        'param': name_param,  # add wildcards
+        'indexes': [_COFACTOR_INDEX],
+        'cost': 2,
     },
     ProteinParams.COFACTOR_ID: {  # cofactor id
         'constraint': cofactor_id_constraint,
         'param': lambda x: partial(to_str, entry=ProteinParams.COFACTOR_ID, starts_with='CHEBI:')(x),
+        'indexes': [_COFACTOR_INDEX],
+        'cost': 1,
     },
 }
 
 _constraints_keyword_based = {
     ProteinParams.BIOLOGICAL_PROCESS: {  # biological process
-        'constraint': partial(keyword_constraint, keyword_category='Biological process'),
-        'param': lambda x: f'%{x}%'.lower(),  # add wildcards
+        'subquery': keyword_subquery,
+        'subquery_fts': keyword_fts_subquery,
+        'group': 'keyword_entry',
+        'param': partial(keyword_param, keyword_category='Biological process'),  # add wildcards, bind the category
+        'indexes': [_KEYWORD_INDEX],
+        'cost': 2,
     },
     ProteinParams.CELLULAR_COMPONENT: {  # cellular component
-        'constraint': partial(keyword_constraint, keyword_category='Cellular component'),
-        'param': lambda x: f'%{x}%'.lower(),  # add wildcards
+        'subquery': keyword_subquery,
+        'subquery_fts': keyword_fts_subquery,
+        'group': 'keyword_entry',
+        'param': partial(keyword_param, keyword_category='Cellular component'),  # add wildcards, bind the category
+        'indexes': [_KEYWORD_INDEX],
+        'cost': 2,
     },
     ProteinParams.DEVELOPMENTAL_STAGE: {  # developmental stage
-        'constraint': partial(keyword_constraint, keyword_category='Developmental stage'),
-        'param': lambda x: f'%{x}%'.lower(),  # add wildcards
+        'subquery': keyword_subquery,
+        'subquery_fts': keyword_fts_subquery,
+        'group': 'keyword_entry',
+        'param': partial(keyword_param, keyword_category='Developmental stage'),  # add wildcards, bind the category
+        'indexes': [_KEYWORD_INDEX],
+        'cost': 2,
     },
     ProteinParams.DOMAIN: {  # domain
-        'constraint': partial(keyword_constraint, keyword_category='Domain'),
-        'param': lambda x: f'%{x}%'.lower(),  # add wildcards
+        'subquery': keyword_subquery,
+        'subquery_fts': keyword_fts_subquery,
+        'group': 'keyword_entry',
+        'param': partial(keyword_param, keyword_category='Domain'),  # add wildcards, bind the category
+        'indexes': [_KEYWORD_INDEX],
+        'cost': 2,
     },
     ProteinParams.LIGAND: {  # ligand
-        'constraint': partial(keyword_constraint, keyword_category='Ligand'),
-        'param': lambda x: f'%{x}%'.lower(),  # add wildcards
+        'subquery': keyword_subquery,
+        'subquery_fts': keyword_fts_subquery,
+        'group': 'keyword_entry',
+        'param': partial(keyword_param, keyword_category='Ligand'),  # add wildcards, bind the category
+        'indexes': [_KEYWORD_INDEX],
+        'cost': 2,
     },
     ProteinParams.MOLECULAR_FUNCTION: {  # molecular function
-        'constraint': partial(keyword_constraint, keyword_category='Molecular function'),
-        'param': lambda x: f'%{x}%'.lower(),  # add wildcards
+        'subquery': keyword_subquery,
+        'subquery_fts': keyword_fts_subquery,
+        'group': 'keyword_entry',
+        'param': partial(keyword_param, keyword_category='Molecular function'),  # add wildcards, bind the category
+        'indexes': [_KEYWORD_INDEX],
+        'cost': 2,
     },
     ProteinParams.PTM: {  # post-translational modification
-        'constraint': partial(keyword_constraint, keyword_category='PTM'),
-        'param': lambda x: f'%{x}%'.lower(),  # add wildcards
+        'subquery': keyword_subquery,
+        'subquery_fts': keyword_fts_subquery,
+        'group': 'keyword_entry',
+        'param': partial(keyword_param, keyword_category='PTM'),  # add wildcards, bind the category
+        'indexes': [_KEYWORD_INDEX],
+        'cost': 2,
     }
 }
 
@@ -146,3 +230,24 @@ constraints_template = {**_constraints_simple, **_constraints_struct, **_constra
 
 # check that all constraints are implemented
 assert set(constraints_template.keys()) == set(ProteinParams), 'Not all query constraints are implemented'
+
+
+def canonical_constraints(constraint_dict: dict) -> dict:
+    """
+    Returns the canonical form of a constraint dict: string keys in sorted order, with the values normalized by the
+    'param' functions of the template (e.g. {'disease': 'Cancer '} -> {'disease': '%cancer%'}).
+
+    Constraint dicts with the same canonical form select the same proteins.
+    """
+    params = {ProteinParams(key).value: constraints_template[ProteinParams(key)]['param'](value)
+              for key, value in constraint_dict.items()}
+    return dict(sorted(params.items()))
+
+
+def constraints_key(constraint_dict: dict, **options) -> str:
+    """
+    Returns a stable hash of the canonical constraints, and options (e.g. page, per_page, columns) of a query.
+    Used as the cache key of query results, equivalent queries share the same key.
+    """
+    canonical = json.dumps([canonical_constraints(constraint_dict), options], sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
@@ -1,6 +1,8 @@
 # noinspection PyPackageRequirements
 import pytest
 
+from pycom import ProteinParams
+from pycom.sql import canonical_constraints, constraints_key
 from pycom.sql.constraints_utils import class_param
 
 
@@ -33,3 +35,13 @@ def test_cath_param_invalid():
         class_param('test')
     with pytest.raises(AssertionError):
         class_param('t.e.s.t')
+
+
+def test_constraints_key():
+    key = constraints_key({'disease': 'cancer', 'min_length': 100})
+    assert constraints_key({ProteinParams.DISEASE: 'Cancer ', ProteinParams.MIN_LENGTH: '100'}) == key
+    assert constraints_key({'min_length': 100, 'disease': 'CANCER'}) == key
+    assert constraints_key({'disease': 'cancer', 'min_length': 101}) != key
+    assert constraints_key({'disease': 'cancer', 'min_length': 100}, page=2) != key
+
+    assert canonical_constraints({'has_pdb': 'Yes', 'cath': ' 1.2.*'}) == {'cath': [1, 2], 'has_pdb': True}
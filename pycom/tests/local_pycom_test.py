@@ -0,0 +1,627 @@
+# noinspection PyPackageRequirements
+import pytest
+import json
+import os
+import sqlite3
+import threading
+
+import h5py
+import numpy as np
+import pandas as pd
+
+import pycom.interface._find_helper as fh
+from pycom import PyCom, ProteinParams, CoMAnalysis
+from pycom.selector import MatrixFormat
+from pycom.sql import PyComSQLQueryBuilder
+from pycom.tools import benchmark_matrices, build_indexes, build_sidecar, export_mmap, repack_matrices
+from pycom.tools.indexes import is_optimized
+from pycom.util.format_util import md5_hash, pack_triu, unpack_triu
+
+_SCHEMA = '''
+CREATE TABLE entry (entryId TEXT PRIMARY KEY, neff REAL, sequenceLength INTEGER, sequence TEXT, organismId INTEGER,
+                    structHelix REAL, structTurn REAL, structStrand REAL, hasPTM INTEGER, hasPDB INTEGER,
+                    hasSubstrate INTEGER);
+CREATE TABLE organism (organismId INTEGER PRIMARY KEY, nameScientific TEXT, nameCommon TEXT, taxonomy TEXT,
+                       taxonomyFull TEXT);
+CREATE TABLE disease (diseaseId TEXT PRIMARY KEY, diseaseName TEXT);
+CREATE TABLE disease_entry (entryId TEXT, diseaseId TEXT);
+CREATE TABLE cofactor (cofactorId TEXT PRIMARY KEY, cofactorName TEXT);
+CREATE TABLE cofactor_entry (entryId TEXT, cofactorId TEXT);
+CREATE TABLE keyword (keywordId TEXT, keywordName TEXT, keywordCategory TEXT);
+CREATE TABLE keyword_entry (entryId TEXT, keywordName TEXT, keywordCategory TEXT);
+CREATE TABLE cath_class (entryId TEXT, cath_1 INTEGER, cath_2 INTEGER, cath_3 INTEGER, cath_4 INTEGER);
+CREATE TABLE enzyme_class (entryId TEXT, enzyme_1 INTEGER, enzyme_2 INTEGER, enzyme_3 INTEGER, enzyme_4 INTEGER);
+CREATE TABLE experimentPDB (entryId TEXT, pdbId TEXT);
+CREATE TABLE substrate (entryId TEXT, substrateName TEXT);
+'''
+
+_KEYWORDS = [('Biological process', 'Apoptosis'), ('Domain', 'Zinc-finger'), ('PTM', 'Phosphoprotein')]
+
+_N_ENTRIES = 30
+_N_MATRICES = 25  # the last entries have no matrix
+
+
+def _sequence(i):
+    return 'ACDEFGHIKLMNPQRSTVWY'[i % 20] * (10 + i)
+
+
+@pytest.fixture(scope='module')
+def db_path(tmp_path_factory):
+    """Builds a small database, following the schema of pycom.db"""
+    path = str(tmp_path_factory.mktemp('pycom') / 'pycom.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(_SCHEMA)
+    conn.executemany('INSERT INTO organism VALUES (?, ?, ?, ?, ?)', [
+        (9606, 'Homo sapiens', 'Human', ':Eukaryota:Metazoa:Homo:', 'Eukaryota Metazoa Homo sapiens'),
+        (562, 'Escherichia coli', None, ':Bacteria:Proteobacteria:', 'Bacteria Proteobacteria Escherichia coli'),
+    ])
+    conn.executemany('INSERT INTO disease VALUES (?, ?)', [('DI-00001', 'Breast cancer'), ('DI-00002', 'Epilepsy')])
+    conn.executemany('INSERT INTO cofactor VALUES (?, ?)', [('CHEBI:29105', 'Zn(2+)')])
+    conn.executemany('INSERT INTO keyword VALUES (?, ?, ?)',
+                     [(f'KW-{i}', name, category) for i, (category, name) in enumerate(_KEYWORDS)])
+
+    for i in range(_N_ENTRIES):
+        entry_id = f'P{i:05d}'
+        conn.execute('INSERT INTO entry VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     (entry_id, float(i), 10 + i, _sequence(i), 9606 if i % 2 == 0 else 562,
+                      i / _N_ENTRIES, 0.1, 0.2, i % 2, i % 3 == 0, i % 5 == 0))
+        if i % 4 == 0:
+            conn.execute('INSERT INTO disease_entry VALUES (?, ?)', (entry_id, 'DI-00001'))
+        if i % 7 == 0:
+            conn.execute('INSERT INTO disease_entry VALUES (?, ?)', (entry_id, 'DI-00002'))
+        if i % 5 == 0:
+            conn.execute('INSERT INTO cofactor_entry VALUES (?, ?)', (entry_id, 'CHEBI:29105'))
+        for j, (category, name) in enumerate(_KEYWORDS):
+            if (i * (j + 1)) % 3 == 0:
+                conn.execute('INSERT INTO keyword_entry VALUES (?, ?, ?)', (entry_id, name, category))
+        conn.execute('INSERT INTO cath_class VALUES (?, ?, ?, ?, ?)', (entry_id, 1 + i % 3, 10, 5, 20))
+        if i % 3 == 0:
+            conn.execute('INSERT INTO experimentPDB VALUES (?, ?)', (entry_id, f'{i}ABC'))
+
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _matrix(i):
+    n = len(_sequence(i))
+    return np.arange(n * n, dtype=np.float32).reshape(n, n) + i
+
+
+@pytest.fixture(scope='module')
+def mat_path(tmp_path_factory):
+    """Builds a small matrix file, following the layout of pycom.mat"""
+    path = str(tmp_path_factory.mktemp('pycom') / 'pycom.mat')
+    with h5py.File(path, 'w') as f:
+        for i in range(_N_MATRICES):
+            f.create_dataset(md5_hash(_sequence(i)), data=_matrix(i), compression='gzip', chunks=True)
+    return path
+
+
+@pytest.fixture
+def pyc(db_path, mat_path):
+    with PyCom(db_path=db_path, mat_path=mat_path) as pyc:
+        yield pyc
+
+
+def test_init_once(db_path, monkeypatch):
+    import pycom.interface.interface_local as interface_local
+    pools = []
+
+    class CountingPool(interface_local.SQLiteConnectionPool):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            pools.append(self)
+
+    monkeypatch.setattr(interface_local, 'SQLiteConnectionPool', CountingPool)
+    with PyCom(db_path=db_path) as pyc:
+        assert pools == [pyc._pool]
+
+
+def test_find(pyc):
+    assert len(pyc.find({ProteinParams.ID: 'P00001'})) == 1
+    assert len(pyc.find(min_length=30)) == 10
+    assert len(pyc.find(disease='cancer')) == 8
+    assert len(pyc.find(has_disease=False)) == 19
+    assert len(pyc.find(cath='2.*')) == 10
+    assert len(pyc.find(organism='homo', cofactor='zn')) == 3
+
+
+def test_find_reuses_connection(pyc):
+    pyc.find(uniprot_id='P00001')
+    conn = pyc._pool.get_connection()
+    pyc.find(uniprot_id='P00002')
+    pyc.get_disease_list()
+    pyc.get_data_loader().add_diseases(pyc.find(uniprot_id='P00004'))
+    assert pyc._pool.get_connection() is conn
+
+
+def test_data_loader(pyc):
+    loader = pyc.get_data_loader()
+    df = pyc.find(uniprot_id=['P00004', 'P00007', 'P00028', 'P00001'])
+
+    diseases = loader.add_diseases(df)
+    assert diseases.set_index('uniprot_id')['disease_id'].to_dict() == {
+        'P00004': ['DI-00001'], 'P00007': ['DI-00002'], 'P00028': ['DI-00001', 'DI-00002'], 'P00001': np.nan}
+    assert loader.add_cath_class(df.iloc[:1], force_single_entry=True)['cath_class'].tolist() == ['2.10.5.20']
+    assert loader.add_organism_taxonomy(df)['taxonomy'].iloc[0] == ['Eukaryota', 'Metazoa', 'Homo']
+
+    assert len(loader.add_cofactors(df.iloc[:0])) == 0
+
+    long = loader.add_diseases(df, output='long')
+    assert long['uniprot_id'].tolist().count('P00028') == 2 and len(long) == 5
+    categorical = loader.add_diseases(df, output='categorical')
+    assert categorical['disease_id'].dtype == 'category' and set(categorical['disease_id'].cat.categories) == {
+        'DI-00001', 'DI-00002'}
+
+
+def test_data_loader_enrich(pyc):
+    loader = pyc.get_data_loader()
+    df = pyc.find(min_length=0, columns=['uniprot_id'])
+    fields = ['diseases', 'cofactors', 'pdbs', 'cath_class', 'organism_name', 'organism_taxonomy', 'ligand',
+              'molecular_function', 'ptm']
+
+    expected = df
+    for field in fields:
+        expected = getattr(loader, f'add_{field}')(expected)
+
+    enriched = loader.enrich(df, fields)
+    pd.testing.assert_frame_equal(enriched, expected, check_dtype=False)
+
+    single = loader.enrich(df, ['diseases', 'protein_domain'], force_single_entry=True).set_index('uniprot_id')
+    assert len(single) == len(df) and single.loc['P00028', 'disease_id'] == 'DI-00001'
+    assert single.loc['P00003', 'domain'] == 'Zinc-finger' and pd.isna(single.loc['P00001', 'domain'])
+
+
+def test_connection_per_thread(pyc):
+    connections = []
+    thread = threading.Thread(target=lambda: connections.append(pyc._pool.get_connection()))
+    thread.start()
+    thread.join()
+    assert connections[0] is not pyc._pool.get_connection()
+
+
+def test_connections_closed_on_thread_exit(pyc):
+    pyc._pool.get_connection()
+    connections = []
+    for _ in range(50):
+        thread = threading.Thread(target=lambda: connections.append(pyc._pool.get_connection()))
+        thread.start()
+        thread.join()
+
+    assert pyc._pool.open_connections == 1  # only the connection of this thread
+    with pytest.raises(sqlite3.ProgrammingError):
+        connections[0].execute('SELECT 1')
+
+
+def test_reset_keeps_connections_of_other_threads(pyc):
+    connected, reset, done = threading.Event(), threading.Event(), threading.Event()
+    results = []
+
+    def query():
+        conn = pyc._pool.get_connection()
+        connected.set()
+        reset.wait()
+        results.append(conn.execute('SELECT COUNT(*) FROM entry').fetchone()[0])  # still open after reset()
+        results.append(pyc._pool.get_connection() is not conn)  # replaced on the next query
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
+        done.set()
+
+    thread = threading.Thread(target=query)
+    thread.start()
+    connected.wait()
+    pyc._pool.reset()
+    reset.set()
+    thread.join()
+    assert done.is_set() and results == [_N_ENTRIES, True]
+
+
+def test_connections_are_read_only(pyc):
+    with pytest.raises(sqlite3.OperationalError):
+        pyc._pool.get_connection().execute('DELETE FROM entry')
+
+
+def test_close(db_path):
+    with PyCom(db_path=db_path) as pyc:
+        pyc.find(uniprot_id='P00001')
+    assert pyc._pool.closed
+    with pytest.raises(AssertionError):
+        pyc.find(uniprot_id='P00001')
+
+
+def test_lists(pyc):
+    diseases = pyc.get_disease_list()
+    assert type(diseases) == pd.DataFrame
+    assert set(diseases['diseaseId']) == {'DI-00001', 'DI-00002'}
+    assert list(pyc.get_domain_list()['name']) == ['Zinc-finger']
+
+
+def test_find_iter(pyc):
+    chunks = list(pyc.find_iter(max_length=30, chunk_size=7))
+    assert [len(chunk) for chunk in chunks] == [7, 7, 7]
+    assert list(pd.concat(chunks)['uniprot_id']) == list(pyc.find(max_length=30)['uniprot_id'])
+    assert 'matrix' in chunks[0].columns
+    assert list(pyc.find_iter(uniprot_id='none')) == []
+
+
+def test_find_page(pyc):
+    all_results = pyc.find(max_length=30).sort_values('uniprot_id')
+    page = pyc.find(max_length=30, page=2, per_page=8)
+    assert list(page['uniprot_id']) == list(all_results['uniprot_id'][8:16])
+    assert page.attrs['total_results'] == 21
+    assert page.attrs['total_pages'] == 3
+    assert len(pyc.find(max_length=30, page=3, per_page=8)) == 5
+    assert len(pyc.find(max_length=30, page=4, per_page=8)) == 0
+    assert len(pyc.find(per_page=5)) == 5
+
+
+def test_find_columns(pyc):
+    df = pyc.find(max_length=12, columns=['uniprot_id', 'sequence_length', 'neff'])
+    assert list(df.columns) == ['uniprot_id', 'sequence_length', 'neff', 'matrix']
+    assert list(df['sequence_length']) == [10, 11, 12]
+    assert list(pyc.find(uniprot_id='P00001', columns=['hasPDB']).columns) == ['has_pdb', 'matrix']
+    assert list(pyc.find(uniprot_id='P00001').columns)[:-1] == PyComSQLQueryBuilder.columns
+    with pytest.raises(AssertionError):
+        pyc.find(uniprot_id='P00001', columns=['matrix'])
+
+
+def test_find_bulk_lookup(pyc):
+    ids = ['P00012', 'P00003', 'missing', 'P00020', 'P00003']
+    df = pyc.find(uniprot_id=ids)
+    assert list(df['uniprot_id']) == ['P00012', 'P00003', 'P00020']
+
+    df = pyc.find(uniprot_id=ids, columns=['neff'])
+    assert list(df.columns) == ['neff', 'matrix']
+    assert list(df['neff']) == [12.0, 3.0, 20.0]
+
+    df = pyc.find(sequence=[_sequence(5).lower(), _sequence(2)])
+    assert list(df['uniprot_id']) == ['P00005', 'P00002']
+
+    assert list(pyc.find(uniprot_id=pd.Series(ids))['uniprot_id']) == ['P00012', 'P00003', 'P00020']
+    assert list(pyc.find(uniprot_id=np.array(ids))['uniprot_id']) == ['P00012', 'P00003', 'P00020']
+    df = pyc.find(sequence=pd.Series([_sequence(5), _sequence(2)]), page=1, per_page=10)
+    assert set(df['uniprot_id']) == {'P00005', 'P00002'}
+
+    many_ids = [f'P{i:05d}' for i in range(50000)][::-1]
+    assert list(pyc.find(uniprot_id=many_ids)['uniprot_id']) == [f'P{i:05d}' for i in range(_N_ENTRIES)][::-1]
+    assert len(pyc.find(uniprot_id=many_ids, has_disease=True, page=1, per_page=5)) == 5
+
+
+def test_sidecar_text_index(db_path, tmp_path):
+    sidecar = build_sidecar(db_path, out_path=str(tmp_path / 'pycom.sidecar.db'))
+    queries = [{'disease': 'CANCER'}, {'disease': 'ep'}, {'cofactor': 'zn(2+'}, {'organism': 'proteobacteria'},
+               {'domain': 'zinc-finger'}, {'ptm': 'phospho', 'biological_process': 'apop'}, {'domain': 'nothing'}]
+
+    with PyCom(db_path=db_path) as pyc, PyCom(db_path=db_path, sidecar_path=sidecar) as pyc_fts:
+        assert not pyc._text_index and pyc_fts._text_index
+        for query in queries:
+            assert list(pyc.find(query)['uniprot_id']) == list(pyc_fts.find(query)['uniprot_id'])
+
+
+def test_sidecar_stale(db_path, tmp_path):
+    path = str(tmp_path / 'pycom.db')
+    with open(db_path, 'rb') as source, open(path, 'wb') as target:
+        target.write(source.read())
+    sidecar = build_sidecar(path)
+    os.utime(path, ns=(0, 0))  # touched or copied (e.g. cp without -p), the content is unchanged
+
+    with PyCom(db_path=path) as pyc:
+        assert pyc._text_index and pyc.has_matrix_key
+        conn = sqlite3.connect(path)
+        conn.execute("INSERT INTO disease VALUES ('DI-99999', 'Updated disease')")
+        conn.commit()
+        conn.close()
+        with pytest.warns(UserWarning, match='sidecar'):
+            list(pyc.find_iter(disease='updated'))
+        assert not pyc._text_index and not pyc.has_matrix_key
+
+        conn = sqlite3.connect(path)
+        conn.execute("DELETE FROM disease WHERE diseaseId = 'DI-99999'")
+        conn.commit()
+        conn.close()
+        with pytest.warns(UserWarning, match='sidecar'):
+            pyc.explain(disease='updated')
+        assert pyc._db_version == pyc._read_db_version()
+
+    with pytest.warns(UserWarning, match='sidecar'):
+        with PyCom(db_path=path, sidecar_path=sidecar) as pyc:
+            assert not pyc._text_index and not pyc.has_matrix_key
+            assert len(pyc.find(disease='updated')) == 0
+
+
+def test_build_indexes(db_path, tmp_path):
+    optimized_path = build_indexes(db_path, str(tmp_path / 'pycom_optimized.db'))
+
+    with PyCom(db_path=db_path) as pyc, PyCom(db_path=optimized_path) as pyc_optimized:
+        assert not is_optimized(pyc._pool.get_connection())
+        assert is_optimized(pyc_optimized._pool.get_connection())
+        for query in [{'cath': '2.*'}, {'disease_id': 'DI-00001'}, {'domain': 'zinc', 'min_length': 20}]:
+            assert list(pyc.find(query)['uniprot_id']) == list(pyc_optimized.find(query)['uniprot_id'])
+
+    not_analyzed_path = build_indexes(db_path, str(tmp_path / 'pycom_not_analyzed.db'), analyze=False)
+    conn = sqlite3.connect(not_analyzed_path)
+    assert is_optimized(conn)  # the statistics of ANALYZE are optional
+    conn.close()
+
+
+def test_query_planner(pyc):
+    constraints = {'ptm': 'phospho', 'has_disease': False, 'domain': 'zinc', 'min_length': 12}
+    query, params = fh.build_query_from_constraints(**constraints)
+    reversed_query, reversed_params = fh.build_query_from_constraints(**dict(reversed(list(constraints.items()))))
+    assert (query, params) == (reversed_query, reversed_params)
+    assert query.count('INTERSECT') == 1
+    assert params == [12, '%zinc%', 'Domain', '%phospho%', 'PTM']
+
+    expected = set(pyc.find(ptm='phospho')['uniprot_id']) & set(pyc.find(domain='zinc')['uniprot_id']) \
+        & set(pyc.find(has_disease=False)['uniprot_id']) & set(pyc.find(min_length=12)['uniprot_id'])
+    assert set(pyc.find(constraints)['uniprot_id']) == expected
+    assert len(expected) > 0
+
+    plan = pyc.explain(constraints)
+    assert list(plan.columns) == ['id', 'parent', 'detail']
+    assert plan['detail'].str.contains('INTERSECT').any()
+
+
+def test_result_cache(db_path, tmp_path):
+    path = str(tmp_path / 'pycom.db')
+    with open(db_path, 'rb') as source, open(path, 'wb') as target:
+        target.write(source.read())
+
+    with PyCom(db_path=path) as pyc:
+        loader = pyc.get_data_loader()
+        old_connection = pyc._pool.get_connection()
+        df = pyc.find(disease='cancer', page=1, per_page=5)
+        df['matrix'] = 'modified'
+        cached = pyc.find({ProteinParams.DISEASE: 'cancer'}, page=1, per_page=5)
+        assert list(cached['uniprot_id']) == list(df['uniprot_id'])
+        assert cached['matrix'].isna().all()
+        assert cached.attrs['total_results'] == 8
+        assert pyc.cache_info()['hits'] == 1 and pyc.cache_info()['misses'] == 1
+
+        # replacing the database invalidates the cache
+        conn = sqlite3.connect(str(tmp_path / 'updated.db'))
+        conn.execute('ATTACH DATABASE ? AS source', (path,))
+        conn.executescript(_SCHEMA.replace('CREATE TABLE ', 'CREATE TABLE main.'))
+        conn.execute('INSERT INTO main.entry SELECT * FROM source.entry WHERE entryId = ?', ('P00001',))
+        conn.commit()
+        conn.close()
+        os.replace(str(tmp_path / 'updated.db'), path)
+
+        assert len(pyc.find(min_length=0)) == 1
+        assert pyc.cache_info()['entries'] == 1
+        with pytest.raises(sqlite3.ProgrammingError):  # the connections to the replaced file are closed
+            old_connection.execute('SELECT 1')
+        assert pyc._pool.open_connections == 1
+        assert len(loader.add_diseases(df)) == 5 and loader.add_diseases(df)['disease_id'].isna().all()
+
+    with PyCom(db_path=db_path, result_cache_size=1024) as pyc:
+        pyc.find(min_length=0)  # too large for the cache
+        assert pyc.cache_info()['entries'] == 0
+
+    with PyCom(db_path=db_path, result_cache_size=0) as pyc:
+        pyc.find(disease='cancer')
+        assert pyc.cache_info()['entries'] == 0
+
+
+def test_vocabulary(db_path, tmp_path):
+    path = str(tmp_path / 'pycom.db')
+    with open(db_path, 'rb') as source, open(path, 'wb') as target:
+        target.write(source.read())
+
+    with PyCom(db_path=path) as pyc:
+        vocabulary = pyc.get_vocabulary()
+        diseases = pyc.get_disease_list()
+        diseases['diseaseName'] = 'modified'  # callers get copies
+        assert pyc.get_disease_list()['diseaseName'].tolist() == ['Breast cancer', 'Epilepsy']
+        assert pyc.get_vocabulary() is vocabulary and vocabulary.table('disease') is vocabulary.table('disease')
+
+        assert vocabulary.id_to_name('disease')['DI-00002'] == 'Epilepsy'
+        assert vocabulary.name_to_id('cofactor') == {'Zn(2+)': 'CHEBI:29105'}
+        assert set(vocabulary.dtype('organism').categories) == {'Homo sapiens', 'Escherichia coli'}
+        assert {x['nameScientific']: x['nameCommon'] for x in json.loads(vocabulary.json('organism'))} == {
+            'Homo sapiens': 'Human', 'Escherichia coli': None}
+        assert pyc.get_domain_list()['name'].tolist() == ['Zinc-finger']
+
+        # modifying the database resets the vocabulary
+        conn = sqlite3.connect(path)
+        conn.execute('INSERT INTO disease VALUES (?, ?)', ('DI-00003', 'Asthma'))
+        conn.commit()
+        conn.close()
+        assert len(pyc.get_disease_list()) == 3 and pyc.get_vocabulary() is not vocabulary
+
+
+def test_suggest(pyc):
+    assert pyc.suggest(ProteinParams.DISEASE, 'Ep') == ['Epilepsy']
+    assert pyc.suggest('disease', ' CANC ') == ['Breast cancer']  # later words match too
+    assert pyc.suggest('disease', '') == ['Breast cancer', 'Epilepsy']
+    assert pyc.suggest('disease', '', limit=1) == ['Breast cancer']
+    assert pyc.suggest('organism', 'hum') == ['Human'] and pyc.suggest('organism', 'coli') == ['Escherichia coli']
+    assert pyc.suggest('domain', 'finger') == ['Zinc-finger'] and pyc.suggest('ptm', 'x') == []
+
+    with pytest.raises(AssertionError):
+        pyc.suggest('uniprot_id', 'P0')
+
+
+def test_load_matrices_writable(db_path, mat_path):
+    for matrix_cache_size in [0, 256 * 1024 ** 2]:
+        with PyCom(db_path=db_path, mat_path=mat_path, matrix_cache_size=matrix_cache_size) as pyc:
+            df = pyc.find(uniprot_id=['P00010', 'P00011'])
+            for _ in range(2):  # loaded from the file, then from the cache
+                matrix = pyc.load_matrices(df.copy())['matrix'].iloc[0]
+                np.fill_diagonal(matrix, 0)
+                assert pyc.load_matrices(df.copy(), residue_range=(1, 2))['matrix'].iloc[0].flags.writeable
+                assert pyc._get_matrix_loader().load_by_hash(md5_hash(_sequence(10)))[1, 1] == _matrix(10)[1, 1]
+
+
+def test_load_matrices(pyc):
+    df = pyc.load_matrices(pyc.find(max_length=11))
+    assert np.array_equal(df['matrix'].iloc[1], _matrix(1))
+    loader = pyc._matrix_loader
+    handle = loader.mat_db
+
+    df = pyc.load_matrices(pyc.find(uniprot_id=['P00029', 'P00003']), mat_format=MatrixFormat.LIST)
+    assert df['matrix'].iloc[0] is None
+    assert df['matrix'].iloc[1] == _matrix(3).tolist()
+    assert pyc._matrix_loader is loader and loader.mat_db is handle
+
+    ids = ['P00007', 'P00002', 'P00029', 'P00007']
+    matrices = loader.load_many([_sequence(int(i[1:])) for i in ids])
+    assert [m is None for m in matrices] == [False, False, True, False]
+    assert np.array_equal(matrices[0], _matrix(7)) and np.array_equal(matrices[1], _matrix(2))
+    assert matrices[3] is matrices[0]
+
+    loader._pid = -1  # as if inherited by a forked process
+    assert loader.mat_db is not handle
+    pyc.close()
+    assert loader._mat_db is None
+
+
+def test_load_matrices_workers(pyc):
+    df = pyc.find(max_length=40)
+    expected = pyc.load_matrices(df.copy())['matrix']
+    loaded = pyc.load_matrices(df, workers=2)['matrix']
+    assert all(a is None and b is None or np.array_equal(a, b) for a, b in zip(expected, loaded))
+    assert loaded.notna().sum() == _N_MATRICES
+
+
+def test_load_matrices_workers_fallback(pyc, monkeypatch):
+    from concurrent.futures.process import BrokenProcessPool
+    loader = pyc._get_matrix_loader()
+
+    def broken(*_):
+        raise BrokenProcessPool('A child process terminated abruptly')
+
+    monkeypatch.setattr(loader, '_load_parallel', broken)
+    df = pyc.find(max_length=40)
+    with pytest.warns(UserWarning, match='__main__'):
+        loaded = pyc.load_matrices(df, workers=2)['matrix']
+    assert loaded.notna().sum() == _N_MATRICES and loader._executor_failed
+
+
+def test_load_matrices_mmap(db_path, mat_path, tmp_path):
+    mmap_path = export_mmap(mat_path, out_path=str(tmp_path / 'pycom.mmap'))
+
+    with PyCom(db_path=db_path, mat_path=mat_path, mmap_path=mmap_path) as pyc:
+        df = pyc.load_matrices(pyc.find(uniprot_id=['P00004', 'P00029', 'P00011']), mat_format=MatrixFormat.MMAP)
+        assert df['matrix'].iloc[1] is None
+        matrix = df['matrix'].iloc[2]
+        assert isinstance(matrix, np.memmap) and not matrix.flags.writeable
+        assert np.array_equal(matrix, _matrix(11)) and np.array_equal(df['matrix'].iloc[0], _matrix(4))
+
+    with PyCom(db_path=db_path, mat_path=mat_path) as pyc, pytest.raises(AssertionError):
+        pyc.load_matrices(pyc.find(uniprot_id='P00004'), mat_format=MatrixFormat.MMAP)
+
+
+def test_load_matrices_lazy(pyc):
+    df = pyc.load_matrices(pyc.find(min_length=0), max_load=10, lazy=True)
+    assert df['matrix'].iloc[_N_MATRICES] is None
+    proxy = df['matrix'].iloc[3]
+    assert not proxy.loaded and proxy.shape == _matrix(3).shape
+    assert np.array_equal(np.asarray(proxy), _matrix(3)) and not proxy.loaded
+
+    assert np.array_equal(proxy.load(), _matrix(3)) and proxy.loaded
+    proxy.release()
+    assert not proxy.loaded
+
+    packed = pyc.load_matrices(df.iloc[3:4].copy(), mat_format=MatrixFormat.TRIU, lazy=True)['matrix'].iloc[0]
+    assert np.array_equal(np.asarray(packed), pack_triu(_matrix(3)))
+
+    scaled = CoMAnalysis.scale_and_normalise_coevolution_matrices(df.iloc[:_N_MATRICES].copy())
+    assert scaled['matrix_N'].iloc[0].shape == _matrix(0).shape
+
+
+def test_matrix_cache(db_path, mat_path):
+    with PyCom(db_path=db_path, mat_path=mat_path, matrix_cache_size=_matrix(12).nbytes * 2) as pyc:
+        df = pyc.find(uniprot_id=['P00010', 'P00011', 'P00012'])
+        first = pyc.load_matrices(df.copy())['matrix']
+        assert pyc.matrix_cache_info()['misses'] == 3
+        assert pyc.matrix_cache_info()['evictions'] == 1  # P00010 was evicted
+
+        second = pyc.load_matrices(df.copy())['matrix']
+        assert second.iloc[2] is not first.iloc[2] and second.iloc[2].flags.writeable  # copies of the cached matrix
+        assert np.array_equal(second.iloc[0], _matrix(10))
+        assert pyc.matrix_cache_info()['hits'] == 2
+
+        second.iloc[2][:] = 0
+        assert np.array_equal(pyc.load_matrices(df.copy())['matrix'].iloc[2], _matrix(12))
+
+    with PyCom(db_path=db_path, mat_path=mat_path, matrix_cache_size=0) as pyc:
+        pyc.load_matrices(pyc.find(uniprot_id='P00010'))
+        assert pyc.matrix_cache_info()['entries'] == 0
+
+
+def test_matrix_key(db_path, mat_path, tmp_path):
+    sidecar = build_sidecar(db_path, out_path=str(tmp_path / 'pycom.sidecar.db'), text_index=False)
+
+    with PyCom(db_path=db_path, mat_path=mat_path, sidecar_path=sidecar) as pyc:
+        assert pyc.has_matrix_key and not pyc._text_index
+        df = pyc.find(uniprot_id=['P00005', 'P00029'], columns=['uniprot_id', 'matrix_key'])
+        assert list(df['matrix_key']) == [md5_hash(_sequence(5)), md5_hash(_sequence(29))]
+        assert 'matrix_key' not in pyc.find(uniprot_id='P00005').columns
+
+        df = pyc.load_matrices(df)
+        assert np.array_equal(df['matrix'].iloc[0], _matrix(5)) and df['matrix'].iloc[1] is None
+
+    with PyCom(db_path=db_path) as pyc, pytest.raises(AssertionError):
+        pyc.find(uniprot_id='P00005', columns=['matrix_key'])
+
+
+def test_load_matrices_triu(pyc):
+    df = pyc.find(uniprot_id=['P00002', 'P00003'])
+    symmetric = [(_matrix(i) + _matrix(i).T) / 2 for i in (2, 3)]
+
+    packed = pyc.load_matrices(df.copy(), mat_format=MatrixFormat.TRIU_FLOAT16)['matrix']
+    n = len(_sequence(2))
+    assert packed.iloc[0].shape == (n * (n + 1) // 2,) and packed.iloc[0].dtype == np.float16
+    assert np.array_equal(unpack_triu(pack_triu(symmetric[1])), symmetric[1])
+
+    full = df.copy()
+    full['matrix'] = symmetric
+    df['matrix'] = [pack_triu(m) for m in symmetric]
+    expected = CoMAnalysis.scale_and_normalise_coevolution_matrices(full)['matrix_N']
+    scaled = CoMAnalysis.scale_and_normalise_coevolution_matrices(df)['matrix_N']
+    assert all(np.allclose(a, b) for a, b in zip(expected, scaled))
+
+
+def test_repack_matrices(db_path, mat_path, tmp_path):
+    repacked = repack_matrices(mat_path, str(tmp_path / 'pycom_repacked.mat'), compression='gzip',
+                               chunk_bytes=256, shard_prefix=1)
+
+    with PyCom(db_path=db_path, mat_path=repacked) as pyc:
+        df = pyc.load_matrices(pyc.find(uniprot_id=['P00020', 'P00029', 'P00003']))
+        assert np.array_equal(df['matrix'].iloc[0], _matrix(20)) and df['matrix'].iloc[1] is None
+        assert pyc._matrix_loader._shard_prefix == 1 and len(pyc._matrix_loader._offsets) == _N_MATRICES
+
+    benchmark = benchmark_matrices(mat_path, repacked, n=5, repeat=1)
+    assert list(benchmark['mat_path']) == [mat_path, repacked] and (benchmark['matrices'] == 5).all()
+
+    mmap_path = export_mmap(repacked, out_path=str(tmp_path / 'pycom.mmap'))
+    with PyCom(db_path=db_path, mat_path=repacked, mmap_path=mmap_path) as pyc:
+        df = pyc.load_matrices(pyc.find(uniprot_id='P00020'), mat_format=MatrixFormat.MMAP)
+        assert np.array_equal(df['matrix'].iloc[0], _matrix(20))
+
+
+def test_load_matrices_residue_range(db_path, mat_path, tmp_path):
+    with PyCom(db_path=db_path, mat_path=mat_path, mmap_path=export_mmap(mat_path, str(tmp_path / 'pycom.mmap'))) \
+            as pyc:
+        df = pyc.find(uniprot_id=['P00010', 'P00011', 'P00012'])
+        for kwargs in [{}, {'workers': 2}, {'mat_format': MatrixFormat.MMAP}]:
+            windows = pyc.load_matrices(df.copy(), residue_range=(2, 5), **kwargs)['matrix']
+            assert np.array_equal(windows.iloc[1], _matrix(11)[1:5, 1:5])
+
+        ranges = [(3, 10 ** 6), None, (10 ** 6, 10 ** 6)]
+        windows = pyc.load_matrices(df.copy(), residue_range=ranges)['matrix']
+        assert np.array_equal(windows.iloc[0], _matrix(10)[2:, 2:]) and windows.iloc[0].shape[0] > 0
+        assert np.array_equal(windows.iloc[1], _matrix(11)) and windows.iloc[2].shape == (0, 0)
+
+        # sub-matrices of cached matrices are sliced from the cache
+        hits = pyc.matrix_cache_info()['hits']
+        assert np.array_equal(pyc.load_matrices(df.copy(), residue_range=(1, 2))['matrix'].iloc[1], _matrix(11)[:2, :2])
+        assert pyc.matrix_cache_info()['hits'] == hits + 1
+
+        proxy = pyc.load_matrices(df.copy(), lazy=True, residue_range=(2, 5))['matrix'].iloc[2]
+        assert proxy.shape == (4, 4) and np.array_equal(np.asarray(proxy), _matrix(12)[1:5, 1:5])
+
+        with pytest.raises(AssertionError):
+            pyc.load_matrices(df.copy(), residue_range=(5, 2))
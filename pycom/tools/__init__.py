@@ -0,0 +1,6 @@
+from .indexes import build_indexes
+from .matrices import benchmark_matrices, export_mmap, mmap_path, repack_matrices
+from .sidecar import build_sidecar, sidecar_path
+
+__all__ = ['benchmark_matrices', 'build_indexes', 'build_sidecar', 'export_mmap', 'mmap_path', 'repack_matrices',
+           'sidecar_path']
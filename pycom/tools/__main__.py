@@ -0,0 +1,68 @@
+import argparse
+
+from pycom.tools import benchmark_matrices, build_indexes, build_sidecar, export_mmap, repack_matrices
+
+"""Command line interface of the PyCom tools
+
+Usage:
+    python -m pycom.tools build-indexes pycom.db pycom_optimized.db
+    python -m pycom.tools build-sidecar pycom.db
+    python -m pycom.tools export-mmap pycom.mat
+    python -m pycom.tools repack-matrices pycom.mat pycom_repacked.mat --compression lz4
+    python -m pycom.tools benchmark-matrices pycom.mat pycom_repacked.mat
+"""
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m pycom.tools', description='Tools for the PyCom database files')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    indexes = commands.add_parser('build-indexes', help='write an optimized (indexed and analyzed) copy of pycom.db')
+    indexes.add_argument('db_path', help='path to pycom.db')
+    indexes.add_argument('out_path', help='path of the optimized copy')
+    indexes.add_argument('--no-analyze', action='store_true', help='skip collecting query planner statistics')
+
+    sidecar = commands.add_parser('build-sidecar', help='build the sidecar database (full-text index) of pycom.db')
+    sidecar.add_argument('db_path', help='path to pycom.db')
+    sidecar.add_argument('--out-path', default=None, help='path of the sidecar (default: next to pycom.db)')
+
+    mmap = commands.add_parser('export-mmap', help='write the uncompressed, memory-mappable copy of pycom.mat')
+    mmap.add_argument('mat_path', help='path to pycom.mat')
+    mmap.add_argument('--out-path', default=None, help='path of the copy (default: next to pycom.mat)')
+
+    repack = commands.add_parser('repack-matrices', help='rewrite pycom.mat with a layout optimized for reading')
+    repack.add_argument('mat_path', help='path to pycom.mat')
+    repack.add_argument('out_path', help='path of the repacked file')
+    repack.add_argument('--compression', default='gzip', choices=['gzip', 'lzf', 'lz4', 'blosc', 'none'],
+                        help='compression filter, lz4 and blosc require hdf5plugin (default: gzip)')
+    repack.add_argument('--compression-level', type=int, default=None, help='compression level (gzip / blosc)')
+    repack.add_argument('--no-shuffle', action='store_true', help='do not apply the byte shuffle filter')
+    repack.add_argument('--chunk-bytes', type=int, default=64 * 1024, help='size of the chunks (default: 64 KiB)')
+    repack.add_argument('--shard-prefix', type=int, default=2,
+                        help='number of characters of the md5 hash the datasets are grouped by (default: 2)')
+    repack.add_argument('--dtype', default=None, help='convert the matrices, e.g. float16 (default: keep)')
+
+    benchmark = commands.add_parser('benchmark-matrices', help='compare the load times of matrix files')
+    benchmark.add_argument('mat_paths', nargs='+', help='paths of the matrix files (with the same matrices)')
+    benchmark.add_argument('-n', type=int, default=200, help='number of matrices to load (default: 200)')
+    benchmark.add_argument('--repeat', type=int, default=3, help='number of runs (default: 3)')
+
+    args = parser.parse_args(args)
+
+    if args.command == 'build-indexes':
+        print(build_indexes(args.db_path, args.out_path, analyze=not args.no_analyze))
+    elif args.command == 'build-sidecar':
+        print(build_sidecar(args.db_path, out_path=args.out_path))
+    elif args.command == 'export-mmap':
+        print(export_mmap(args.mat_path, out_path=args.out_path))
+    elif args.command == 'repack-matrices':
+        print(repack_matrices(args.mat_path, args.out_path,
+                              compression=None if args.compression == 'none' else args.compression,
+                              compression_level=args.compression_level, shuffle=not args.no_shuffle,
+                              chunk_bytes=args.chunk_bytes, shard_prefix=args.shard_prefix, dtype=args.dtype))
+    elif args.command == 'benchmark-matrices':
+        print(benchmark_matrices(*args.mat_paths, n=args.n, repeat=args.repeat).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import os
+import sqlite3
+from typing import List, Tuple
+
+from pycom.sql.query_constraints import constraints_template as template
+
+"""Indexes of pycom.db, matched to the constraints of the query builder.
+
+The downloaded pycom.db has no indexes on the columns that find() filters on, so most constraints scan whole tables.
+build_indexes writes an optimized copy of the database, with covering indexes for every constraint template,
+and indexes for looking up annotations by entryId (used by PyComDataLoader).
+"""
+
+# annotation lookups by entryId, used when adding data to a DataFrame of entries
+_ANNOTATION_INDEXES = [
+    ('disease_entry', ('entryId', 'diseaseId')),
+    ('cofactor_entry', ('entryId', 'cofactorId')),
+    ('keyword_entry', ('entryId', 'keywordCategory', 'keywordName')),
+    ('cath_class', ('entryId',)),
+    ('enzyme_class', ('entryId',)),
+    ('experimentPDB', ('entryId',)),
+    ('substrate', ('entryId',)),
+]
+
+
+def _index_name(table: str, columns: Tuple[str, ...]) -> str:
+    return f'ix_pycom_{table}_{"_".join(columns)}'
+
+
+def required_indexes() -> List[Tuple[str, str, Tuple[str, ...]]]:
+    """Returns the (name, table, columns) of all indexes of an optimized pycom.db"""
+    indexes = {}
+    for constraint in template.values():
+        for table, columns in constraint.get('indexes', []):
+            indexes[_index_name(table, columns)] = (table, columns)
+    for table, columns in _ANNOTATION_INDEXES:
+        indexes[_index_name(table, columns)] = (table, columns)
+
+    return [(name, table, columns) for name, (table, columns) in indexes.items()]
+
+
+def build_indexes(db_path: str, out_path: str, analyze: bool = True) -> str:
+    """
+    Writes an optimized copy of pycom.db, with indexes supporting the constraints of find().
+
+    The copy has to be written once (it takes a while, and needs disk space for the database and its indexes),
+    afterwards it can be used in place of pycom.db.
+
+    Usage:
+        >>> from pycom.tools import build_indexes
+        >>> build_indexes('/path/on/disk/pycom.db', '/path/on/disk/pycom_optimized.db')
+        >>> pyc = PyCom(db_path='/path/on/disk/pycom_optimized.db')
+
+    Or from the command line:
+        python -m pycom.tools build-indexes /path/on/disk/pycom.db /path/on/disk/pycom_optimized.db
+
+    :param db_path: Path to the PyCom database (pycom.db)
+    :param out_path: Path of the optimized copy
+    :param analyze: Whether to collect statistics for the query planner (ANALYZE), recommended
+    :return: The path of the optimized copy
+    """
+    db_path = os.path.expanduser(db_path)
+    out_path = os.path.expanduser(out_path)
+    assert os.path.abspath(db_path) != os.path.abspath(out_path), 'The optimized copy cannot overwrite the database'
+    assert not os.path.exists(out_path), f'{out_path} already exists'
+
+    source = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    target = sqlite3.connect(out_path)
+    try:
+        source.backup(target)
+
+        for name, table, columns in required_indexes():
+            target.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})')
+        target.commit()
+
+        if analyze:
+            target.execute('ANALYZE')
+            target.commit()
+    finally:
+        source.close()
+        target.close()
+
+    return out_path
+
+
+def is_optimized(conn: sqlite3.Connection) -> bool:
+    """
+    Returns whether the database of the connection has all indexes of build_indexes. Planner statistics (ANALYZE)
+    are not required, they can be skipped with build_indexes(..., analyze=False).
+    """
+    indexes = {row[0] for row in conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'index'")}
+    return all(name in indexes for name, _, _ in required_indexes())
@@ -0,0 +1,291 @@
+import os
+import random
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+import h5py
+import numpy as np
+import pandas as pd
+
+"""Companion files of the coevolution matrix file (pycom.mat)
+
+pycom.mat stores every matrix as a compressed HDF5 dataset, so each load decompresses the whole matrix into a new
+array. export_mmap writes the matrices once, uncompressed, into a flat file (pycom.mmap), with an index of the
+position of each matrix (pycom.mmap.npz). The flat file is memory-mapped by CoevolutionMatrixLoader
+(MatrixFormat.MMAP), matrices are then read-only views that the OS pages in when they are accessed.
+
+repack_matrices rewrites pycom.mat with a layout optimized for reading: configurable compression, chunks of rows
+(so that row slices only decompress the chunks they need), datasets sharded into groups by the prefix of their md5
+hash (instead of one root group with every dataset), and an embedded index of the position of each dataset.
+CoevolutionMatrixLoader reads both layouts.
+"""
+
+# attributes of the root group of a repacked file
+_LAYOUT_ATTR = 'pycom_layout'
+_SHARD_PREFIX_ATTR = 'pycom_shard_prefix'
+
+# embedded index of a repacked file: md5 (sorted) and the byte offset of the first chunk of each dataset
+_INDEX_DATASET = '_pycom_index'
+_INDEX_DTYPE = np.dtype([('md5', 'S32'), ('offset', '<u8')])
+
+_COMPRESSIONS = ('gzip', 'lzf', 'lz4', 'blosc', None)
+
+
+def mmap_path(mat_path: str) -> str:
+    """Returns the default location of the memory-mapped companion of a matrix file (pycom.mat -> pycom.mmap)"""
+    return f'{os.path.splitext(mat_path)[0]}.mmap'
+
+
+def mmap_index_path(path: str) -> str:
+    """Returns the location of the index of a memory-mapped matrix file (pycom.mmap -> pycom.mmap.npz)"""
+    return f'{path}.npz'
+
+
+def export_mmap(mat_path: str, out_path: Optional[str] = None) -> str:
+    """
+    Writes the uncompressed, memory-mappable copy of pycom.mat (and its index).
+
+    The copy is picked up automatically by PyComLocal, if it is stored at the default location next to pycom.mat.
+    It takes as much disk space as all matrices uncompressed.
+
+    Usage:
+        >>> from pycom.tools import export_mmap
+        >>> export_mmap('/path/on/disk/pycom.mat')
+        >>> pyc = PyCom(db_path='/path/on/disk/pycom.db', mat_path='/path/on/disk/pycom.mat')
+        >>> pyc.load_matrices(df, mat_format=MatrixFormat.MMAP)
+
+    Or from the command line:
+        python -m pycom.tools export-mmap /path/on/disk/pycom.mat
+
+    :param mat_path: Path to the coevolution matrix file (pycom.mat)
+    :param out_path: Path of the memory-mapped copy (default: pycom.mmap, next to pycom.mat)
+    :return: The path of the memory-mapped copy
+    """
+    mat_path = os.path.expanduser(mat_path)
+    out_path = mmap_path(mat_path) if out_path is None else os.path.expanduser(out_path)
+    assert os.path.abspath(mat_path) != os.path.abspath(out_path), 'The copy cannot overwrite the matrix file'
+
+    with h5py.File(mat_path, 'r') as mat_db:
+        shard_prefix = read_shard_prefix(mat_db)
+        keys = sorted(iter_matrix_keys(mat_db))
+        dtypes = {mat_db[dataset_path(key, shard_prefix)].dtype for key in keys}
+        assert len(dtypes) <= 1, f'All matrices must have the same dtype, found {dtypes}'
+        dtype = dtypes.pop() if dtypes else np.dtype(np.float32)
+
+        offsets = np.zeros(len(keys), dtype=np.uint64)
+        shapes = np.zeros((len(keys), 2), dtype=np.uint32)
+        with open(out_path, 'wb') as out:
+            offset = 0
+            for i, key in enumerate(keys):
+                matrix = mat_db[dataset_path(key, shard_prefix)][:]
+                assert matrix.ndim == 2, f'{key} is not a matrix'
+                offsets[i] = offset
+                shapes[i] = matrix.shape
+                out.write(np.ascontiguousarray(matrix).tobytes())
+                offset += matrix.size
+
+    np.savez(mmap_index_path(out_path), md5=np.array(keys, dtype='S32'), offset=offsets, shape=shapes,
+             dtype=np.array(dtype.str))
+
+    return out_path
+
+
+def read_mmap_index(path: str) -> Tuple[np.dtype, Dict[str, Tuple[int, Tuple[int, int]]]]:
+    """Returns the dtype and the index {md5: (offset, shape)} of a memory-mapped matrix file, offsets in elements"""
+    with np.load(mmap_index_path(path)) as index:
+        dtype = np.dtype(str(index['dtype']))
+        entries = {md5.decode(): (int(offset), (int(rows), int(cols)))
+                   for md5, offset, (rows, cols) in zip(index['md5'], index['offset'], index['shape'])}
+    return dtype, entries
+
+
+def read_shard_prefix(mat_db: h5py.File) -> int:
+    """Returns the length of the md5 prefix the datasets of a matrix file are sharded by (0: not sharded)"""
+    return int(mat_db.attrs.get(_SHARD_PREFIX_ATTR, 0))
+
+
+def dataset_path(md5: str, shard_prefix: int = 0) -> str:
+    """Returns the path of the dataset of a matrix, in a file sharded by shard_prefix characters of the md5 hash"""
+    return md5 if shard_prefix == 0 else f'{md5[:shard_prefix]}/{md5}'
+
+
+def iter_matrix_keys(mat_db: h5py.File) -> Iterator[str]:
+    """Yields the keys (md5 hashes) of all matrices of a matrix file"""
+    if read_shard_prefix(mat_db) == 0:
+        yield from (key for key in mat_db.keys() if key != _INDEX_DATASET)
+    else:
+        for group in mat_db.values():
+            if isinstance(group, h5py.Group):
+                yield from group.keys()
+
+
+def read_offset_index(mat_db: h5py.File) -> Optional[Dict[str, int]]:
+    """Returns the embedded index {md5: byte offset} of a repacked matrix file, or None if it has no index"""
+    if _INDEX_DATASET not in mat_db:
+        return None
+    index = mat_db[_INDEX_DATASET][:]
+    return dict(zip((md5.decode() for md5 in index['md5']), index['offset'].tolist()))
+
+
+def dataset_offset(dataset: h5py.Dataset) -> Optional[int]:
+    """Returns the byte offset of the (first chunk of the) dataset in the file, None if it is unknown or empty"""
+    try:
+        if dataset.chunks is None:
+            return dataset.id.get_offset()
+        if dataset.id.get_num_chunks() > 0:
+            return dataset.id.get_chunk_info(0).byte_offset
+    except AttributeError:  # chunk queries require HDF5 >= 1.10.5
+        pass
+    return None
+
+
+def _compression_options(compression: Optional[str], level: Optional[int], shuffle: bool) -> dict:
+    """Returns the h5py create_dataset options of a compression, lz4 and blosc require hdf5plugin"""
+    assert compression in _COMPRESSIONS, f'compression must be one of {_COMPRESSIONS}, not {compression}'
+
+    if compression in ('lz4', 'blosc'):
+        try:
+            import hdf5plugin
+        except ImportError:
+            raise ImportError(f'{compression} compression requires hdf5plugin (pip install hdf5plugin)')
+
+        if compression == 'lz4':
+            return {**hdf5plugin.LZ4(), 'shuffle': shuffle}
+        blosc_shuffle = hdf5plugin.Blosc.SHUFFLE if shuffle else hdf5plugin.Blosc.NOSHUFFLE
+        return hdf5plugin.Blosc(cname='lz4', clevel=5 if level is None else level, shuffle=blosc_shuffle)
+
+    if compression == 'gzip':
+        return {'compression': 'gzip', 'compression_opts': 4 if level is None else level, 'shuffle': shuffle}
+    if compression == 'lzf':
+        return {'compression': 'lzf', 'shuffle': shuffle}
+    return {}
+
+
+def _row_chunks(shape: Tuple[int, int], itemsize: int, chunk_bytes: int) -> Optional[Tuple[int, int]]:
+    """Returns chunks of whole rows of (about) chunk_bytes, for row slices of the matrix"""
+    rows, cols = shape
+    if rows == 0 or cols == 0:
+        return None
+    chunk_rows = max(1, min(rows, chunk_bytes // max(1, cols * itemsize)))
+    return chunk_rows, cols
+
+
+def repack_matrices(
+        mat_path: str,
+        out_path: str,
+        compression: Optional[str] = 'gzip',
+        compression_level: Optional[int] = None,
+        shuffle: bool = True,
+        chunk_bytes: int = 64 * 1024,
+        shard_prefix: int = 2,
+        dtype=None,
+) -> str:
+    """
+    Rewrites pycom.mat with a layout optimized for reading.
+
+    - compression: gzip (level 0-9, default 4), lzf, or lz4 / blosc (faster to decompress, require hdf5plugin,
+      which also has to be installed to read the file), or None
+    - chunks of whole rows, of about chunk_bytes, so that reading a slice of rows only decompresses its chunks
+    - datasets are sharded into groups by the first shard_prefix characters of their md5 hash, and written in the
+      order of their hash
+    - an embedded index of the byte offset of each dataset, used to read many matrices in on-disk order
+
+    The repacked file can be used in place of pycom.mat.
+
+    Usage:
+        >>> from pycom.tools import repack_matrices, benchmark_matrices
+        >>> repack_matrices('/path/on/disk/pycom.mat', '/path/on/disk/pycom_repacked.mat', compression='lz4')
+        >>> print(benchmark_matrices('/path/on/disk/pycom.mat', '/path/on/disk/pycom_repacked.mat'))
+
+    Or from the command line:
+        python -m pycom.tools repack-matrices /path/on/disk/pycom.mat /path/on/disk/pycom_repacked.mat
+
+    :param mat_path: Path to the coevolution matrix file (pycom.mat)
+    :param out_path: Path of the repacked file
+    :param compression: The compression filter (gzip, lzf, lz4, blosc or None)
+    :param compression_level: The compression level (gzip: 0-9, blosc: 0-9)
+    :param shuffle: Whether to apply the byte shuffle filter before compression (better compression of floats)
+    :param chunk_bytes: The (approximate) size of each chunk, in bytes
+    :param shard_prefix: The number of characters of the md5 hash the datasets are sharded by (0: not sharded)
+    :param dtype: Convert the matrices to dtype, e.g. np.float16 (default: keep the dtype)
+    :return: The path of the repacked file
+    """
+    mat_path = os.path.expanduser(mat_path)
+    out_path = os.path.expanduser(out_path)
+    assert os.path.abspath(mat_path) != os.path.abspath(out_path), 'The repacked file cannot overwrite pycom.mat'
+    assert not os.path.exists(out_path), f'{out_path} already exists'
+    assert 0 <= shard_prefix <= 4, f'shard_prefix must be between 0 and 4, not {shard_prefix}'
+    options = _compression_options(compression, compression_level, shuffle)
+
+    with h5py.File(mat_path, 'r') as source, h5py.File(out_path, 'w') as target:
+        source_prefix = read_shard_prefix(source)
+        keys = sorted(iter_matrix_keys(source))
+
+        for key in keys:
+            matrix = source[dataset_path(key, source_prefix)][:]
+            if dtype is not None:
+                matrix = matrix.astype(dtype)
+            chunks = _row_chunks(matrix.shape, matrix.itemsize, chunk_bytes) if matrix.ndim == 2 else True
+            target.create_dataset(dataset_path(key, shard_prefix), data=matrix, chunks=chunks,
+                                  **(options if chunks is not None else {}))
+
+        target.flush()
+        index = np.zeros(len(keys), dtype=_INDEX_DTYPE)
+        for i, key in enumerate(keys):
+            offset = dataset_offset(target[dataset_path(key, shard_prefix)])
+            index[i] = (key, 0 if offset is None else offset)
+        target.create_dataset(_INDEX_DATASET, data=index)
+
+        target.attrs[_LAYOUT_ATTR] = 'repacked'
+        target.attrs[_SHARD_PREFIX_ATTR] = shard_prefix
+
+    return out_path
+
+
+def benchmark_matrices(*mat_paths: str, n: int = 200, repeat: int = 3, seed: int = 0) -> pd.DataFrame:
+    """
+    Compares the latency of loading matrices from different matrix files (e.g. pycom.mat and its repacked copy).
+
+    The same n random matrices are loaded from each file, one by one (random access), and all at once (load_many),
+    without the matrix cache. The best time of repeat runs is reported.
+
+    :param mat_paths: Paths of the matrix files, which must contain the same matrices
+    :param n: The number of matrices to load
+    :param repeat: The number of runs
+    :param seed: The seed of the random sample of matrices
+    :return: A pandas DataFrame with the file size, and the per-matrix and bulk load times of each file
+    """
+    # imported here, the loader itself reads the layouts of this module
+    from pycom.interface.matrix_loader import CoevolutionMatrixLoader
+
+    with h5py.File(os.path.expanduser(mat_paths[0]), 'r') as mat_db:
+        keys = sorted(iter_matrix_keys(mat_db))
+    keys = random.Random(seed).sample(keys, min(n, len(keys)))
+
+    results = []
+    for mat_path in mat_paths:
+        mat_path = os.path.expanduser(mat_path)
+        single, bulk = [], []
+        for _ in range(repeat):
+            with CoevolutionMatrixLoader(mat_path, cache_size=0) as cml:
+                cml.mat_db  # noqa, open the file before timing
+                start = time.perf_counter()
+                for key in keys:
+                    cml.load_by_hash(key)
+                single.append(time.perf_counter() - start)
+
+            with CoevolutionMatrixLoader(mat_path, cache_size=0) as cml:
+                cml.mat_db  # noqa
+                start = time.perf_counter()
+                cml.load_many_by_hash(keys)
+                bulk.append(time.perf_counter() - start)
+
+        results.append({
+            'mat_path': mat_path,
+            'size_mb': os.path.getsize(mat_path) / 1024 ** 2,
+            'matrices': len(keys),
+            'per_matrix_ms': min(single) / max(1, len(keys)) * 1000,
+            'bulk_s': min(bulk),
+        })
+
+    return pd.DataFrame(results)
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import sqlite3
+from typing import Optional
+from warnings import warn
+
+from pycom.util.format_util import md5_hash
+
+"""The sidecar is a small SQLite database, built once from pycom.db, that holds additional indexes.
+
+It is stored next to pycom.db (pycom.sidecar.db) and attached to the pooled connections of PyComLocal
+as `sidecar`. The query builder uses the sidecar when it is present, and falls back to pycom.db otherwise.
+The sidecar records the identity of the database it was built from (a hash of the SQLite file header, which
+changes with every write to the database, but not when the file is copied or touched), a sidecar that does not
+match the database (e.g. after an update of pycom.db) is not used.
+"""
+
+SIDECAR_ALIAS = 'sidecar'
+
+_INFO_TABLE = 'pycom_sidecar'
+_SQLITE_HEADER_SIZE = 100
+
+# trigram tokenizer: supports substring (LIKE '%term%') matches through the index, case-insensitive
+_TEXT_INDEX_TABLES = {
+    'disease_fts': (
+        "CREATE VIRTUAL TABLE disease_fts USING fts5(diseaseId UNINDEXED, diseaseName, tokenize='trigram')",
+        'SELECT diseaseId, diseaseName FROM source.disease',
+    ),
+    'cofactor_fts': (
+        "CREATE VIRTUAL TABLE cofactor_fts USING fts5(cofactorId UNINDEXED, cofactorName, tokenize='trigram')",
+        'SELECT cofactorId, cofactorName FROM source.cofactor',
+    ),
+    'keyword_fts': (
+        "CREATE VIRTUAL TABLE keyword_fts USING fts5(keywordName, keywordCategory UNINDEXED, tokenize='trigram')",
+        'SELECT DISTINCT keywordName, keywordCategory FROM source.keyword_entry',
+    ),
+    'organism_fts': (
+        "CREATE VIRTUAL TABLE organism_fts USING fts5(organismId UNINDEXED, taxonomyFull, tokenize='trigram')",
+        'SELECT organismId, taxonomyFull FROM source.organism',
+    ),
+}
+
+# md5 hash of the sequence of each entry, the name of its dataset in pycom.mat
+_MATRIX_KEY_TABLE = (
+    'CREATE TABLE matrix_key (entryId TEXT PRIMARY KEY, matrixKey TEXT) WITHOUT ROWID',
+    'SELECT entryId, md5(sequence) FROM source.entry',
+)
+
+
+def sidecar_path(db_path: str) -> str:
+    """Returns the default location of the sidecar of a database (pycom.db -> pycom.sidecar.db)"""
+    return f'{os.path.splitext(db_path)[0]}.sidecar.db'
+
+
+def build_sidecar(
+        db_path: str,
+        out_path: Optional[str] = None,
+        text_index: bool = True,
+        matrix_key: bool = True,
+) -> str:
+    """
+    Builds the sidecar database of pycom.db.
+
+    The sidecar is picked up automatically by PyComLocal, if it is stored at the default location next to pycom.db.
+
+    Usage:
+        >>> from pycom.tools import build_sidecar
+        >>> build_sidecar('/path/on/disk/pycom.db')
+
+    :param db_path: Path to the PyCom database (pycom.db)
+    :param out_path: Path of the sidecar database (default: pycom.sidecar.db, next to pycom.db)
+    :param text_index: Whether to build the full-text (FTS5 trigram) index of disease, cofactor, keyword and
+                       organism names, used by the name based constraints of find()
+    :param matrix_key: Whether to store the key of the coevolution matrix of each entry (md5 hash of the sequence),
+                       which can be selected with find(columns=['matrix_key']), and used by load_matrices()
+    :return: The path of the sidecar database
+    """
+    db_path = os.path.expanduser(db_path)
+    out_path = sidecar_path(db_path) if out_path is None else os.path.expanduser(out_path)
+    assert os.path.abspath(db_path) != os.path.abspath(out_path), 'The sidecar cannot overwrite the database'
+
+    conn = sqlite3.connect(f'file:{out_path}', uri=True)
+    try:
+        conn.execute('ATTACH DATABASE ? AS source', (f'file:{db_path}?mode=ro',))
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {_INFO_TABLE} (key TEXT PRIMARY KEY, value TEXT)')
+        conn.execute(f"INSERT OR REPLACE INTO {_INFO_TABLE} VALUES ('source', ?)", (_source_identity(db_path),))
+
+        if text_index:
+            _build_text_index(conn)
+        if matrix_key:
+            _build_matrix_key(conn)
+
+        conn.commit()
+        conn.execute('DETACH DATABASE source')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+    return out_path
+
+
+def _source_identity(db_path: str) -> str:
+    """
+    Returns the identity of the database the sidecar is built from: the md5 hash of the SQLite header (file change
+    counter, number of pages, schema cookie, ...), which only depends on the content of the database
+    """
+    with open(db_path, 'rb') as f:
+        return hashlib.md5(f.read(_SQLITE_HEADER_SIZE)).hexdigest()
+
+
+def _build_text_index(conn: sqlite3.Connection):
+    for table, (create_query, source_query) in _TEXT_INDEX_TABLES.items():
+        conn.execute(f'DROP TABLE IF EXISTS {table}')
+        conn.execute(create_query)
+        conn.execute(f'INSERT INTO {table} {source_query}')
+        conn.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+
+    conn.execute(f"INSERT OR REPLACE INTO {_INFO_TABLE} VALUES ('text_index', '1')")
+
+
+def _build_matrix_key(conn: sqlite3.Connection):
+    create_query, source_query = _MATRIX_KEY_TABLE
+    conn.create_function('md5', 1, md5_hash, deterministic=True)
+    conn.execute('DROP TABLE IF EXISTS matrix_key')
+    conn.execute(create_query)
+    conn.execute(f'INSERT INTO matrix_key {source_query}')
+
+    conn.execute(f"INSERT OR REPLACE INTO {_INFO_TABLE} VALUES ('matrix_key', '1')")
+
+
+def read_sidecar_info(conn: sqlite3.Connection, db_path: Optional[str] = None) -> dict:
+    """
+    Returns the features of the sidecar attached to the connection (e.g. {'text_index': '1', 'matrix_key': '1'}),
+    or an empty dict if no sidecar is attached, or it cannot be used with this version of SQLite.
+
+    If db_path is set, a sidecar that was not built from this version of the database is not used (a warning is
+    shown and an empty dict is returned), its indexes would return wrong results.
+    """
+    try:
+        info = dict(conn.execute(f'SELECT key, value FROM {SIDECAR_ALIAS}.{_INFO_TABLE}').fetchall())
+        if 'text_index' in info:  # fails if SQLite is compiled without FTS5, or without the trigram tokenizer
+            conn.execute(f"SELECT 1 FROM {SIDECAR_ALIAS}.disease_fts WHERE diseaseName LIKE 'xyz' LIMIT 1")
+    except sqlite3.Error:
+        return {}
+
+    if db_path is not None and info.get('source') != _source_identity(db_path):
+        warn(f'The sidecar database was not built from the current version of {db_path} and is not used. '
+             f'It can be rebuilt with pycom.tools.build_sidecar(db_path), or `python -m pycom.tools build-sidecar`.')
+        return {}
+    return info
@@ -1,3 +1,4 @@
 from . import format_util
+from . import lru_cache
 
-__all__ = ['format_util']
+__all__ = ['format_util', 'lru_cache']
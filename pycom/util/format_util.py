@@ -69,3 +69,44 @@ def embed_in_larger_matrix(m: np.ndarray, length: int, offset: int = 0, value: i
     out = np.full((length, length), value)
     out[offset:offset + m.shape[0], offset:offset + m.shape[1]] = m
     return out
+
+
+def pack_triu(m: np.ndarray, dtype=None) -> np.ndarray:
+    """
+    Packs a symmetric matrix into its upper triangle (including the diagonal), row by row
+
+    The packed array has L * (L + 1) / 2 values instead of L * L, unpack_triu restores the full matrix.
+    A 1-dimensional array is assumed to be packed already, and is only converted to dtype.
+
+    :param m: symmetric matrix (L x L)
+    :param dtype: dtype of the packed array, e.g. np.float16 to halve its size again (default: dtype of m)
+    """
+    m = np.asarray(m)
+    if m.ndim == 1:
+        return m if dtype is None else m.astype(dtype)
+    assert m.ndim == 2 and m.shape[0] == m.shape[1], 'Matrix must be square'
+    packed = m[np.triu_indices(m.shape[0])]
+    return packed if dtype is None else packed.astype(dtype)
+
+
+def triu_size(packed_length: int) -> int:
+    """Returns the size L of the matrix, given the length of its packed upper triangle L * (L + 1) / 2"""
+    size = int((np.sqrt(8 * packed_length + 1) - 1) / 2)
+    assert size * (size + 1) // 2 == packed_length, f'{packed_length} is not the length of a packed upper triangle'
+    return size
+
+
+def unpack_triu(packed: np.ndarray, dtype=None) -> np.ndarray:
+    """
+    Unpacks the upper triangle of a symmetric matrix (from pack_triu) into the full matrix
+
+    :param packed: packed upper triangle, row by row, including the diagonal
+    :param dtype: dtype of the matrix (default: dtype of packed)
+    """
+    packed = np.asarray(packed)
+    size = triu_size(len(packed))
+    m = np.empty((size, size), dtype=packed.dtype if dtype is None else dtype)
+    rows, cols = np.triu_indices(size)
+    m[rows, cols] = packed
+    m[cols, rows] = packed
+    return m
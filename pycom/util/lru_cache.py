@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class ByteLRUCache:
+    """
+    A thread-safe least-recently-used cache, bounded by the total size of its values in bytes (not number of entries).
+
+    The size of each value is passed to put(), when the cache is full, the least recently used entries are evicted.
+    Values larger than the whole cache are not stored.
+
+    Usage:
+        >>> cache = ByteLRUCache(max_bytes=64 * 1024 ** 2)
+        >>> cache.put('key', value, size=value.nbytes)
+        >>> cache.get('key')
+        >>> cache.info()
+        {'hits': 1, 'misses': 0, 'evictions': 0, 'entries': 1, 'size_bytes': ..., 'max_bytes': 67108864}
+
+    Parameters:
+        :param max_bytes: The maximum total size of the cached values, in bytes (0 disables the cache)
+    """
+
+    def __init__(self, max_bytes: int):
+        assert max_bytes >= 0, f'max_bytes must be at least 0, not {max_bytes}'
+        self.max_bytes = max_bytes
+
+        self._entries: OrderedDict = OrderedDict()  # key -> (value, size)
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the cached value of key (and marks it as recently used), or default if it is not cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int) -> bool:
+        """Caches value under key, evicting least recently used entries if needed. Returns whether it was cached"""
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+
+            while self._entries and self._size + size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+            self._entries[key] = (value, size)
+            self._size += size
+            return True
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """Removes key from the cache, and returns its value (None if it was not cached)"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._size -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        """Removes all entries (the hit / miss statistics are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def info(self) -> dict:
+        """Returns the statistics of the cache"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
@@ -11,8 +11,8 @@ from flask_caching import Cache
 from flask_parameter_validation import ValidateParameters, Query
 
 from pycom import PyCom, ProteinParams
-from pycom.interface import _find_helper  # noqa
 from pycom.selector import MatrixFormat
+from pycom.sql import constraints_key
 from pycom.sql.constraints_utils import to_bool, to_int
 
 config = {
@@ -26,9 +26,9 @@ app.config.from_mapping(config)
 app.json.sort_keys = False
 app.json.compact = False
 
-# set up caching
+# set up caching, results of /api/find (without matrices) are cached on the canonical form of the constraints
+# (see constraints_key)
 cache = Cache(app)
-_find_helper.query_db = cache.memoize(cache_none=True)(_find_helper.query_db)
 
 pycom_db_path = os.environ.get('PYCOM_DB_PATH', '~/docs/pycom.db')
 pycom_mat_path = os.environ.get('PYCOM_MAT_PATH', '~/docs/pycom.mat')
@@ -118,7 +118,7 @@ def find(
         # developmental_stage, domain, ligand, molecular_function, ptm
 
         # Output parameters:
-        # matrix, page, per_page
+        # matrix, packed, page, per_page, columns
         page: int = Query(1),
         per_page: int = Query(default=10, min_int=1, max_int=100)
 ):
@@ -132,8 +132,12 @@ def find(
 
     # parse parameters
     load_matrices = to_bool(data.pop('matrix', False), entry='matrix parameter')
+    packed = to_bool(data.pop('packed', False), entry='packed parameter')
     page = to_int(data.pop('page', page), entry='page parameter')
     per_page = to_int(data.pop('per_page', per_page), entry='per_page parameter')
+    columns = data.pop('columns', None)
+    if isinstance(columns, str):  # comma separated list, when passed as query parameter
+        columns = [column.strip() for column in columns.split(',') if column.strip()]
 
     # validate that no invalid parameters are passed
     invalid_params = set(data) - valid_protein_params
@@ -144,24 +148,22 @@ def find(
 
     # Request validated, now build the response #
 
-    entries = pyc.find(data)  # find entries matching the constraints
-    selection = pyc.paginate(entries, page=page, per_page=per_page)
-
     if load_matrices:
-        selection = pyc.load_matrices(selection, mat_format=MatrixFormat.JSON)
+        # payloads with matrices are not cached (the cache is bounded by entries, not bytes), the query results and
+        # matrices are served from the byte-bounded caches of PyCom (see PyCom.cache_info, PyCom.matrix_cache_info)
+        payload = _find_payload(data, page, per_page, columns, load_matrices, packed)
     else:
-        selection = selection.drop(columns=['matrix'])
+        # equivalent queries (e.g. disease=Cancer and disease=cancer) share the same cache key
+        cache_key = 'find/' + constraints_key(data, page=page, per_page=per_page, columns=columns)
+        payload = cache.get(cache_key)
+        if payload is None:
+            payload = _find_payload(data, page, per_page, columns, load_matrices, packed)
+            cache.set(cache_key, payload)
 
     if load_matrices:
         app.json.compact = True
 
-    response = flask.jsonify({
-        'results': selection.to_dict(orient='records'),
-        'page': page,
-        'total_pages': len(entries) // per_page + 1,
-        'result_count': len(entries),
-        'showing': f'{(page - 1) * per_page + 1}-{min(page * per_page, len(entries))}'
-    })
+    response = flask.jsonify(payload)
 
     if load_matrices:
         app.json.compact = False
@@ -169,6 +171,62 @@ def find(
     return response
 
 
+def _packed_json(matrix):
+    # always float32, float16 would not make the JSON smaller (clients downcast with MatrixFormat.TRIU_FLOAT16)
+    return MatrixFormat.TRIU_FLOAT32(matrix).tolist()
+
+
+def _find_payload(data: dict, page: int, per_page: int, columns, load_matrices: bool, packed: bool) -> dict:
+    """Runs the query of /api/find and builds the response body, packed matrices are sent as float32 upper triangles"""
+    # the matrix key (or the sequence, without the sidecar) is needed to load the matrices,
+    # it is dropped afterwards if not requested
+    key_column = 'matrix_key' if pyc.has_matrix_key else 'sequence'
+    query_columns = columns
+    if load_matrices and columns is not None and key_column not in columns:
+        query_columns = columns + [key_column]
+
+    # find entries matching the constraints, only the requested page is fetched from the database
+    selection = pyc.find(data, page=page, per_page=per_page, columns=query_columns)
+    result_count = selection.attrs['total_results']
+
+    if load_matrices:
+        mat_format = _packed_json if packed else MatrixFormat.JSON
+        selection = pyc.load_matrices(selection, mat_format=mat_format)
+        if query_columns is not columns:
+            selection = selection.drop(columns=[key_column])
+    else:
+        selection = selection.drop(columns=['matrix'])
+
+    return {
+        'results': selection.to_dict(orient='records'),
+        'page': page,
+        'total_pages': result_count // per_page + 1,
+        'result_count': result_count,
+        'showing': f'{(page - 1) * per_page + 1}-{min(page * per_page, result_count)}'
+    }
+
+
+def _vocabulary_response(name: str) -> flask.Response:
+    """The vocabularies are cached by PyCom (until pycom.db changes), and serialized to JSON once"""
+    return flask.Response(pyc.get_vocabulary().json(name), mimetype='application/json')
+
+
+@app.route('/api/suggest', methods=['GET'])
+@ValidateParameters()
+def suggest(
+        param: str = Query(),
+        prefix: str = Query(default=''),
+        limit: int = Query(default=10, min_int=1, max_int=100)
+):
+    """
+    Get the names of a vocabulary (e.g. diseases) starting with a prefix, for type-ahead.
+    Not logged, as it is called on every keystroke.
+
+    :return: list of names
+    """
+    return flask.jsonify(pyc.suggest(param, prefix, limit=limit))
+
+
 @app.route('/api/get-disease-list', methods=['GET'])
 def get_disease_list():
     """
@@ -176,8 +234,7 @@ def get_disease_list():
 
     :return: list of diseases
     """
-    diseases = pyc.get_disease_list()
-    return flask.jsonify(diseases.to_dict(orient='records'))
+    return _vocabulary_response('disease')
 
 
 @app.route('/api/get-cofactor-list', methods=['GET'])
@@ -187,8 +244,7 @@ def get_cofactor_list():
 
     :return: list of cofactors
     """
-    cofactors = pyc.get_cofactor_list()
-    return flask.jsonify(cofactors.to_dict(orient='records'))
+    return _vocabulary_response('cofactor')
 
 
 @app.route('/api/get-organism-list', methods=['GET'])
@@ -198,8 +254,7 @@ def get_organism_list():
 
     :return: list of organisms
     """
-    organisms = pyc.get_organism_list()
-    return flask.jsonify(organisms.to_dict(orient='records'))
+    return _vocabulary_response('organism')
 
 
 @app.route('/api/get-biological-process-list', methods=['GET'])
@@ -209,8 +264,7 @@ def get_biological_process_list():
 
     :return: list of biological processes
     """
-    biological_processes = pyc.get_biological_process_list()
-    return flask.jsonify(biological_processes.to_dict(orient='records'))
+    return _vocabulary_response('biological_process')
 
 
 @app.route('/api/get-cellular-component-list', methods=['GET'])
@@ -220,8 +274,7 @@ def get_cellular_component_list():
 
     :return: list of cellular components
     """
-    cellular_components = pyc.get_cellular_component_list()
-    return flask.jsonify(cellular_components.to_dict(orient='records'))
+    return _vocabulary_response('cellular_component')
 
 
 @app.route('/api/get-development-stage-list', methods=['GET'])
@@ -231,8 +284,7 @@ def get_development_stage_list():
 
     :return: list of development stages
     """
-    development_stages = pyc.get_developmental_stage_list()
-    return flask.jsonify(development_stages.to_dict(orient='records'))
+    return _vocabulary_response('developmental_stage')
 
 
 @app.route('/api/get-domain-list', methods=['GET'])
@@ -242,8 +294,7 @@ def get_domain_list():
 
     :return: list of domains
     """
-    domains = pyc.get_domain_list()
-    return flask.jsonify(domains.to_dict(orient='records'))
+    return _vocabulary_response('domain')
 
 
 @app.route('/api/get-ligand-list', methods=['GET'])
@@ -253,8 +304,7 @@ def get_ligand_list():
 
     :return: list of ligands
     """
-    ligands = pyc.get_ligand_list()
-    return flask.jsonify(ligands.to_dict(orient='records'))
+    return _vocabulary_response('ligand')
 
 
 @app.route('/api/get-molecular-function-list', methods=['GET'])
@@ -264,8 +314,7 @@ def get_molecular_function_list():
 
     :return: list of molecular functions
     """
-    molecular_functions = pyc.get_molecular_function_list()
-    return flask.jsonify(molecular_functions.to_dict(orient='records'))
+    return _vocabulary_response('molecular_function')
 
 
 @app.route('/api/get-ptm-list', methods=['GET'])
@@ -275,8 +324,7 @@ def get_ptm_list():
 
     :return: list of PTMs
     """
-    ptms = pyc.get_ptm_list()
-    return flask.jsonify(ptms.to_dict(orient='records'))
+    return _vocabulary_response('ptm')
 
 
 @app.errorhandler(AssertionError)
@@ -12,6 +12,7 @@ extras_require = {
     'requests': ['Requests'],
     'logomaker': ['logomaker'],
     'matplotlib': ['matplotlib'],
+    'hdf5plugin': ['hdf5plugin'],
 }
 
 setup(